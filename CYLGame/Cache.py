@@ -0,0 +1,156 @@
+import logging
+import os
+import pickle
+import threading
+from multiprocessing.managers import BaseManager
+
+from cachetools import LRUCache, TTLCache
+
+from .Database import write_atomic
+from .Utils import call_in_thread, hash_string
+
+log = logging.getLogger(__name__)
+
+
+class SharedStore(object):
+    """A LRU cache of bytes which evicts entries after `ttl` seconds. This lives in a manager process so that every
+    server worker sees the same entries.
+    """
+
+    def __init__(self, maxsize, ttl):
+        self.cache = TTLCache(maxsize, ttl)
+
+    def get(self, key):
+        return self.cache.get(key)
+
+    def pop(self, key):
+        return self.cache.pop(key, None)
+
+    def set(self, key, value):
+        self.cache[key] = value
+
+    def size(self):
+        return len(self.cache)
+
+
+class SharedStoreManager(BaseManager):
+    pass
+
+
+SharedStoreManager.register("SharedStore", SharedStore)
+
+
+class SharedCache(object):
+    """A cache of pickled objects which is shared by processes forked after it is created. Objects are stored in a
+    `SharedStore` in a manager process which is reached over a local socket.
+
+    Objects which can't be pickled aren't cached, and if the manager process can't be reached the cache acts as if it
+    is empty, so a cache miss is always safe. The calls to the manager process are made with `call_in_thread`.
+    """
+
+    def __init__(self, maxsize, ttl):
+        self.manager = SharedStoreManager()
+        self.manager.start()
+        self.store = self.manager.SharedStore(maxsize, ttl)
+
+    def shutdown(self):
+        self.manager.shutdown()
+
+    def pop(self, key, default=None):
+        try:
+            data = call_in_thread(self.store.pop, key)
+        except (EOFError, OSError):
+            return default
+        return default if data is None else pickle.loads(data)
+
+    def get(self, key, default=None):
+        try:
+            data = call_in_thread(self.store.get, key)
+        except (EOFError, OSError):
+            return default
+        return default if data is None else pickle.loads(data)
+
+    def __setitem__(self, key, value):
+        try:
+            data = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        except (pickle.PicklingError, TypeError, AttributeError):
+            log.warning("Unable to pickle a %s for the shared cache.", type(value).__name__, exc_info=True)
+            return
+        try:
+            call_in_thread(self.store.set, key, data)
+        except (EOFError, OSError):
+            pass
+
+    def __len__(self):
+        try:
+            return call_in_thread(self.store.size)
+        except (EOFError, OSError):
+            return 0
+
+
+class CompiledCache(object):
+    """A LRU cache of compiled programs keyed by language and the hash of their code. When `path` is set the programs
+    are also pickled there, so a restarted process can load them instead of compiling them again.
+
+    Only the compiled program is cached. The options, token and name of a bot belong to the `Prog` which wraps it, so
+    one compiled program can be shared by many bots.
+    """
+
+    # Bump the version when the pickled programs can't be loaded by the new code.
+    VERSION = 1
+
+    def __init__(self, maxsize=256, path=None):
+        self.cache = LRUCache(maxsize)
+        self.path = None
+        self.lock = threading.Lock()
+        if path is not None:
+            self.set_path(path)
+
+    def set_path(self, path):
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+
+    def __file(self, key):
+        return os.path.join(self.path, "{}-{}-{}.pickle".format(self.VERSION, *key))
+
+    def __load(self, key):
+        if self.path is None:
+            return None
+        try:
+            with open(self.__file(key), "rb") as fp:
+                return pickle.load(fp)
+        except Exception:
+            # Missing, broken or from another version of the compiler. It is replaced once the code is compiled again.
+            return None
+
+    def __dump(self, key, prog):
+        if self.path is None:
+            return
+        try:
+            write_atomic(self.__file(key), pickle.dumps(prog, protocol=pickle.HIGHEST_PROTOCOL))
+        except (pickle.PicklingError, TypeError, AttributeError, OSError):
+            pass
+
+    def compile(self, language, code, compile_func):
+        """Returns the compiled program for `code`, calling `compile_func(code)` if it isn't cached. Code which doesn't
+        compile isn't cached so the error is raised every time.
+        """
+        key = (language, hash_string(code))
+        with self.lock:
+            prog = self.cache.get(key)
+        if prog is None:
+            prog = self.__load(key)
+            if prog is None:
+                prog = compile_func(code)
+                self.__dump(key, prog)
+            with self.lock:
+                self.cache[key] = prog
+        return prog
+
+    def clear(self):
+        with self.lock:
+            self.cache.clear()
+
+
+# The compiled programs of this process. The server sets its path so they are kept on disk.
+compiled_cache = CompiledCache()
@@ -9,10 +9,17 @@ from itertools import islice
 from multiprocessing import Event, Pool, Process
 from random import choice, randint, shuffle
 
-from CYLGame.Utils import OnlineMean, choose
+from CYLGame.Utils import OnlineMean, choose, hash_code
 
-from .Game import GameRunner
-from .Player import Room
+from .Cache import compiled_cache
+from .Game import GameLanguage, GameRunner
+from .Player import LittlePythonProg, Room
+
+
+def compile_prog(compiler, code, options, token=None, name=None, code_hash=None):
+    """Returns a bot running `code`. Bots with the same code share the compiled program from `compiled_cache`."""
+    prog = compiled_cache.compile(GameLanguage.LITTLEPY, code, compiler.compile)
+    return LittlePythonProg(prog, options=options, token=token, name=name, code_hash=code_hash)
 
 
 def create_room(gamedb, bot, compiler, size):
@@ -31,9 +38,7 @@ def create_room(gamedb, bot, compiler, size):
         token = choice(pool)
         code, options = gamedb.get_active_code_and_options(token)
         try:
-            prog = compiler.compile(code)
-            prog.options = options
-            bots += [prog]
+            bots += [compile_prog(compiler, code, options)]
             if len(bots) >= size:
                 return Room(bots)
         except:
@@ -46,8 +51,7 @@ def avg(scores):
 
 def sim_prog_for_score(game, compiler, code, options, seed, debug=True):
     runner = GameRunner(game)
-    prog = compiler.compile(code)
-    prog.options = options
+    prog = compile_prog(compiler, code, options)
     try:
         score = runner.run(Room([prog], seed=seed), playback=False).score
         sys.stdout.write(".")
@@ -97,8 +101,8 @@ def sim_competition(compiler, game, gamedb, token, runs, ncores=None, debug=Fals
                 continue
             if debug:
                 print("Compiling code...")
-            prog = compiler.compile(code)
-            prog.options = options
+            # The pool is forked after this so its processes find the program in the cache.
+            compile_prog(compiler, code, options)
             if debug:
                 print("Simulating {} games...".format(runs))
 
@@ -222,10 +226,7 @@ class MultiplayerComp(object):
                     continue
                 if debug:
                     print("compiling code...")
-                prog = compiler.compile(code)
-                prog.options = options
-                prog.token = s
-                prog.name = name
+                prog = compile_prog(compiler, code, options, token=s, name=name)
                 if debug:
                     print("simulating...")
                 bots += [prog]
@@ -244,10 +245,11 @@ class MultiplayerComp(object):
             if save_games:
                 game_tokens += [room.save(gamedb)]
 
-        for player, score in tourney.scores.items():
-            gamedb.save_avg_score(player.token, score.floored_mean)
-            if debug:
-                print("Score {} for Bike: {}".format(score.mean, str(player.token)))
+        with gamedb.batch():
+            for player, score in tourney.scores.items():
+                gamedb.save_avg_score(player.token, score.floored_mean)
+                if debug:
+                    print("Score {} for Bike: {}".format(score.mean, str(player.token)))
 
         return game_tokens
 
@@ -262,11 +264,7 @@ class MultiplayerComp(object):
                 return
             if debug:
                 print("compiling code...")
-            prog = compiler.compile(code)
-            prog.options = options
-            prog.token = token
-            prog.name = name
-            return prog
+            return compile_prog(compiler, code, options, token=token, name=name)
         except:
             print("Couldn't compile code for '{}' in '{}'".format(s, gamedb.get_school_for_token(s)))
 
@@ -430,7 +428,9 @@ class RollingMultiplayerComp(object):
 
 
 class RollingMultiplayerCompRunner(Process):
-    def __init__(self, interval, gamedb, game, compiler, rolling_n=100, batch_size=4, debug=False):
+    def __init__(
+        self, interval, gamedb, game, compiler, rolling_n=100, batch_size=4, replay_by_seed=False, debug=False
+    ):
         """
 
         Args:
@@ -438,6 +438,7 @@ class RollingMultiplayerCompRunner(Process):
             gamedb:
             game:
             compiler:
+            replay_by_seed(bool): If True only save what is needed to replay the games instead of their frames.
         """
         super(RollingMultiplayerCompRunner, self).__init__()
 
@@ -450,6 +451,7 @@ class RollingMultiplayerCompRunner(Process):
         self.compiler = compiler
         self.rolling_n = rolling_n
         self.batch_size = batch_size
+        self.replay_by_seed = replay_by_seed
         self.debug = debug
 
         self.start_run = Event()
@@ -502,11 +504,14 @@ class RollingMultiplayerCompRunner(Process):
                 if self.debug:
                     print("Room: " + str(room))
                 gamerunner = GameRunner(self.game)
-                comp[room] = gamerunner.run(room).score
+                replay = gamerunner.get_replay(room) if self.replay_by_seed else None
+                # The frames aren't needed when the game is saved by seed.
+                comp[room] = gamerunner.run(room, playback=replay is None).score
 
                 # save scores and game
-                self.gamedb.add_game_to_comp("P00000000", room.save(self.gamedb))
-                comp.save_rolling_scores(self.gamedb)
+                with self.gamedb.batch():
+                    self.gamedb.add_game_to_comp("P00000000", room.save(self.gamedb, replay=replay))
+                    comp.save_rolling_scores(self.gamedb)
 
         # TODO: replace this with a function which keeps the last rolling_n number of games for each token.
         # self.gamedb.replace_games_in_comp(ctoken="P00000000",  # TODO: un hardcode this.
@@ -516,6 +521,7 @@ class RollingMultiplayerCompRunner(Process):
             start_time = time.time()
             print("Will do some clean up....")
             self.clean_up_old_games()
+            self.gamedb.collect_code_garbage()
             print("Finished cleaning in {0:.2f} secs...".format(time.time() - start_time))
 
     def make_bot(self, token):
@@ -528,11 +534,9 @@ class RollingMultiplayerCompRunner(Process):
                 return
             if self.debug:
                 print("compiling code...")
-            prog = self.compiler.compile(code)
-            prog.options = options
-            prog.token = token
-            prog.name = name
-            return prog
+            return compile_prog(
+                self.compiler, code, options, token=token, name=name, code_hash=hash_code(code, options)
+            )
         except:
             print("Couldn't compile code for '{}' in '{}'".format(s, gamedb.get_school_for_token(s)))
 
@@ -544,21 +548,15 @@ class RollingMultiplayerCompRunner(Process):
 
         for s_token in self.gamedb.get_school_tokens():
             for token in self.gamedb.get_tokens_for_school(s_token):
-                games = set(self.gamedb.get_games_for_token(token))
-                games = games.intersection(all_game_tokens)  # only keep the games that were used for scoring.
-                if self.rolling_n >= len(games):  # We need to keep them all
-                    games_to_delete = games_to_delete - games
-                else:  # This player has too many games.
-                    # We need to pick the newest ones
-                    games = list(games)
-                    games.sort(key=lambda x: self.gamedb.get_ctime_for_game(x), reverse=True)
-                    games_player_needs = games[: self.rolling_n]
-                    games_to_delete = games_to_delete - set(games_player_needs)
+                # only count the games that were used for scoring.
+                kept, dropped = self.gamedb.trim_game_timeline(token, self.rolling_n, all_game_tokens)
+                games_to_delete = games_to_delete - set(kept)
 
         if self.debug:
             print("Cleaning up {} games...".format(len(games_to_delete)))
 
         for gtoken in games_to_delete:
+            self.gamedb.remove_game_from_comp("P00000000", gtoken)
             self.gamedb.delete_game(gtoken)
 
     # def clean_up_broken_games(self):
@@ -1,14 +1,20 @@
+import bisect
+import fcntl
 import gzip
 import io
 import os
 import random
 import shutil
+import threading
 import time
 from builtins import str as text
+from contextlib import contextmanager
+from multiprocessing import Event, Process
 
+import gevent.local
 import msgpack
 
-from CYLGame.Utils import hash_stream
+from CYLGame.Utils import hash_code
 
 
 def write_json(o, filename):
@@ -21,6 +27,65 @@ def read_json(filename):
         return msgpack.load(fp)
 
 
+def pack_json(o):
+    """Returns the bytes `write_json` would write for `o`."""
+    return gzip.compress(msgpack.packb(o))
+
+
+def write_atomic(path, data):
+    """Writes `data` to a new file then moves it over `path` so readers never see a partially written file."""
+    new_path = "{}.{}.{}.new".format(path, os.getpid(), threading.get_ident())
+    with open(new_path, "wb") as fp:
+        fp.write(data)
+    os.rename(new_path, path)
+
+
+def open_locked(path):
+    """Opens a file for appending while holding an exclusive `flock` on it.
+
+    Files which are rewritten by moving a new file over them are only rewritten while holding the lock, so the file
+    is reopened if it was replaced while we waited for the lock.
+    """
+    while True:
+        fp = open(path, "ab")
+        fcntl.flock(fp, fcntl.LOCK_EX)
+        try:
+            if os.fstat(fp.fileno()).st_ino == os.stat(path).st_ino:
+                return fp
+        except FileNotFoundError:
+            pass
+        fp.close()
+
+
+def append_locked(path, data):
+    """Appends `data` to a file with a single write while holding an exclusive `flock` on it."""
+    with open_locked(path) as fp:
+        fp.write(data)
+
+
+FILE_BACKEND = "file"
+SQLITE_BACKEND = "sqlite"
+
+
+def open_game_db(root_dir, backend=None):
+    """Opens the game database stored in `root_dir`.
+
+    Args:
+        root_dir (str): The root game directory.
+        backend (str): Either `FILE_BACKEND` or `SQLITE_BACKEND`. If None the SQLite backend is used when `root_dir`
+            already contains a SQLite database and the file backend is used otherwise.
+    """
+    from CYLGame.SQLiteDatabase import SQLiteGameDB
+
+    if backend is None:
+        backend = SQLITE_BACKEND if SQLiteGameDB.exists(root_dir) else FILE_BACKEND
+    if backend == FILE_BACKEND:
+        return GameDB(root_dir)
+    if backend == SQLITE_BACKEND:
+        return SQLiteGameDB(root_dir)
+    raise ValueError(f"Unknown game database backend '{backend}'")
+
+
 class WWWCache:
     def __init__(self, root_dir):
         self.root_dir = root_dir
@@ -69,6 +134,518 @@ class WWWCache:
         return os.path.join(self.root_dir, "templates")
 
 
+class TokenRegistry(object):
+    """An in-memory set of the tokens stored as entries of a directory.
+
+    The set is loaded once and then kept up to date by `add` and `discard`. Since the server's worker processes and the
+    scoring process share the same directory, the set is revalidated against the directory's mtime before every lookup.
+    That is a single `os.stat` call instead of an `os.listdir` of the whole directory. The directory is only listed
+    again when another process changed it.
+    """
+
+    # Changes made within this many nanoseconds of each other might share an mtime tick, so the directory is listed
+    # once more after this long to pick up changes which the mtime missed.
+    RACY_WINDOW_NS = 10**9
+
+    def __init__(self, path):
+        self.path = path
+        self.__tokens = set()
+        self.__mtime = None
+        self.__recheck_at = None
+
+    def __list(self, mtime):
+        self.__tokens = set(os.listdir(self.path))
+        self.__mtime = mtime
+        self.__recheck_at = None
+        if time.time_ns() - mtime < self.RACY_WINDOW_NS:
+            self.__recheck_at = mtime + self.RACY_WINDOW_NS
+
+    def __revalidate(self):
+        mtime = os.stat(self.path).st_mtime_ns
+        if mtime != self.__mtime or (self.__recheck_at is not None and time.time_ns() >= self.__recheck_at):
+            self.__list(mtime)
+
+    def __changed(self):
+        """Records the mtime of a change made by this process so it doesn't cause the directory to be listed again."""
+        if self.__mtime is None:
+            return
+        self.__mtime = os.stat(self.path).st_mtime_ns
+        # Another process might have changed the directory since it was last listed.
+        if self.__recheck_at is None:
+            self.__recheck_at = time.time_ns() + self.RACY_WINDOW_NS
+
+    def __contains__(self, token):
+        if not isinstance(token, str) or not token.isalnum():
+            return False
+        self.__revalidate()
+        if token in self.__tokens:
+            return True
+        # The token might have been added by another process within the same mtime tick.
+        if os.path.exists(os.path.join(self.path, token)):
+            self.__tokens.add(token)
+            return True
+        return False
+
+    def __iter__(self):
+        return iter(self.tokens())
+
+    def __len__(self):
+        self.__revalidate()
+        return len(self.__tokens)
+
+    def tokens(self):
+        self.__revalidate()
+        return list(self.__tokens)
+
+    def add(self, token):
+        self.__tokens.add(token)
+        self.__changed()
+
+    def discard(self, token):
+        self.__tokens.discard(token)
+        self.__changed()
+
+
+class KeyValueLog(object):
+    """An append-only log of key value records stored in a single file.
+
+    Saving a value appends one small msgpack record to the log instead of rewriting all the values. The values are
+    cached in memory and only the records appended since the last read (possibly by other processes) are read from
+    disk. Once the log holds many overwritten records it is compacted to one record per key.
+
+    Appends and compactions hold an exclusive `flock` on the log so they never interleave between processes.
+    """
+
+    # Compact once there are at least this many records and less than half of them are still current.
+    COMPACT_AFTER = 256
+
+    def __init__(self, path, legacy_path=None):
+        """
+        Args:
+            path (str): The path of the log file.
+            legacy_path (str): The path of a gzip'd msgpack dict that holds the values saved before the log existed.
+        """
+        self.path = path
+        self.legacy_path = legacy_path
+        self.__values = {}
+        self.__inode = None
+        self.__offset = 0
+        self.__records = 0
+
+    def __reset(self, inode):
+        self.__values = {}
+        if self.legacy_path and os.path.exists(self.legacy_path):
+            self.__values = read_json(self.legacy_path)
+        self.__inode = inode
+        self.__offset = 0
+        self.__records = 0
+
+    def __refresh(self):
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            if self.__inode != -1:
+                self.__reset(-1)
+            return
+        if stat.st_ino != self.__inode or stat.st_size < self.__offset:
+            # The log was compacted.
+            self.__reset(stat.st_ino)
+        if stat.st_size > self.__offset:
+            with open(self.path, "rb") as fp:
+                fp.seek(self.__offset)
+                self.__read_records(fp)
+
+    def __read_records(self, fp):
+        unpacker = msgpack.Unpacker(fp)
+        start = self.__offset
+        for key, value in unpacker:
+            self.__values[key] = value
+            self.__records += 1
+            # A record which is still being written is left for the next refresh.
+            self.__offset = start + unpacker.tell()
+
+    def get(self, key, default_value=None):
+        self.__refresh()
+        return self.__values.get(key, default_value)
+
+    def items(self):
+        self.__refresh()
+        return dict(self.__values)
+
+    def set(self, key, value):
+        self.update({key: value})
+
+    def update(self, values, before_write=None):
+        """Appends a record for each key value pair in `values` with a single write.
+
+        Args:
+            values (dict): The key value pairs.
+            before_write (callable): If given it is called with the locked log file right before the records are
+                written. See `WriteBatch.apply`.
+        """
+        with open_locked(self.path) as fp:
+            if before_write is not None:
+                before_write(fp)
+            fp.write(b"".join(msgpack.packb([key, value]) for key, value in values.items()))
+        self.__refresh()
+        if self.__records >= self.COMPACT_AFTER and self.__records > 2 * len(self.__values):
+            self.compact()
+
+    def compact(self):
+        """Rewrites the log with a single record per key."""
+        with open_locked(self.path) as fp:
+            self.__refresh()
+            new_path = self.path + ".new"
+            with open(new_path, "wb") as new_fp:
+                for key, value in self.__values.items():
+                    new_fp.write(msgpack.packb([key, value]))
+                new_fp.flush()
+                os.fsync(new_fp.fileno())
+            os.rename(new_path, self.path)
+        # The legacy values are part of the compacted log now.
+        if self.legacy_path and os.path.exists(self.legacy_path):
+            os.remove(self.legacy_path)
+
+
+class CodeHashIndex(object):
+    """An index from code hashes to the users who saved the code and when they saved it.
+
+    The index is stored as an append-only log of msgpack `[hash, token, ctime]` records. The hashes are kept sorted in
+    memory so prefix lookups take logarithmic time, and only the records appended since the last lookup (possibly by
+    other processes) are read from disk. Once the log holds many removed records it is compacted to the current ones.
+    """
+
+    # Compact once there are at least this many records and less than half of them are still current.
+    COMPACT_AFTER = 256
+
+    def __init__(self, path):
+        self.path = path
+        self.__hashes = []  # Sorted
+        self.__owners = {}  # Hash to a set of (token, ctime) pairs.
+        self.__inode = None
+        self.__offset = 0
+        self.__records = 0
+
+    def exists(self):
+        return os.path.exists(self.path)
+
+    @staticmethod
+    def pack(code_hash, token, ctime, removed=False):
+        if removed:
+            return msgpack.packb([code_hash, token, ctime, True])
+        return msgpack.packb([code_hash, token, ctime])
+
+    def add(self, code_hash, token, ctime):
+        append_locked(self.path, self.pack(code_hash, token, ctime))
+
+    def remove(self, code_hash, token, ctime):
+        append_locked(self.path, self.pack(code_hash, token, ctime, removed=True))
+        self.__refresh()
+        if self.__records >= self.COMPACT_AFTER and self.__records > 2 * self.__count_owners():
+            self.compact()
+
+    def build(self, entries):
+        """Creates the index from an iterable of (hash, token, ctime) tuples unless another process already did."""
+        with open(self.path, "ab") as fp:
+            fcntl.flock(fp, fcntl.LOCK_EX)
+            if os.fstat(fp.fileno()).st_size == 0:
+                fp.write(b"".join(self.pack(*entry) for entry in entries))
+
+    def compact(self):
+        """Rewrites the log with a single record per current owner."""
+        with open_locked(self.path):
+            self.__refresh()
+            new_path = self.path + ".new"
+            with open(new_path, "wb") as new_fp:
+                for code_hash in self.__hashes:
+                    for token, ctime in self.__owners[code_hash]:
+                        new_fp.write(self.pack(code_hash, token, ctime))
+                new_fp.flush()
+                os.fsync(new_fp.fileno())
+            os.rename(new_path, self.path)
+
+    def __count_owners(self):
+        return sum(map(len, self.__owners.values()))
+
+    def __reset(self, inode):
+        self.__hashes = []
+        self.__owners = {}
+        self.__inode = inode
+        self.__offset = 0
+        self.__records = 0
+
+    def __refresh(self):
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return
+        if stat.st_ino != self.__inode or stat.st_size < self.__offset:
+            # The log was compacted.
+            self.__reset(stat.st_ino)
+        if stat.st_size <= self.__offset:
+            return
+        with open(self.path, "rb") as fp:
+            fp.seek(self.__offset)
+            unpacker = msgpack.Unpacker(fp)
+            start = self.__offset
+            added, removed = set(), False
+            for code_hash, token, ctime, *is_removal in unpacker:
+                owners = self.__owners.setdefault(code_hash, set())
+                if is_removal:
+                    owners.discard((token, ctime))
+                else:
+                    # Records replayed from a journal might be duplicated.
+                    owners.add((token, ctime))
+                if owners:
+                    added.add(code_hash)
+                else:
+                    del self.__owners[code_hash]
+                    removed = True
+                self.__records += 1
+                # A record which is still being written is left for the next refresh.
+                self.__offset = start + unpacker.tell()
+        # The sorted hashes are updated once for all the records instead of once per record.
+        if removed:
+            self.__hashes = [code_hash for code_hash in self.__hashes if code_hash in self.__owners]
+        new_hashes = [code_hash for code_hash in added if code_hash in self.__owners and not self.__has_hash(code_hash)]
+        if new_hashes:
+            self.__hashes += new_hashes
+            self.__hashes.sort()
+
+    def __has_hash(self, code_hash):
+        i = bisect.bisect_left(self.__hashes, code_hash)
+        return i < len(self.__hashes) and self.__hashes[i] == code_hash
+
+    def find(self, code_hash_prefix):
+        """Returns the sorted list of hashes starting with `code_hash_prefix`."""
+        self.__refresh()
+        i = bisect.bisect_left(self.__hashes, code_hash_prefix)
+        matches = []
+        while i < len(self.__hashes) and self.__hashes[i].startswith(code_hash_prefix):
+            matches += [self.__hashes[i]]
+            i += 1
+        return matches
+
+    def get_owners(self, code_hash):
+        """Returns the (token, ctime) pairs of the times the code was saved, ordered from oldest to newest."""
+        self.__refresh()
+        return sorted(self.__owners.get(code_hash, set()), key=lambda owner: owner[1])
+
+
+class WriteBatch(object):
+    """The file system writes buffered by `GameDB.batch`.
+
+    The writes are committed by saving them to a journal with a single fsync and then applying them. A journal left
+    behind by a crash is applied again the next time the game database is loaded, so either all or none of the writes
+    in a batch are visible after a crash.
+
+    Each write is recorded in a progress file next to the journal right before it is made, so a journal is only
+    applied from the write which was being made when the process crashed. Appends also record the size of the file
+    they append to, so an append which was already made isn't made again.
+    """
+
+    MKDIR = "mkdir"
+    WRITE = "write"
+    VALUES = "values"
+    APPEND = "append"
+    REMOVE = "remove"
+
+    def __init__(self, root_dir):
+        self.root_dir = root_dir
+        self.ops = []
+        self.paths = set()  # The paths created by this batch.
+        self.removed_paths = set()
+        self.values = {}  # The values saved with `save_value` by log path.
+        self.new_tokens = set()  # (registry, token) pairs of the tokens created by this batch.
+        self.depth = 0
+
+    def exists(self, path):
+        if path in self.paths:
+            return True
+        return path not in self.removed_paths and os.path.exists(path)
+
+    def makedirs(self, path, exist_ok=False):
+        if self.exists(path):
+            if exist_ok:
+                return
+            raise FileExistsError("File exists: '{}'".format(path))
+        self.ops += [(self.MKDIR, os.path.relpath(path, self.root_dir))]
+        while path != self.root_dir and path not in self.paths:
+            self.paths.add(path)
+            self.removed_paths.discard(path)
+            path = os.path.dirname(path)
+
+    def write(self, path, data, atomic=False):
+        assert self.exists(os.path.dirname(path)), "No such directory: '{}'".format(os.path.dirname(path))
+        self.ops += [(self.WRITE, os.path.relpath(path, self.root_dir), data, atomic)]
+        self.paths.add(path)
+        self.removed_paths.discard(path)
+
+    def append(self, path, data):
+        self.ops += [(self.APPEND, os.path.relpath(path, self.root_dir), data)]
+
+    def remove(self, path):
+        if not self.exists(path):
+            raise FileNotFoundError("No such file: '{}'".format(path))
+        self.ops += [(self.REMOVE, os.path.relpath(path, self.root_dir))]
+        self.paths.discard(path)
+        self.removed_paths.add(path)
+
+    def save_value(self, log_path, key, value):
+        if log_path not in self.values:
+            self.values[log_path] = {}
+            self.ops += [(self.VALUES, os.path.relpath(log_path, self.root_dir), self.values[log_path])]
+        self.values[log_path][key] = value
+
+    def commit(self, journal_dir, kv_log_for_path):
+        if not self.ops:
+            return
+        journal_path = os.path.join(journal_dir, "{}_{}_{}".format(os.getpid(), threading.get_ident(), time.time_ns()))
+        with open(journal_path + ".tmp", "wb") as fp:
+            msgpack.dump(self.ops, fp)
+            fp.flush()
+            os.fsync(fp.fileno())
+        os.rename(journal_path + ".tmp", journal_path)
+        self.apply(self.root_dir, self.ops, kv_log_for_path, journal_path)
+        os.remove(journal_path)
+        try:
+            os.remove(journal_path + self.PROGRESS_SUFFIX)
+        except FileNotFoundError:
+            pass  # Removed by another process which is recovering the journals.
+
+    PROGRESS_SUFFIX = ".progress"
+
+    @classmethod
+    def apply(cls, root_dir, ops, kv_log_for_path, journal_path):
+        """Applies the writes of a journal, starting with the write which was being made when the journal was last
+        applied.
+        """
+        progress_path = journal_path + cls.PROGRESS_SUFFIX
+        first, appended_at = 0, None
+        if os.path.exists(progress_path):
+            with open(progress_path, "rb") as fp:
+                for first, *appended_at in msgpack.Unpacker(fp):
+                    pass
+
+        with open(progress_path, "ab", buffering=0) as progress_fp:
+
+            def record(i, fp=None):
+                """Records that the i-th write is being made, and the size of the file it appends to."""
+                if fp is None:
+                    progress_fp.write(msgpack.packb([i]))
+                else:
+                    stat = os.fstat(fp.fileno())
+                    progress_fp.write(msgpack.packb([i, stat.st_ino, stat.st_size]))
+
+            for i, (op, rel_path, *args) in enumerate(ops):
+                if i < first:
+                    continue
+                path = os.path.join(root_dir, rel_path)
+                if op in (cls.VALUES, cls.APPEND) and i == first and appended_at:
+                    data = args[0] if op == cls.APPEND else b"".join(msgpack.packb(item) for item in args[0].items())
+                    if cls.__was_appended(path, data, *appended_at):
+                        continue
+
+                if op == cls.VALUES:
+                    kv_log_for_path(path).update(args[0], before_write=lambda fp: record(i, fp))
+                elif op == cls.APPEND:
+                    with open_locked(path) as fp:
+                        record(i, fp)
+                        fp.write(args[0])
+                else:
+                    record(i)
+                    if op == cls.MKDIR:
+                        os.makedirs(path, exist_ok=True)
+                    elif op == cls.WRITE:
+                        data, atomic = args
+                        if atomic:
+                            write_atomic(path, data)
+                        else:
+                            with open(path, "wb") as fp:
+                                fp.write(data)
+                    elif op == cls.REMOVE:
+                        if os.path.exists(path):
+                            os.remove(path)
+                    else:
+                        raise ValueError("Unknown journal operation '{}'".format(op))
+
+    @staticmethod
+    def __was_appended(path, data, inode, size):
+        """Returns whether `data` was appended to a file which was `size` bytes long."""
+        try:
+            with open(path, "rb") as fp:
+                if os.fstat(fp.fileno()).st_ino != inode:
+                    # The file was compacted or removed since, which is only done after appending to it.
+                    return True
+                fp.seek(size)
+                return fp.read(len(data)) == data
+        except FileNotFoundError:
+            return True
+
+    @classmethod
+    def recover(cls, root_dir, journal_dir, kv_log_for_path):
+        """Applies the journals left behind by batches which did not finish committing."""
+        for name in sorted(os.listdir(journal_dir)):
+            journal_path = os.path.join(journal_dir, name)
+            if name.endswith(cls.PROGRESS_SUFFIX) or cls.__is_committing(int(name.split("_")[0])):
+                continue
+            if not name.endswith(".tmp"):
+                with open(journal_path, "rb") as fp:
+                    cls.apply(root_dir, msgpack.load(fp), kv_log_for_path, journal_path)
+            # A ".tmp" journal was never committed so none of its writes were made.
+            os.remove(journal_path)
+        for name in os.listdir(journal_dir):
+            # The progress of a journal which was applied or never committed.
+            if (
+                name.endswith(cls.PROGRESS_SUFFIX)
+                and not cls.__is_committing(int(name.split("_")[0]))
+                and not os.path.exists(os.path.join(journal_dir, name[: -len(cls.PROGRESS_SUFFIX)]))
+            ):
+                os.remove(os.path.join(journal_dir, name))
+
+    @staticmethod
+    def __is_committing(pid):
+        """Returns whether the process which wrote a journal might still be committing it."""
+        if pid == os.getpid():
+            return True
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            pass
+        return True
+
+
+class GameReaper(Process):
+    def __init__(self, interval, gamedb, debug=False):
+        """A process which reaps the deleted games of a game database with `reap_deleted_games`.
+
+        Args:
+            interval(int): The number of seconds to wait between reaping.
+            gamedb: The game database.
+            debug (bool): If True print the throughput of every run which reaped games.
+        """
+        super(GameReaper, self).__init__()
+        self.interval = interval
+        self.gamedb = gamedb
+        self.debug = debug
+        self.end = Event()
+
+    def stop(self):
+        self.end.set()
+
+    def run(self):
+        while not self.end.is_set():
+            stats = self.gamedb.reap_deleted_games()
+            if self.debug and stats["games"] > 0:
+                print(
+                    "Reaped {games} games and {references} references in {seconds:.2f} secs "
+                    "({games_per_second:.1f} games/sec)...".format(**stats)
+                )
+            self.end.wait(self.interval)
+
+
 # TODO(derpferd): Use the move function to prevent RACE on files
 class GameDB(object):
     """
@@ -79,15 +656,28 @@ class GameDB(object):
     /data/TOKEN                 => A directory containing data for the user with the token TOKEN.
     /data/TOKEN/avg_score       => File containing a single float representing the average score for the user.
     /data/TOKEN/name            => File containing the name for the user.
-    /data/TOKEN/code            => Directory containing all code submitted by the user.
-    /data/TOKEN/code/CTIME_HASH => The code submitted or played at CTIME.
-    /data/TOKEN/code/CTIME_HASH/code.lp
-    /data/TOKEN/code/CTIME_HASH/options.mp.gz
+    /data/TOKEN/school          => File containing the token of the school the user belongs to.
+    /data/TOKEN/db.mp.log       => Append-only log of the key value pairs saved with `save_value`.
+    /data/TOKEN/code.mp.log     => Append-only log of the user's code history. Each `[CTIME, HASH]` record represents
+                                    that the code HASH was submitted or played at CTIME.
+    /data/TOKEN/code/CTIME_HASH => Code saved before the code store existed.
     /data/TOKEN/games           => A directory related games.
     /data/TOKEN/games/GTOKEN    => An empty file representing that the users bot was used in game GTOKEN.
+    /data/TOKEN/timeline        => The tokens of the user's games, one per line from oldest to newest. See
+                                    `trim_game_timeline`.
     /games                      => Stores game related data.
+    /deleted_games/GTOKEN       => A game deleted with `delete_game` which is waiting to be removed by
+                                    `reap_deleted_games`.
     /schools                    => Stores school related data.
+    /schools/STOKEN/tokens/TOKEN => An empty file representing that the user TOKEN belongs to the school.
+    /schools/STOKEN/comps/CTOKEN => An empty file representing that the school is in the competition CTOKEN.
     /competitions               => Stores competition related data.
+    /code_blobs                 => Stores each distinct code once.
+    /code_blobs/HASH/code.lp
+    /code_blobs/HASH/options.mp.gz
+    /code_hashes.mp.log         => Index from code hashes to the users who saved the code. See `CodeHashIndex`.
+    /code_garbage.mp.log        => The hashes of the code removed from a code history. See `collect_code_garbage`.
+    /journal                    => Journals of the batches which are being committed. See `batch`.
     /www                        => Stores static and template files for the server. This is a cache that is deleted and
                                     recreated on each restart.
     """
@@ -97,9 +687,14 @@ class GameDB(object):
     ACTIVE_CODE_KEY = "active_code"
 
     CODE_DIR = "code"
+    CODE_HISTORY_FILENAME = "code.mp.log"
     CODE_FILENAME = "code.lp"
     OPTIONS_FILENAME = "options.mp.gz"
 
+    # Code which is no longer referenced is only collected once it hasn't been removed or saved for this many seconds,
+    # so it is never collected while it is being saved again.
+    CODE_GC_GRACE_PERIOD = 60 * 60
+
     def __init__(self, root_dir):
         self.root_dir = os.path.abspath(root_dir)
         self.data_dir = os.path.join(self.root_dir, "data")
@@ -107,8 +702,24 @@ class GameDB(object):
         self.schools_dir = os.path.join(self.root_dir, "schools")
         self.competitions_dir = os.path.join(self.root_dir, "competitions")
         self.exception_dir = os.path.join(self.root_dir, "exceptions")
+        self.journal_dir = os.path.join(self.root_dir, "journal")
+        self.deleted_games_dir = os.path.join(self.root_dir, "deleted_games")
+        self.code_blobs_dir = os.path.join(self.root_dir, "code_blobs")
+        self.code_garbage_path = os.path.join(self.root_dir, "code_garbage.mp.log")
         self.www_cache = WWWCache(os.path.join(self.root_dir, "www"))
         self.__load()
+        self.__user_tokens = TokenRegistry(self.data_dir)
+        self.__game_tokens = TokenRegistry(self.game_dir)
+        self.__deleted_game_tokens = TokenRegistry(self.deleted_games_dir)
+        self.__school_tokens = TokenRegistry(self.schools_dir)
+        self.__comp_tokens = TokenRegistry(self.competitions_dir)
+        self.__exception_tokens = TokenRegistry(self.exception_dir)
+        self.__school_for_token = {}  # A user's school never changes so this is safe to cache forever.
+        self.__kv_logs = {}
+        # Greenlet local, since the server doesn't monkey patch and its requests share the threads of their worker.
+        self.__local = gevent.local.local()
+        self.__code_index = CodeHashIndex(os.path.join(self.root_dir, "code_hashes.mp.log"))
+        WriteBatch.recover(self.root_dir, self.journal_dir, self.__get_kv_log_for_path)
 
     def __load(self):
         os.makedirs(self.root_dir, exist_ok=True)
@@ -117,45 +728,157 @@ class GameDB(object):
         os.makedirs(self.schools_dir, exist_ok=True)
         os.makedirs(self.competitions_dir, exist_ok=True)
         os.makedirs(self.exception_dir, exist_ok=True)
+        os.makedirs(self.journal_dir, exist_ok=True)
+        os.makedirs(self.deleted_games_dir, exist_ok=True)
+        os.makedirs(self.code_blobs_dir, exist_ok=True)
+
+    @contextmanager
+    def batch(self):
+        """Buffers the writes made within the context and commits them together with a single fsync when it exits.
+
+        The writes are committed atomically, so a crash never leaves only some of them made, and they are discarded
+        if an exception is raised. Batches can be nested, in which case the writes are committed by the outermost one.
+        Reads within a batch only see the writes of the batch through `get_value` and the existence checks made
+        before a write.
+        """
+        batch = self.__batch
+        if batch is None:
+            batch = self.__local.batch = WriteBatch(self.root_dir)
+        batch.depth += 1
+        try:
+            yield self
+            if batch.depth == 1:
+                batch.commit(self.journal_dir, self.__get_kv_log_for_path)
+                for registry, token in batch.new_tokens:
+                    registry.add(token)
+        finally:
+            batch.depth -= 1
+            if batch.depth == 0:
+                self.__local.batch = None
+
+    @property
+    def __batch(self):
+        return getattr(self.__local, "batch", None)
+
+    def __exists(self, path):
+        if self.__batch is not None:
+            return self.__batch.exists(path)
+        return os.path.exists(path)
+
+    def __makedirs(self, path, exist_ok=False):
+        if self.__batch is not None:
+            self.__batch.makedirs(path, exist_ok=exist_ok)
+        else:
+            os.makedirs(path, exist_ok=exist_ok)
+
+    def __write(self, path, data, atomic=False):
+        if self.__batch is not None:
+            self.__batch.write(path, data, atomic=atomic)
+        elif atomic:
+            write_atomic(path, data)
+        else:
+            with open(path, "wb") as fp:
+                fp.write(data)
+
+    def __write_text(self, path, s, atomic=False):
+        self.__write(path, text(s).encode("utf8"), atomic=atomic)
+
+    def __touch(self, path):
+        self.__write(path, b"")
+
+    def __remove(self, path):
+        if self.__batch is not None:
+            self.__batch.remove(path)
+        else:
+            os.remove(path)
+
+    def __append(self, path, data):
+        if self.__batch is not None:
+            self.__batch.append(path, data)
+        else:
+            append_locked(path, data)
+
+    def __add_token(self, registry, token):
+        if self.__batch is not None:
+            self.__batch.new_tokens.add((registry, token))
+        else:
+            registry.add(token)
+
+    def __has_token(self, registry, token):
+        if token in registry:
+            return True
+        return self.__batch is not None and (registry, token) in self.__batch.new_tokens
 
     def __get_user_tokens(self):
-        return os.listdir(self.data_dir)
+        return self.__user_tokens.tokens()
 
     def __get_game_tokens(self):
-        return os.listdir(self.game_dir)
+        return self.__game_tokens.tokens()
 
     def __get_school_tokens(self):
-        return os.listdir(self.schools_dir)
+        return self.__school_tokens.tokens()
 
     def __get_comp_tokens(self):
-        return os.listdir(self.competitions_dir)
+        return self.__comp_tokens.tokens()
 
     def __get_exception_tokens(self):
-        return os.listdir(self.exception_dir)
+        return self.__exception_tokens.tokens()
 
     def __get_school_user_tokens(self, school_tk):
         if self.is_school_token(school_tk):
             return os.listdir(self.__get_dir_for_token(school_tk, "tokens"))
         return []
 
+    def __get_school_comp_tokens(self, school_tk):
+        comps_dir = self.__get_dir_for_token(school_tk, "comps")
+        if not self.__exists(comps_dir):
+            self.__index_school_comps(school_tk)
+        if not os.path.exists(comps_dir):
+            return []  # The school is being created by the current batch.
+        return os.listdir(comps_dir)
+
+    def __index_school_comps(self, school_tk):
+        """Builds the comps index for a school which was created before competitions were indexed by school."""
+        new_comps_dir = self.__get_dir_for_token(school_tk, "comps.{}".format(os.getpid()))
+        os.makedirs(new_comps_dir, exist_ok=True)
+        for ctoken in self.__get_comp_tokens():
+            if school_tk in self.get_schools_in_comp(ctoken):
+                with open(os.path.join(new_comps_dir, ctoken), "w"):
+                    pass
+        try:
+            os.rename(new_comps_dir, self.__get_dir_for_token(school_tk, "comps"))
+        except OSError:
+            # Another process built the index first.
+            shutil.rmtree(new_comps_dir)
+
+    def __add_comp_to_school_index(self, ctoken, school_tk):
+        self.__get_school_comp_tokens(school_tk)  # Make sure the index exists before adding to it.
+        self.__touch(self.__get_dir_for_token(school_tk, ["comps", ctoken]))
+
     def __get_user_game_tokens(self, token):
         if self.is_user_token(token) and os.path.exists(self.__get_dir_for_token(token, "games")):
-            return os.listdir(self.__get_dir_for_token(token, "games"))
+            return self.__without_deleted_games(os.listdir(self.__get_dir_for_token(token, "games")))
         return []
 
     def __get_comp_game_tokens(self, token):
         if self.is_comp_token(token) and os.path.exists(self.__get_dir_for_token(token, "games")):
-            return os.listdir(self.__get_dir_for_token(token, "games"))
+            return self.__without_deleted_games(os.listdir(self.__get_dir_for_token(token, "games")))
         return []
 
-    def __get_new_token(self, tokens=None, prefix=""):
+    def __without_deleted_games(self, gtokens):
+        """Filters out the games which were deleted but still have references waiting to be reaped."""
+        if len(self.__deleted_game_tokens) == 0:
+            return gtokens
+        return [gtoken for gtoken in gtokens if gtoken not in self.__deleted_game_tokens]
+
+    def __get_new_token(self, tokens=None, prefix="", reserved_tokens=None):
         def new_token():
             return prefix + "".join([random.choice("0123456789ABCDEF") for _ in range(self.TOKEN_LEN)])
 
-        if not tokens:
-            tokens = self.__get_user_tokens()
+        if tokens is None:
+            tokens = self.__user_tokens
         token = new_token()
-        while token in tokens:
+        while self.__has_token(tokens, token) or (reserved_tokens is not None and token in reserved_tokens):
             token = new_token()
         return token
 
@@ -193,25 +916,24 @@ class GameDB(object):
     def is_comp_token(self, token):
         if len(token) > 0 and token[0] == "P":
             # It is a competition token
-            return token in self.__get_comp_tokens()
+            return self.__has_token(self.__comp_tokens, token)
         return False
 
     def is_school_token(self, token):
         if len(token) > 0 and token[0] == "S":
             # It is a school token
-            return token in self.__get_school_tokens()
+            return self.__has_token(self.__school_tokens, token)
         return False
 
     def is_user_token(self, token):
-        return token in self.__get_user_tokens()
+        return self.__has_token(self.__user_tokens, token)
 
     def is_game_token(self, gtoken):
-        gtks = self.__get_game_tokens()
-        return gtoken in gtks
+        return self.__has_token(self.__game_tokens, gtoken)
 
     def is_exception_token(self, token):
         if len(token) > 0 and token[0] == "E":
-            return token in self.__get_exception_tokens()
+            return self.__has_token(self.__exception_tokens, token)
         return False
 
     def get_new_token(self, school_tk, _token=None):  # Don't use `_token` unless you know what you are doing.
@@ -222,38 +944,41 @@ class GameDB(object):
             token = self.__get_new_token()
 
         # Touch the file
-        with open(self.__get_dir_for_token(school_tk, ["tokens", token]), "w") as fp:
-            pass
+        self.__touch(self.__get_dir_for_token(school_tk, ["tokens", token]))
 
         # Create token dir
-        os.makedirs(os.path.join(self.data_dir, token))
-        os.makedirs(os.path.join(self.data_dir, token, "games"))
+        self.__makedirs(os.path.join(self.data_dir, token))
+        self.__makedirs(os.path.join(self.data_dir, token, "games"))
+        self.__write_text(os.path.join(self.data_dir, token, "school"), school_tk)
+        self.__touch(os.path.join(self.data_dir, token, "timeline"))
+        self.__add_token(self.__user_tokens, token)
         return token
 
     def add_new_school(self, name="", _token=None):  # Don't use `_token` unless you know what you are doing.
         token = _token
         if _token is None:
-            token = self.__get_new_token(self.__get_school_tokens(), prefix="S")
+            token = self.__get_new_token(self.__school_tokens, prefix="S")
 
-        os.makedirs(os.path.join(self.schools_dir, token))
-        os.makedirs(os.path.join(self.schools_dir, token, "tokens"))
+        self.__makedirs(os.path.join(self.schools_dir, token))
+        self.__makedirs(os.path.join(self.schools_dir, token, "tokens"))
+        self.__makedirs(os.path.join(self.schools_dir, token, "comps"))
 
-        with io.open(os.path.join(self.schools_dir, token, "name"), "w", encoding="utf8") as fp:
-            fp.write(text(name))
+        self.__write_text(os.path.join(self.schools_dir, token, "name"), name)
+        self.__add_token(self.__school_tokens, token)
 
         return token
 
     def add_new_competition(self, name="", _token=None):
         token = _token
         if token is None:
-            token = self.__get_new_token(self.__get_comp_tokens(), prefix="P")
+            token = self.__get_new_token(self.__comp_tokens, prefix="P")
 
-        os.makedirs(os.path.join(self.competitions_dir, token))
-        os.makedirs(os.path.join(self.competitions_dir, token, "schools"))
-        os.makedirs(os.path.join(self.competitions_dir, token, "games"))
+        self.__makedirs(os.path.join(self.competitions_dir, token))
+        self.__makedirs(os.path.join(self.competitions_dir, token, "schools"))
+        self.__makedirs(os.path.join(self.competitions_dir, token, "games"))
 
-        with io.open(os.path.join(self.competitions_dir, token, "name"), "w", encoding="utf8") as fp:
-            fp.write(text(name))
+        self.__write_text(os.path.join(self.competitions_dir, token, "name"), name)
+        self.__add_token(self.__comp_tokens, token)
 
         return token
 
@@ -263,10 +988,12 @@ class GameDB(object):
         if player_tokens is not None:
             assert per_player_data is None
 
-        token = self.__get_new_token(self.__get_game_tokens(), prefix="G")
+        # The tokens of deleted games can't be reused until all references to them are reaped.
+        token = self.__get_new_token(self.__game_tokens, prefix="G", reserved_tokens=self.__deleted_game_tokens)
 
-        os.makedirs(os.path.join(self.game_dir, token))
-        os.makedirs(os.path.join(self.game_dir, token, "players"))
+        self.__makedirs(os.path.join(self.game_dir, token))
+        self.__makedirs(os.path.join(self.game_dir, token, "players"))
+        self.__add_token(self.__game_tokens, token)
 
         if frames is not None:
             self.save_game_frames(token, frames)
@@ -278,8 +1005,7 @@ class GameDB(object):
             for player, data in per_player_data.items():
                 self.set_game_player(token, player, data)
 
-        with open(os.path.join(self.game_dir, token, "ctime"), "w") as fp:
-            fp.write(text(time.time()))
+        self.__write_text(os.path.join(self.game_dir, token, "ctime"), time.time())
 
         return token
 
@@ -288,7 +1014,8 @@ class GameDB(object):
         assert self.is_school_token(stoken)
 
         school_dir = self.__get_dir_for_token(ctoken, ["schools", stoken])
-        os.makedirs(school_dir, exist_ok=True)
+        self.__makedirs(school_dir, exist_ok=True)
+        self.__add_comp_to_school_index(ctoken, stoken)
 
     # TODO(derpferd): add function to remove a school
 
@@ -297,10 +1024,10 @@ class GameDB(object):
         assert self.is_school_token(stoken)
 
         school_dir = self.__get_dir_for_token(ctoken, ["schools", stoken])
-        os.makedirs(school_dir, exist_ok=True)
+        self.__makedirs(school_dir, exist_ok=True)
+        self.__add_comp_to_school_index(ctoken, stoken)
 
-        with io.open(os.path.join(school_dir, "code.lp"), "w", encoding="utf8") as fp:
-            fp.write(text(code))
+        self.__write_text(os.path.join(school_dir, "code.lp"), code)
 
     # def set_token_for_comp(self, ctoken, utoken, stoken):
     #     assert self.is_comp_token(ctoken)
@@ -335,12 +1062,10 @@ class GameDB(object):
         return self.__get_comp_tokens()
 
     def get_comps_for_token(self, utoken):
-        comps = []
         stoken = self.get_school_for_token(utoken)
-        for comp in self.__get_comp_tokens():
-            if stoken in self.get_schools_in_comp(comp):
-                comps += [comp]
-        return comps
+        if stoken is None:
+            return []
+        return self.__get_school_comp_tokens(stoken)
 
     def get_schools_in_comp(self, ctoken):
         return os.listdir(self.__get_dir_for_token(ctoken, "schools"))
@@ -348,8 +1073,7 @@ class GameDB(object):
     def set_comp_avg_score(self, ctoken, stoken, score):
         school_dir = self.__get_dir_for_token(ctoken, ["schools", stoken])
         assert school_dir is not None
-        with io.open(os.path.join(school_dir, "avg_score"), "w", encoding="utf8") as fp:
-            fp.write(text(score))
+        self.__write_text(os.path.join(school_dir, "avg_score"), score)
 
     def get_comp_avg_score(self, ctoken, stoken):
         school_dir = self.__get_dir_for_token(ctoken, ["schools", stoken])
@@ -368,29 +1092,27 @@ class GameDB(object):
             options (json-able object): The user's options.
             set_as_active (bool): Whether to set the saved code as the active code for the token.
         """
-        assert os.path.exists(self.__get_dir_for_token(token))
-        code_dir = self.__get_dir_for_token(token, self.CODE_DIR)
-        os.makedirs(code_dir, exist_ok=True)
+        assert self.__exists(self.__get_dir_for_token(token))
 
         # Create Code id.
         ctime = int(time.time_ns())
-        buf = io.BytesIO()
-        buf.write(bytes(code, encoding="utf8"))
-        if options:
-            msgpack.dump(options, buf)
-        buf.seek(0)
-        code_hash = hash_stream(buf)
+        code_hash = hash_code(code, options)
         code_path_name = f"{ctime}_{code_hash}"
-        try:
-            os.makedirs(os.path.join(code_dir, code_path_name))
-        except OSError:
-            raise ValueError("Duplicate Request!")
 
-        # Write code
-        with io.open(os.path.join(code_dir, code_path_name, self.CODE_FILENAME), "w", encoding="utf8") as fp:
-            fp.write(text(code))
-        if options:
-            write_json(options, os.path.join(code_dir, code_path_name, self.OPTIONS_FILENAME))
+        # Each distinct code is only stored once and referenced by the history entry.
+        blob_dir = os.path.join(self.code_blobs_dir, code_hash)
+        try:
+            # Marks the code as used so `collect_code_garbage` leaves it alone.
+            os.utime(os.path.join(blob_dir, self.CODE_FILENAME))
+        except FileNotFoundError:
+            self.__makedirs(blob_dir, exist_ok=True)
+            if options:
+                self.__write(os.path.join(blob_dir, self.OPTIONS_FILENAME), pack_json(options), atomic=True)
+            # The code is written last since other users might use the blob as soon as it exists.
+            self.__write_text(os.path.join(blob_dir, self.CODE_FILENAME), code, atomic=True)
+        self.__append(self.__get_dir_for_token(token, self.CODE_HISTORY_FILENAME), msgpack.packb([ctime, code_hash]))
+        code_index = self.__get_code_index()
+        self.__append(code_index.path, CodeHashIndex.pack(code_hash, token, ctime))
 
         # Update code to be active if needed
         if set_as_active:
@@ -405,9 +1127,8 @@ class GameDB(object):
             token (str): The user's token.
             name (str): The user's name.
         """
-        assert os.path.exists(self.__get_dir_for_token(token))
-        with io.open(self.__get_dir_for_token(token, "name"), "w", encoding="utf8") as fp:
-            fp.write(text(name))
+        assert self.__exists(self.__get_dir_for_token(token))
+        self.__write_text(self.__get_dir_for_token(token, "name"), name)
 
     def save_avg_score(self, token, score):
         """Save a user's average score.
@@ -416,9 +1137,8 @@ class GameDB(object):
             token (str): The user's token.
             score (int): The user's average score.
         """
-        assert os.path.exists(self.__get_dir_for_token(token))
-        with io.open(self.__get_dir_for_token(token, "avg_score"), "w", encoding="utf8") as fp:
-            fp.write(text(score))
+        assert self.__exists(self.__get_dir_for_token(token))
+        self.__write_text(self.__get_dir_for_token(token, "avg_score"), score)
 
     def save_value(self, token, key, value):
         """Save a key value pair to a tokens directory. If a value has been saved under the same key it will be
@@ -429,48 +1149,130 @@ class GameDB(object):
             key (str):      The key to store the `value` under.
             value (str or int or float):    The value to be stored.
         """
-        assert os.path.exists(self.__get_dir_for_token(token))
+        assert self.__exists(self.__get_dir_for_token(token))
         assert isinstance(key, str) and (isinstance(value, str) or isinstance(value, int) or isinstance(value, float))
 
-        obj = {}
-        if os.path.exists(self.__get_dir_for_token(token, "db.mp.gz")):
-            obj = read_json(self.__get_dir_for_token(token, "db.mp.gz"))
-        obj[key] = value
-
-        # We write all the data to a new file then move it to replace the old file to insure that the file is never half written.
-        write_json(obj, self.__get_dir_for_token(token, "db.mp.gz.new"))
-        os.rename(self.__get_dir_for_token(token, "db.mp.gz.new"), self.__get_dir_for_token(token, "db.mp.gz"))
+        kv_log = self.__get_kv_log(token)
+        if self.__batch is not None:
+            self.__batch.save_value(kv_log.path, key, value)
+        else:
+            kv_log.set(key, value)
 
     def get_value(self, token, key, default_value=None):
-        if os.path.exists(self.__get_dir_for_token(token, "db.mp.gz")):
-            return read_json(self.__get_dir_for_token(token, "db.mp.gz")).get(key, default_value)
-        return default_value
+        return self.get_values(token).get(key, default_value)
+
+    def get_values(self, token):
+        """Returns a dict of all the key value pairs saved under a token with `save_value`."""
+        kv_log = self.__get_kv_log(token)
+        if kv_log is None:
+            return {}
+        values = kv_log.items()
+        if self.__batch is not None:
+            values.update(self.__batch.values.get(kv_log.path, {}))
+        return values
+
+    def __get_kv_log(self, token):
+        token_dir = self.__get_dir_for_token(token)
+        if token_dir is None:
+            return None
+        return self.__get_kv_log_for_path(os.path.join(token_dir, "db.mp.log"))
+
+    def __get_kv_log_for_path(self, path):
+        if path not in self.__kv_logs:
+            # Values saved before the log existed are stored in "db.mp.gz".
+            self.__kv_logs[path] = KeyValueLog(path, legacy_path=os.path.join(os.path.dirname(path), "db.mp.gz"))
+        return self.__kv_logs[path]
 
     def save_game_frames(self, gtoken, frames):
-        assert os.path.exists(self.__get_dir_for_token(gtoken))
-        write_json(frames, self.__get_dir_for_token(gtoken, "frames.mp.gz"))
+        assert self.__exists(self.__get_dir_for_token(gtoken))
+        self.__write(self.__get_dir_for_token(gtoken, "frames.mp.gz"), pack_json(frames))
 
     def set_game_player(self, gtoken, token, data=None):
-        assert os.path.exists(self.__get_dir_for_token(gtoken, "players"))
+        assert self.__exists(self.__get_dir_for_token(gtoken, "players"))
         assert self.is_user_token(token), "Token '{}' must be a user token".format(token)
-        os.makedirs(self.__get_dir_for_token(token, "games"), exist_ok=True)
-        assert os.path.exists(self.__get_dir_for_token(token, "games")), "Player token must have a games directory."
+        self.__makedirs(self.__get_dir_for_token(token, "games"), exist_ok=True)
 
-        os.makedirs(self.__get_dir_for_token(gtoken, ["players", token]))
+        self.__makedirs(self.__get_dir_for_token(gtoken, ["players", token]))
 
-        write_json(data, self.__get_dir_for_token(gtoken, ["players", token, "data.mp.gz"]))
+        self.__write(self.__get_dir_for_token(gtoken, ["players", token, "data.mp.gz"]), pack_json(data))
 
-        with open(self.__get_dir_for_token(token, ["games", gtoken]), "w"):
-            pass
+        self.__touch(self.__get_dir_for_token(token, ["games", gtoken]))
+
+        timeline_path = self.__get_dir_for_token(token, "timeline")
+        if self.__exists(timeline_path):  # Otherwise the timeline is built from the games directory when it is read.
+            self.__append(timeline_path, (gtoken + "\n").encode("utf8"))
+
+    def __index_game_timeline(self, token):
+        """Builds the game timeline for a user who played games before the timeline existed."""
+        ctimes = {}
+        for gtoken in self.__get_user_game_tokens(token):
+            try:
+                ctimes[gtoken] = self.get_ctime_for_game(gtoken)
+            except (OSError, ValueError):
+                pass  # The game is being created or deleted.
+        gtokens = sorted(ctimes, key=lambda gtoken: ctimes[gtoken])
+        with open(self.__get_dir_for_token(token, "timeline"), "ab") as fp:
+            fcntl.flock(fp, fcntl.LOCK_EX)
+            if os.fstat(fp.fileno()).st_size == 0:
+                fp.write("".join(gtoken + "\n" for gtoken in gtokens).encode("utf8"))
+
+    def __read_game_timeline(self, token):
+        timeline_path = self.__get_dir_for_token(token, "timeline")
+        if not os.path.exists(timeline_path):
+            self.__index_game_timeline(token)
+        with io.open(timeline_path, "r", encoding="utf8") as fp:
+            # The last line is either empty or still being written.
+            return fp.read().split("\n")[:-1]
+
+    def get_game_timeline(self, token):
+        """Returns the tokens of the games a user played in ordered from oldest to newest. Games dropped from the
+        timeline by `trim_game_timeline` are not included.
+        """
+        if not self.is_user_token(token):
+            raise ValueError("Invalid token")
+        return [gtoken for gtoken in self.__read_game_timeline(token) if self.is_game_token(gtoken)]
+
+    def trim_game_timeline(self, token, keep, gtokens=None):
+        """Drops everything but the newest `keep` games from a user's game timeline.
+
+        Args:
+            token (str): The user's token.
+            keep (int): The number of games to keep.
+            gtokens (set): If given only the games in this set are counted, kept and dropped. The other games stay in
+                the timeline.
+
+        Returns: A (kept, dropped) tuple of the lists of kept and dropped game tokens ordered from oldest to newest.
+        """
+        assert self.__batch is None, "Game timelines can not be trimmed within a batch."
+        if not self.is_user_token(token):
+            raise ValueError("Invalid token")
+        timeline_path = self.__get_dir_for_token(token, "timeline")
+        if not os.path.exists(timeline_path):
+            self.__index_game_timeline(token)
+
+        with open_locked(timeline_path):
+            lines = self.__read_game_timeline(token)
+            # Deleted games are dropped. Each game is looked up in the registry so cleaning up every user's timeline
+            # doesn't copy the tokens of every game once per user.
+            entries = [gtoken for gtoken in lines if self.is_game_token(gtoken)]
+            counted = [gtoken for gtoken in entries if gtokens is None or gtoken in gtokens]
+            n_dropped = max(0, len(counted) - keep)
+            dropped, kept = counted[:n_dropped], counted[n_dropped:]
+            if dropped:
+                dropped_set = set(dropped)
+                entries = [gtoken for gtoken in entries if gtoken not in dropped_set]
+            if len(entries) < len(lines):
+                write_atomic(timeline_path, "".join(gtoken + "\n" for gtoken in entries).encode("utf8"))
+        return kept, dropped
 
     def add_game_to_comp(self, ctoken, gtoken):
-        with open(self.__get_dir_for_token(ctoken, ["games", gtoken]), "w"):
-            pass
+        self.__touch(self.__get_dir_for_token(ctoken, ["games", gtoken]))
 
     def remove_game_from_comp(self, ctoken, gtoken):
-        os.remove(self.__get_dir_for_token(ctoken, ["games", gtoken]))
+        self.__remove(self.__get_dir_for_token(ctoken, ["games", gtoken]))
 
     def replace_games_in_comp(self, ctoken, new_gtokens, cleanup=True):
+        assert self.__batch is None, "The games in a competition can not be replaced within a batch."
         os.makedirs(os.path.join(self.competitions_dir, ctoken, "new_games"))
         for gtoken in new_gtokens:
             with open(self.__get_dir_for_token(ctoken, ["new_games", gtoken]), "w"):
@@ -510,16 +1312,8 @@ class GameDB(object):
             return self.__get_comp_game_tokens(token)
         raise ValueError("Invalid token")
 
-    def get_active_code_and_options(self, token):
+    def __read_code_files(self, base_path):
         code, options = None, {}
-        code_hash = self.get_value(token=token, key=self.ACTIVE_CODE_KEY)
-        should_save_code = False
-        if code_hash:
-            base_path = self.__get_dir_for_token(token, [self.CODE_DIR, code_hash])
-        else:
-            base_path = self.__get_dir_for_token(token)
-            should_save_code = True  # The code is stored in an older style. Upgrade it to the new style.
-
         code_path = os.path.join(base_path, self.CODE_FILENAME)
         options_path = os.path.join(base_path, self.OPTIONS_FILENAME)
         if os.path.exists(code_path):
@@ -527,10 +1321,112 @@ class GameDB(object):
                 code = fp.read()
         if os.path.exists(options_path):
             options = read_json(options_path)
-        if should_save_code and (code or options):
+        return code, options
+
+    def __read_code(self, token, code_key):
+        """Returns the code and options saved under `code_key` in a user's code history."""
+        base_path = self.__get_dir_for_token(token, [self.CODE_DIR, code_key])
+        if not os.path.exists(os.path.join(base_path, self.CODE_FILENAME)):
+            # Only code saved before the code store existed is stored in the history entry.
+            base_path = os.path.join(self.code_blobs_dir, code_key.split("_")[1])
+        return self.__read_code_files(base_path)
+
+    def get_active_code_and_options(self, token):
+        code_key = self.get_value(token=token, key=self.ACTIVE_CODE_KEY)
+        if code_key:
+            return self.__read_code(token, code_key)
+
+        # The code is stored in an older style. Upgrade it to the new style.
+        code, options = self.__read_code_files(self.__get_dir_for_token(token))
+        if code or options:
             self.save_code(token, code, options)
         return code, options
 
+    def __get_code_keys(self, token):
+        """Returns the `CTIME_HASH` keys of a user's code history ordered from oldest to newest."""
+        code_keys = set()
+        code_dir = self.__get_dir_for_token(token, self.CODE_DIR)
+        if os.path.exists(code_dir):
+            code_keys.update(os.listdir(code_dir))
+        history_path = self.__get_dir_for_token(token, self.CODE_HISTORY_FILENAME)
+        if os.path.exists(history_path):
+            with open(history_path, "rb") as fp:
+                for ctime, code_hash, *removed in msgpack.Unpacker(fp):
+                    if removed:
+                        code_keys.discard("{}_{}".format(ctime, code_hash))
+                    else:
+                        code_keys.add("{}_{}".format(ctime, code_hash))
+        return sorted(code_keys, key=lambda key: int(key.split("_")[0]))
+
+    def get_code_history(self, token):
+        """Returns all the code saved by a user as a list of (code key, code, options) tuples ordered from oldest to
+        newest. The code key is the `CTIME_HASH` name the code was saved under.
+        """
+        return [(code_key, *self.__read_code(token, code_key)) for code_key in self.__get_code_keys(token)]
+
+    def remove_code(self, token, code_key):
+        """Removes code from a user's code history. The code itself is removed by `collect_code_garbage` once it is no
+        longer in any user's code history.
+
+        Args:
+            token (str): The user's token.
+            code_key (str): The `CTIME_HASH` name the code was saved under.
+        """
+        assert self.__batch is None, "Code can not be removed within a batch."
+        if not self.is_user_token(token) or code_key not in self.__get_code_keys(token):
+            raise ValueError("Token '{}' has no code '{}'".format(token, code_key))
+        if code_key == self.get_value(token, self.ACTIVE_CODE_KEY):
+            raise ValueError("The active code can not be removed.")
+
+        ctime, code_hash = code_key.split("_")
+        entry_dir = self.__get_dir_for_token(token, [self.CODE_DIR, code_key])
+        if os.path.exists(entry_dir):
+            shutil.rmtree(entry_dir)
+        else:
+            append_locked(
+                self.__get_dir_for_token(token, self.CODE_HISTORY_FILENAME),
+                msgpack.packb([int(ctime), code_hash, True]),
+            )
+        self.__get_code_index().remove(code_hash, token, int(ctime))
+        append_locked(self.code_garbage_path, msgpack.packb([code_hash, time.time()]))
+
+    def collect_code_garbage(self, grace_period=CODE_GC_GRACE_PERIOD):
+        """Removes the stored code which is no longer in any user's code history and hasn't been removed from or saved
+        to one for `grace_period` seconds.
+
+        Only the code removed from a code history since the last collection is checked, not every stored code.
+
+        Returns: The number of distinct codes removed.
+        """
+        if not os.path.exists(self.code_garbage_path):
+            return 0
+        code_index = self.__get_code_index()
+        removed = 0
+        with open_locked(self.code_garbage_path):
+            removed_at = {}
+            with open(self.code_garbage_path, "rb") as fp:
+                for code_hash, when in msgpack.Unpacker(fp):
+                    removed_at[code_hash] = max(when, removed_at.get(code_hash, when))
+
+            pending = []
+            for code_hash, when in removed_at.items():
+                if code_index.get_owners(code_hash):
+                    continue  # The code is still in another code history or was saved again.
+                blob_dir = os.path.join(self.code_blobs_dir, code_hash)
+                try:
+                    when = max(when, os.stat(os.path.join(blob_dir, self.CODE_FILENAME)).st_mtime)
+                except FileNotFoundError:
+                    continue  # Legacy code which was only stored in the code history.
+                if time.time() - when < grace_period:
+                    pending += [(code_hash, when)]
+                    continue
+                shutil.rmtree(blob_dir, ignore_errors=True)
+                removed += 1
+
+            # The log is only rewritten while holding the lock. See `open_locked`.
+            write_atomic(self.code_garbage_path, b"".join(msgpack.packb(entry) for entry in pending))
+        return removed
+
     def get_name(self, token):
         if self.is_user_token(token) or self.is_school_token(token) or self.is_comp_token(token):
             if os.path.exists(self.__get_dir_for_token(token, "name")):
@@ -551,10 +1447,28 @@ class GameDB(object):
             return default_value
 
     def get_school_for_token(self, token):
-        for school in self.__get_school_tokens():
-            if token in self.__get_school_user_tokens(school):
-                return school
-        return None
+        if token in self.__school_for_token:
+            return self.__school_for_token[token]
+        if not self.is_user_token(token):
+            return None
+
+        school_path = self.__get_dir_for_token(token, "school")
+        school = None
+        if os.path.exists(school_path):
+            with io.open(school_path, "r", encoding="utf8") as fp:
+                school = fp.read() or None
+        if school is None:
+            # The user was created before users were indexed by school. Find the school and index it now.
+            for school_tk in self.__get_school_tokens():
+                if token in self.__get_school_user_tokens(school_tk):
+                    school = school_tk
+                    with io.open(school_path, "w", encoding="utf8") as fp:
+                        fp.write(text(school))
+                    break
+
+        if school is not None:
+            self.__school_for_token[token] = school
+        return school
 
     # Get tokens that belong to a school
     def get_tokens_for_school(self, school_tk):
@@ -577,21 +1491,70 @@ class GameDB(object):
         return self.__get_exception_tokens()
 
     def delete_game(self, gtoken):
-        # TODO: add a test for this method
+        """Deletes a game. The game is only moved to the deleted games, the references to it from its players and
+        competitions are removed later by `reap_deleted_games`.
+        """
+        assert self.__batch is None, "Games can not be deleted within a batch."
         assert self.is_game_token(gtoken)
-        for player in self.get_players_for_game(gtoken):
-            os.remove(self.__get_dir_for_token(player, ["games", gtoken]))
-        if gtoken in self.get_games_for_token("P00000000"):  # TODO: remove game from all comps where it is used.
-            self.remove_game_from_comp("P00000000", gtoken)
-        shutil.rmtree(self.__get_dir_for_token(gtoken))
+        os.rename(self.__get_dir_for_token(gtoken), os.path.join(self.deleted_games_dir, gtoken))
+        self.__game_tokens.discard(gtoken)
+        self.__deleted_game_tokens.add(gtoken)
+
+    def reap_deleted_games(self, limit=None):
+        """Removes the games deleted with `delete_game` and all the references to them. This is safe to run while
+        other processes use the database, including other reapers.
+
+        Args:
+            limit (int): The maximum number of games to reap. All deleted games are reaped if None.
+
+        Returns: A dict of throughput metrics: the number of "games" reaped, the number of "references" removed, the
+            "seconds" it took and the "games_per_second".
+        """
+        start_time = time.time()
+        gtokens = self.__deleted_game_tokens.tokens()[:limit]
+        references = []
+        for gtoken in gtokens:
+            try:
+                players = os.listdir(os.path.join(self.deleted_games_dir, gtoken, "players"))
+            except FileNotFoundError:
+                players = []  # Reaped by another process.
+            references += [os.path.join(self.data_dir, player, "games", gtoken) for player in players]
+        if gtokens:
+            for ctoken in self.__get_comp_tokens():
+                comp_games_dir = os.path.join(self.competitions_dir, ctoken, "games")
+                if os.path.exists(comp_games_dir):
+                    references += [
+                        os.path.join(comp_games_dir, gtoken)
+                        for gtoken in set(gtokens) & set(os.listdir(comp_games_dir))
+                    ]
+
+        removed_references = 0
+        for path in references:
+            try:
+                os.remove(path)
+                removed_references += 1
+            except FileNotFoundError:
+                pass
+        for gtoken in gtokens:
+            shutil.rmtree(os.path.join(self.deleted_games_dir, gtoken), ignore_errors=True)
+            self.__deleted_game_tokens.discard(gtoken)
+
+        seconds = time.time() - start_time
+        return {
+            "games": len(gtokens),
+            "references": removed_references,
+            "seconds": seconds,
+            "games_per_second": len(gtokens) / seconds if seconds > 0 else 0.0,
+        }
 
     def save_exception(self, exception_report):
-        token = self.__get_new_token(self.__get_exception_tokens(), prefix="E")
+        token = self.__get_new_token(self.__exception_tokens, prefix="E")
 
-        os.makedirs(os.path.join(self.exception_dir, token))
+        self.__makedirs(os.path.join(self.exception_dir, token))
+        self.__add_token(self.__exception_tokens, token)
 
         p = self.__get_dir_for_token(token, "report.mp.gz")
-        write_json(exception_report, p)
+        self.__write(p, pack_json(exception_report))
 
         return token
 
@@ -602,20 +1565,41 @@ class GameDB(object):
         if os.path.exists(self.__get_dir_for_token(token, "report.mp.gz")):
             return read_json(self.__get_dir_for_token(token, "report.mp.gz"))
 
+    def __get_code_index(self):
+        if not self.__code_index.exists():
+            # The code was saved before it was indexed by hash.
+            entries = []
+            for utoken in self.__get_user_tokens():
+                for code_key in self.__get_code_keys(utoken):
+                    ctime, code_hash = code_key.split("_")
+                    entries += [(code_hash, utoken, int(ctime))]
+            self.__code_index.build(entries)
+        return self.__code_index
+
+    def find_code_hashes(self, code_hash_prefix):
+        """Returns the sorted list of the hashes of saved code which start with `code_hash_prefix`."""
+        return self.__get_code_index().find(code_hash_prefix)
+
     def get_code_by_hash(self, code_hash_prefix):
         """Returns the code for the code hash or a list of hashes if the code hash prefix matches multiple codes."""
-        matching_hashes_to_path = {}
-        for utoken in self.__get_user_tokens():
-            user_code_path = self.__get_dir_for_token(utoken, self.CODE_DIR)
-            if os.path.exists(user_code_path):
-                for code_key in os.listdir(user_code_path):
-                    timestamp, code_hash = code_key.split("_")
-                    if code_hash.startswith(code_hash_prefix):
-                        matching_hashes_to_path[code_hash] = self.__get_dir_for_token(utoken, [self.CODE_DIR, code_key])
-
-        if len(matching_hashes_to_path) == 1:
-            path = os.path.join(list(matching_hashes_to_path.values())[0], self.CODE_FILENAME)
-            with io.open(path, "r", encoding="utf8") as fp:
-                return fp.read()
-
-        return list(matching_hashes_to_path.keys())
+        matching_hashes = self.find_code_hashes(code_hash_prefix)
+        if len(matching_hashes) == 1:
+            utoken, ctime = self.get_code_owners(matching_hashes[0])[0]
+            code, options = self.__read_code(utoken, "{}_{}".format(ctime, matching_hashes[0]))
+            return code
+
+        return matching_hashes
+
+    def get_code_and_options_by_hash(self, code_hash):
+        """Returns the code and options with the hash `code_hash`. The code is None if no such code is saved."""
+        owners = self.get_code_owners(code_hash)
+        if not owners:
+            return None, {}
+        utoken, ctime = owners[0]
+        return self.__read_code(utoken, "{}_{}".format(ctime, code_hash))
+
+    def get_code_owners(self, code_hash):
+        """Returns who saved the code with the hash `code_hash` as a list of (token, ctime) tuples ordered from oldest
+        to newest. The ctime is the time the code was saved in nanoseconds since the epoch.
+        """
+        return self.__get_code_index().get_owners(code_hash)
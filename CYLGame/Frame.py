@@ -4,6 +4,11 @@ from copy import copy, deepcopy
 
 from CYLGame.Sprite import Char
 
+try:
+    import numpy
+except ImportError:  # numpy is optional. It is only needed for ArrayGridFrameBuffer. See the "fast-frames" extra.
+    numpy = None
+
 GRID_CHAR_TYPE = Union[int, str, Char]
 
 
@@ -42,6 +47,12 @@ class GridFrameBuffer(FrameBuffer):
         self.arr = []
         for i in range(height):
             self.arr += [[ord(init_value)] * width]
+        # The chars of the cells which were changed since the dirty cells were last cleared, by position. Every cell is
+        # dirty until then.
+        self._dirty = {}
+        self._all_dirty = True
+        # Counts the writes which changed each row, so a panel can tell whether its rows were drawn over.
+        self._row_versions = [0] * height
 
     @classmethod
     def from_string_array(cls, frame):
@@ -56,6 +67,8 @@ class GridFrameBuffer(FrameBuffer):
     def __eq__(self, other):
         if self.x != other.x or self.y != other.y:
             return False
+        if isinstance(other, ArrayGridFrameBuffer):
+            return other == self
         return self.arr == other.arr
 
     def __str__(self):
@@ -79,16 +92,199 @@ class GridFrameBuffer(FrameBuffer):
             raise IndexError("Trying to draw out of bounds at ({}, {})".format(x, y))
         if self.charset and not self.charset.is_char_valid(char):
             raise ValueError(f"Trying to draw invalid char {char}")
-        self.arr[y][x] = char
+        self._write(x, y, char)
+
+    def _write(self, x, y, char):
+        old_char = self.arr[y][x]
+        if old_char != char:
+            if not self._all_dirty:
+                self._dirty.setdefault((x, y), old_char)
+            self.arr[y][x] = char
+            self._row_versions[y] += 1
+
+    def _write_row(self, x, y, row):
+        old_row = self.arr[y][x : x + len(row)]
+        if old_row != row:
+            if not self._all_dirty:
+                for i, (old_char, char) in enumerate(zip(old_row, row)):
+                    if old_char != char:
+                        self._dirty.setdefault((x + i, y), old_char)
+            self.arr[y][x : x + len(row)] = row
+            self._row_versions[y] += 1
+
+    def _check_rect(self, x, y, width, height):
+        if not (0 <= x and x + width <= self.x and 0 <= y and y + height <= self.y):
+            raise IndexError("Trying to draw out of bounds at ({}, {}) to ({}, {})".format(x, y, x + width, y + height))
+
+    def _check_chars(self, chars):
+        """Checks a batch of chars at once. The valid chars of a charset are a range so only the smallest and largest
+        chars need to be checked.
+        """
+        if self.charset and chars:
+            for char in (min(chars), max(chars)):
+                if not self.charset.is_char_valid(char):
+                    raise ValueError(f"Trying to draw invalid char {char}")
+
+    @staticmethod
+    def _to_ints(chars):
+        if isinstance(chars, str):
+            return list(map(ord, chars))
+        return list(map(grid_char_to_int, chars))
+
+    def set_row(self, x, y, chars):
+        """Sets a row of cells starting at (x, y). The row is validated once instead of once per cell.
+
+        Args:
+            x(int):
+            y(int):
+            chars(Union[str, List[GRID_CHAR_TYPE]]):
+        """
+        row = self._to_ints(chars)
+        self._check_rect(x, y, len(row), 1)
+        self._check_chars(row)
+        self._write_row(x, y, row)
+
+    def set_many(self, cells):
+        """Sets many cells at once. The cells are all validated before any of them are set.
+
+        Args:
+            cells(Iterable[Tuple[int, int, GRID_CHAR_TYPE]]): The (x, y, char) of each cell.
+        """
+        cells = [(x, y, grid_char_to_int(char)) for x, y, char in cells]
+        if not cells:
+            return
+        xs, ys, chars = zip(*cells)
+        min_x, max_x, min_y, max_y = min(xs), max(xs), min(ys), max(ys)
+        if not (0 <= min_x and max_x < self.x and 0 <= min_y and max_y < self.y):
+            raise IndexError("Trying to draw out of bounds at ({}, {}) to ({}, {})".format(min_x, min_y, max_x, max_y))
+        self._check_chars(chars)
+        for x, y, char in cells:
+            self._write(x, y, char)
+
+    def blit_map(self, x, y, chars):
+        """Sets the cells of a sparse map with its top left corner at (x, y).
+
+        Args:
+            x(int):
+            y(int):
+            chars(Dict[Tuple[int, int], GRID_CHAR_TYPE]): The chars by their position in the map.
+        """
+        self.set_many((x + pos[0], y + pos[1], char) for pos, char in chars.items())
+
+    def fill(self, char, x=0, y=0, width=None, height=None):
+        """Sets every cell of a rectangle to `char`. By default the whole buffer is filled.
+
+        Args:
+            char(GRID_CHAR_TYPE):
+            x(int):
+            y(int):
+            width(int):
+            height(int):
+        """
+        width = self.x - x if width is None else width
+        height = self.y - y if height is None else height
+        self._check_rect(x, y, width, height)
+        char = grid_char_to_int(char)
+        self._check_chars([char])
+        for j in range(y, y + height):
+            self._write_row(x, j, [char] * width)
+
+    def blit_rect(self, x, y, chars):
+        """Copies a rectangle of chars into the buffer with its top left corner at (x, y).
+
+        Args:
+            x(int):
+            y(int):
+            chars(List[List[GRID_CHAR_TYPE]]): The rows of the rectangle. Rows may also be strings.
+        """
+        rows = list(map(self._to_ints, chars))
+        if not rows:
+            return
+        self._check_rect(x, y, len(rows[0]), len(rows))
+        self._check_chars([char for row in rows for char in row])
+        for i, row in enumerate(rows):
+            self._write_row(x, y + i, row)
 
-    def draw_to_surface(self, surface):
+    def draw_text(self, x, y, text):
+        """Draws a line of text starting at (x, y)."""
+        self.blit_rect(x, y, [text])
+
+    def get_row_version(self, y):
+        """Returns a number which changes whenever a cell of the row y changes."""
+        return self._row_versions[y]
+
+    def diff(self, other):
+        """
+
+        Args:
+            other(GridFrameBuffer): A frame buffer of the same size.
+
+        Returns:
+            List[Tuple[int, int]]: The (x, y) positions of the cells which differ between the frame buffers.
+        """
+        if isinstance(other, ArrayGridFrameBuffer):
+            return other.diff(self)
+        assert self.x == other.x and self.y == other.y, "Frame buffers must be the same size"
+        positions = []
+        for y, (row, other_row) in enumerate(zip(self.arr, other.arr)):
+            if row != other_row:
+                positions += [(x, y) for x, (a, b) in enumerate(zip(row, other_row)) if a != b]
+        return positions
+
+    def get_dirty(self):
+        """
+
+        Returns:
+            List[Tuple[int, int]]: The (x, y) positions, in row major order, of the cells which changed since the dirty
+                cells were last cleared. Every cell is dirty before then.
+        """
+        if self._all_dirty:
+            return [(x, y) for y in range(self.y) for x in range(self.x)]
+        return sorted(
+            (pos for pos, old_char in self._dirty.items() if self.arr[pos[1]][pos[0]] != old_char),
+            key=lambda pos: (pos[1], pos[0]),
+        )
+
+    def clear_dirty(self):
+        self._dirty = {}
+        self._all_dirty = False
+
+    def mark_all_dirty(self):
+        self._dirty = {}
+        self._all_dirty = True
+
+    def pop_dirty_cells(self):
+        """Returns the dirty cells and clears them.
+
+        Returns:
+            List[Tuple[int, int, int]]: The (x, y, char) of each dirty cell in row major order.
+        """
+        cells = [(x, y, self.arr[y][x]) for x, y in self.get_dirty()]
+        self.clear_dirty()
+        return cells
+
+    def draw_to_surface(self, surface, full=False):
+        """Draws the cells which changed since the last draw. This clears the dirty cells.
+
+        Args:
+            surface(pygame.Surface):
+            full(bool): if True draw every cell. This is needed when drawing to a new surface.
+        """
         if not self.charset:
             raise ValueError("CharSet must be set if you would like to draw anything!")
+        if full:
+            self.mark_all_dirty()
+        cells = self.pop_dirty_cells()
         # TODO: handle background better
-        surface.fill((0, 0, 0))
-        for y, row in enumerate(self.arr):
-            for x, char in enumerate(row):
-                surface.blit(self.charset.get_img(char), self.charset.char_size_to_pix((x, y)))
+        redraw_all = len(cells) == self.x * self.y
+        if redraw_all:
+            surface.fill((0, 0, 0))
+        char_size = self.charset.char_size_to_pix((1, 1))
+        for x, y, char in cells:
+            pos = self.charset.char_size_to_pix((x, y))
+            if not redraw_all:
+                surface.fill((0, 0, 0), (pos, char_size))
+            surface.blit(self.charset.get_img(char), pos)
 
     def dump(self):
         """
@@ -98,6 +294,313 @@ class GridFrameBuffer(FrameBuffer):
         """
         return list(map(copy, self.arr))
 
+    def capture(self):
+        """
+
+        Returns:
+            A copy of the frame buffer's grid which is used as a frame of the game.
+        """
+        return self.dump()
+
+
+class ArrayGridFrameBuffer(GridFrameBuffer):
+    """A GridFrameBuffer which stores its grid in a contiguous `uint16` numpy array. Filling and blitting are
+    vectorized and capturing a frame is a single copy of the array. This requires numpy.
+    """
+
+    def __init__(self, width, height, charset=None, init_value="\x00"):
+        if numpy is None:
+            raise ImportError("ArrayGridFrameBuffer requires numpy. Install CYLGame with the 'fast-frames' extra.")
+        self.x = width
+        self.y = height
+        self.charset = charset
+        self.arr = numpy.full((height, width), ord(init_value), dtype=numpy.uint16)
+        # The cells which were written since the dirty cells were last cleared, and the grid at that time.
+        self._dirty = numpy.zeros((height, width), dtype=bool)
+        self._clean = self.arr.copy()
+        self._all_dirty = True
+        self._row_versions = numpy.zeros(height, dtype=numpy.int64)
+
+    @classmethod
+    def from_string_array(cls, frame):
+        assert len(frame), "Frame must contain something"
+        buf = cls(len(frame[0]), len(frame))
+        buf.blit_rect(0, 0, frame)
+        return buf
+
+    def __eq__(self, other):
+        if self.x != other.x or self.y != other.y:
+            return False
+        return bool(numpy.array_equal(self.arr, other.arr))
+
+    def __str__(self):
+        return "\n".join(["".join(map(chr, x)) for x in self.arr.tolist()])
+
+    def __repr__(self):
+        return "<ArrayGridFrameBuffer: '{}'".format(str(self).replace("\n", "\\n"))
+
+    def __to_array(self, chars):
+        if isinstance(chars, numpy.ndarray):
+            arr = numpy.atleast_2d(chars)
+        elif len(chars) == 0:
+            arr = numpy.zeros((0, 0), dtype=numpy.int64)
+        elif isinstance(chars[0], str):
+            arr = numpy.array([[ord(c) for c in row] for row in chars], dtype=numpy.int64)
+        else:
+            arr = numpy.array([[grid_char_to_int(c) for c in row] for row in chars], dtype=numpy.int64)
+        if arr.size:
+            low, high = int(arr.min()), int(arr.max())
+            if low < 0 or high > numpy.iinfo(numpy.uint16).max:
+                raise ValueError(f"Trying to draw invalid char {low if low < 0 else high}")
+            if self.charset:
+                for char in (low, high):
+                    if not self.charset.is_char_valid(char):
+                        raise ValueError(f"Trying to draw invalid char {char}")
+        return arr
+
+    def set(self, x, y, char):
+        char = grid_char_to_int(char)
+        if not (0 <= x < self.x):
+            raise IndexError("Trying to draw out of bounds at ({}, {})".format(x, y))
+        if not (0 <= y < self.y):
+            raise IndexError("Trying to draw out of bounds at ({}, {})".format(x, y))
+        if self.charset and not self.charset.is_char_valid(char):
+            raise ValueError(f"Trying to draw invalid char {char}")
+        if self.arr[y, x] != char:
+            self.arr[y, x] = char
+            self._dirty[y, x] = True
+            self._row_versions[y] += 1
+
+    def fill(self, char, x=0, y=0, width=None, height=None):
+        width = self.x - x if width is None else width
+        height = self.y - y if height is None else height
+        self._check_rect(x, y, width, height)
+        char = self.__to_array([[char]])[0, 0]
+        region = self.arr[y : y + height, x : x + width]
+        changed = region != char
+        self._dirty[y : y + height, x : x + width] |= changed
+        self._row_versions[y : y + height] += changed.any(axis=1)
+        region[...] = char
+
+    def blit_rect(self, x, y, chars):
+        arr = self.__to_array(chars)
+        self._check_rect(x, y, arr.shape[1], arr.shape[0])
+        region = self.arr[y : y + arr.shape[0], x : x + arr.shape[1]]
+        changed = region != arr
+        self._dirty[y : y + arr.shape[0], x : x + arr.shape[1]] |= changed
+        self._row_versions[y : y + arr.shape[0]] += changed.any(axis=1)
+        region[...] = arr
+
+    def set_row(self, x, y, chars):
+        self.blit_rect(x, y, [chars])
+
+    def get_row_version(self, y):
+        return int(self._row_versions[y])
+
+    def set_many(self, cells):
+        cells = [(x, y, grid_char_to_int(char)) for x, y, char in cells]
+        if not cells:
+            return
+        xs, ys, chars = numpy.array(cells, dtype=numpy.int64).T
+        chars = self.__to_array(chars)[0]
+        if not (0 <= xs.min() and xs.max() < self.x and 0 <= ys.min() and ys.max() < self.y):
+            raise IndexError(
+                "Trying to draw out of bounds at ({}, {}) to ({}, {})".format(xs.min(), ys.min(), xs.max(), ys.max())
+            )
+        changed = self.arr[ys, xs] != chars
+        self._dirty[ys[changed], xs[changed]] = True
+        numpy.add.at(self._row_versions, ys[changed], 1)
+        self.arr[ys, xs] = chars
+
+    def diff(self, other):
+        assert self.x == other.x and self.y == other.y, "Frame buffers must be the same size"
+        ys, xs = numpy.nonzero(self.arr != numpy.asarray(other.arr))
+        return list(zip(xs.tolist(), ys.tolist()))
+
+    def __dirty_indices(self):
+        if self._all_dirty:
+            return numpy.arange(self.arr.size)
+        indices = numpy.flatnonzero(self._dirty)
+        return indices[self.arr.ravel()[indices] != self._clean.ravel()[indices]]
+
+    def get_dirty(self):
+        indices = self.__dirty_indices()
+        return list(zip((indices % self.x).tolist(), (indices // self.x).tolist()))
+
+    def clear_dirty(self):
+        if self._all_dirty:
+            self._clean[...] = self.arr
+        else:
+            self._clean[self._dirty] = self.arr[self._dirty]
+        self._dirty[...] = False
+        self._all_dirty = False
+
+    def mark_all_dirty(self):
+        self._all_dirty = True
+
+    def pop_dirty_cells(self):
+        indices = self.__dirty_indices()
+        cells = list(zip((indices % self.x).tolist(), (indices // self.x).tolist(), self.arr.ravel()[indices].tolist()))
+        self.clear_dirty()
+        return cells
+
+    def dump(self):
+        """
+
+        Returns:
+            numpy.ndarray: a read-only view of the frame buffer's grid. It changes when the frame buffer is drawn to.
+        """
+        view = self.arr.view()
+        view.flags.writeable = False
+        return view
+
+    def dump_bytes(self):
+        """
+
+        Returns:
+            bytes: the frame buffer's grid as little endian uint16s in row major order.
+        """
+        return self.arr.astype("<u2", copy=False).tobytes()
+
+    def capture(self):
+        return self.arr.copy()
+
+
+def frame_to_list(frame):
+    """Converts a frame captured from an ArrayGridFrameBuffer to lists so it can be serialized."""
+    return frame.tolist() if numpy is not None and isinstance(frame, numpy.ndarray) else frame
+
+
+class DeltaFrames(object):
+    """Captures the frames of a grid game as a keyframe every `keyframe_interval` frames and only the cells which
+    changed in the frames between them. Most turns only change a few cells so this is much smaller than full frames.
+
+    The dumped format is a dict with "format", "width", "keyframe_interval" and "frames". Every `keyframe_interval`th
+    frame is a full grid and every other frame is a flat list of cell index and char pairs, `[i0, c0, i1, c1, ...]`,
+    where the index of a cell is `y * width + x`.
+    """
+
+    FORMAT = "delta"
+    DEFAULT_KEYFRAME_INTERVAL = 100
+
+    def __init__(self, keyframe_interval=DEFAULT_KEYFRAME_INTERVAL):
+        assert keyframe_interval > 0, "The keyframe interval must be positive"
+        self.keyframe_interval = keyframe_interval
+        self.width = 0
+        self.frames = []
+        self.__last_frame = None
+
+    def __len__(self):
+        return len(self.frames)
+
+    def append(self, frame):
+        """
+        Args:
+            frame(List[List[int]]): A full frame, or a frame captured from an ArrayGridFrameBuffer. The frame is not
+                modified or kept.
+        """
+        if numpy is not None and isinstance(frame, numpy.ndarray):
+            self.__append_array(frame)
+            return
+        if not self.needs_keyframe:
+            assert self.__last_frame is not None, "Frames after append_changes must be appended with append_changes"
+        if self.needs_keyframe:
+            if not self.frames:
+                self.width = len(frame[0]) if frame else 0
+            self.frames += [list(map(copy, frame))]
+        else:
+            diff = []
+            for y, (row, last_row) in enumerate(zip(frame, self.__last_frame)):
+                if row != last_row:
+                    for x, (char, last_char) in enumerate(zip(row, last_row)):
+                        if char != last_char:
+                            diff += [y * self.width + x, char]
+            self.frames += [diff]
+        self.__last_frame = list(map(copy, frame))
+
+    @property
+    def needs_keyframe(self):
+        """True if the next frame is a keyframe."""
+        return len(self.frames) % self.keyframe_interval == 0
+
+    def append_changes(self, cells):
+        """Appends a frame which isn't a keyframe by the cells which changed since the previous frame.
+
+        Args:
+            cells(List[Tuple[int, int, int]]): The (x, y, char) of each changed cell, e.g. from
+                `GridFrameBuffer.pop_dirty_cells`.
+        """
+        assert not self.needs_keyframe, "Keyframes must be appended with append"
+        diff = []
+        for x, y, char in cells:
+            diff += [y * self.width + x, char]
+        self.frames += [diff]
+        self.__last_frame = None
+
+    def __append_array(self, frame):
+        if not self.needs_keyframe:
+            assert self.__last_frame is not None, "Frames after append_changes must be appended with append_changes"
+        if self.needs_keyframe:
+            if not self.frames:
+                self.width = frame.shape[1]
+            self.frames += [frame.tolist()]
+        else:
+            changed = numpy.flatnonzero(frame != self.__last_frame)
+            diff = numpy.empty(changed.size * 2, dtype=numpy.int64)
+            diff[0::2] = changed
+            diff[1::2] = frame.ravel()[changed]
+            self.frames += [diff.tolist()]
+        self.__last_frame = frame.copy()
+
+    def dump(self):
+        """
+
+        Returns:
+            dict: The frames in the delta format.
+        """
+        return {
+            "format": self.FORMAT,
+            "width": self.width,
+            "keyframe_interval": self.keyframe_interval,
+            "frames": self.frames,
+        }
+
+
+def is_delta_frames(frames):
+    return isinstance(frames, dict) and frames.get("format") == DeltaFrames.FORMAT
+
+
+def expand_frames(frames):
+    """Expands frames dumped by `DeltaFrames` into full frames. Any other frames are returned as is.
+
+    Args:
+        frames: The frames of a game.
+
+    Returns:
+        list: A frame for each turn. Note: unchanged rows are shared between frames.
+    """
+    if not is_delta_frames(frames):
+        return frames
+    width = frames["width"]
+    interval = frames["keyframe_interval"]
+    full_frames = []
+    cur = None
+    for i, frame in enumerate(frames["frames"]):
+        if i % interval == 0:
+            cur = list(map(copy, frame))
+        else:
+            # Rows which don't change are shared with the previous frame.
+            cur = list(cur)
+            copied_rows = set()
+            for j in range(0, len(frame), 2):
+                y, x = divmod(frame[j], width)
+                if y not in copied_rows:
+                    cur[y] = copy(cur[y])
+                    copied_rows.add(y)
+                cur[y][x] = frame[j + 1]
+        full_frames += [cur]
+    return full_frames
+
 
 # TODO: given this class a better name.
 class GameFrame(FrameBuffer):
@@ -1,15 +1,16 @@
 from __future__ import division
 
-from typing import List, Optional, Type
+from typing import List, Optional, Tuple, Type
 
 import os.path
+import pickle
 import random
 import sys
 from dataclasses import dataclass
 from pathlib import Path
 
-from CYLGame.Frame import GridFrameBuffer
-from CYLGame.Player import Player, UserProg
+from CYLGame.Frame import DeltaFrames, GridFrameBuffer, frame_to_list
+from CYLGame.Player import Player, Room, UserProg
 from CYLGame.Sprite import SpriteSet
 from CYLGame.structures.const_mapping import ConstMapping
 from CYLGame.Utils import int2base
@@ -55,6 +56,9 @@ class Game(object):
     GAME_TITLE = ""
     OPTIONS: Optional[str] = None
     MULTIPLAYER = False  # TODO: document
+    # Bump the version when a change to the game makes the same seed and bots play out differently. Games saved by
+    # seed (see `GameRunner.get_replay`) are only replayed by the same version of the game.
+    VERSION = 1
 
     def __init__(self, random):
         self.random = random
@@ -137,6 +141,8 @@ class GridGame(Game):
     CHAR_HEIGHT = 8
     GAME_TITLE = ""
     CHAR_SET = data_file("fonts/terminal8x8_gs_ro.png")
+    # Set to ArrayGridFrameBuffer to capture frames with numpy.
+    FRAME_BUFFER_CLASS = GridFrameBuffer
     __frame_buffer = None
 
     def is_running(self):
@@ -161,11 +167,29 @@ class GridGame(Game):
         """
         raise Exception("Not implemented!")
 
-    def get_frame(self):
+    def __draw_frame(self):
         if self.__frame_buffer is None:
-            self.__frame_buffer = GridFrameBuffer(self.SCREEN_WIDTH, self.SCREEN_HEIGHT, charset=self.get_sprite_set())
+            self.__frame_buffer = self.FRAME_BUFFER_CLASS(
+                self.SCREEN_WIDTH, self.SCREEN_HEIGHT, charset=self.get_sprite_set()
+            )
         self.draw_screen(self.__frame_buffer)
-        return self.__frame_buffer.dump()
+        return self.__frame_buffer
+
+    def get_frame(self):
+        frame_buffer = self.__draw_frame()
+        frame_buffer.clear_dirty()
+        return frame_buffer.capture()
+
+    def get_frame_changes(self):
+        """Draws the screen like `get_frame` but only returns the cells which changed since the last frame.
+
+        Returns:
+            List[Tuple[int, int, int]]: The (x, y, char) of each changed cell. None if the game overrides `get_frame`,
+                since then the changes can't be told from the frame buffer. Use `get_frame` instead.
+        """
+        if type(self).get_frame is not GridGame.get_frame:
+            return None
+        return self.__draw_frame().pop_dirty_cells()
 
     def get_vars(self, player):
         """TODO: write this"""
@@ -223,18 +247,35 @@ class PlayGameState:
 
     moves: str
     frame: Optional[List[List[int]]]
+    # The (x, y, char) of the cells which changed with the last move.
+    changes: Optional[List[Tuple[int, int, int]]] = None
+
+    def snapshot(self) -> bytes:
+        """Serializes the whole state so that `restore` can make an independent copy of it later. Games which hold
+        things that can't be pickled should implement `__getstate__` and `__setstate__`.
+
+        Raises:
+            pickle.PicklingError, TypeError or AttributeError: If the state can't be pickled.
+        """
+        return pickle.dumps(self, protocol=pickle.HIGHEST_PROTOCOL)
+
+    @staticmethod
+    def restore(snapshot: bytes) -> "PlayGameState":
+        return pickle.loads(snapshot)
 
 
 class GameRunner(object):
     def __init__(self, game_class: Type[Game]):
         self.game_class = game_class  # type: Type[Game]
 
-    def run(self, room, playback=True):
+    def run(self, room, playback=True, keyframe_interval=DeltaFrames.DEFAULT_KEYFRAME_INTERVAL):
         """The the game.
 
         Args:
             room(Room): The room to play.
             playback(bool): if True save the playback.
+            keyframe_interval(int): The frames of grid games are saved with `DeltaFrames` using this keyframe interval.
+                If None full frames are saved.
 
         Returns:
             Room:
@@ -256,10 +297,20 @@ class GameRunner(object):
 
         game.start_game()
 
-        screen_cap = []
+        if playback and keyframe_interval is not None and issubclass(self.game_class, GridGame):
+            screen_cap = DeltaFrames(keyframe_interval)
+        else:
+            screen_cap = []
         while game.is_running():
-            if playback:
-                screen_cap += [game.get_frame()]
+            if isinstance(screen_cap, DeltaFrames):
+                changes = None if screen_cap.needs_keyframe else game.get_frame_changes()
+                if changes is None:
+                    # The changes of a game which overrides `get_frame` are found by comparing its frames.
+                    screen_cap.append(game.get_frame())
+                else:
+                    screen_cap.append_changes(changes)
+            elif playback:
+                screen_cap.append(frame_to_list(game.get_frame()))
 
             for player in players:
                 player.run_turn(game.random)
@@ -268,25 +319,71 @@ class GameRunner(object):
 
         room.score = game.get_score()
         if playback:
-            room.screen_cap = screen_cap
+            room.screen_cap = screen_cap.dump() if isinstance(screen_cap, DeltaFrames) else screen_cap
             for player in players:
                 room.debug_vars[player.prog] = player.debug_vars
 
         return room
 
-    def run_for_avg_score(self, room, times=1, func=average):
+    def get_replay(self, room):
+        """Returns the inputs needed to replay the room with `replay`. The room's frames can be regenerated from them
+        since games are deterministic given the seed and the bots.
+
+        Args:
+            room(Room): The room to replay.
+
+        Returns:
+            dict: The seed, the version of the game and the bots. None if a bot can't be recreated since it has no
+                saved code.
+        """
+        computer_prog_class = self.game_class.default_prog_for_computer() if self.game_class.MULTIPLAYER else None
+        bots = []
+        for bot in room.bots:
+            if computer_prog_class is not None and type(bot) is computer_prog_class:
+                bots += [{"computer": True}]
+            elif getattr(bot, "code_hash", None) not in (None, "N/A"):
+                bots += [{"code_hash": bot.code_hash, "token": bot.token, "name": bot.name}]
+            else:
+                return None
+        return {"seed": int2base(room.seed, 36), "version": self.game_class.VERSION, "bots": bots}
+
+    def replay(self, replay, load_prog):
+        """Runs a room from the inputs returned by `get_replay` again with playback.
+
+        Args:
+            replay(dict): The inputs returned by `get_replay`.
+            load_prog(function): Returns the Prog of a bot given its code hash, token and name.
+
+        Returns:
+            Room:
+        """
+        if replay["version"] != self.game_class.VERSION:
+            raise ValueError("The game was played by version {} of the game.".format(replay["version"]))
+        bots = []
+        for bot in replay["bots"]:
+            if bot.get("computer", False):
+                bots += [self.game_class.default_prog_for_computer()()]
+            else:
+                bots += [load_prog(bot["code_hash"], bot["token"], bot["name"])]
+        return self.run(Room(bots, seed=int(replay["seed"], 36)), playback=True)
+
+    def run_for_avg_score(self, room, times=1, func=average, pool=None, tolerance=None):
         """Runs the given game keeping only the scores.
 
         Args:
             times (int): The number of times to run to get the average score.
+            pool (ScorePool): If given the games are played in parallel by the pool.
+            tolerance (float): With a pool, stop once the mean score is known to within this much. See
+                `ScorePool.scores`.
 
         Return:
             The return value the average score for the times runs.
         """
-        # TODO: replace this method with a better one.
+        if pool is not None:
+            return pool.avg_score(self.game_class, room, times, func, tolerance=tolerance)
         scores = []
         for t in range(times):
-            scores += [self.run(room.rand_seeded).score]
+            scores += [self.run(room.rand_seeded, playback=False).score]
         return func(scores)
 
     def run_with_local_display(self, seed=None):
@@ -307,7 +404,7 @@ class GameRunner(object):
 
         clock = Display.get_clock()
 
-        frame_buffer = GridFrameBuffer(*charset.pix_size_to_char(display.get_size()), charset=charset)
+        frame_buffer = game.FRAME_BUFFER_CLASS(*charset.pix_size_to_char(display.get_size()), charset=charset)
         frame_updated = True
 
         game.init_board()
@@ -360,7 +457,15 @@ class GameRunner(object):
         )
 
     @staticmethod
-    def move_game(state: PlayGameState, move: str) -> PlayGameState:
+    def move_game(state: PlayGameState, move: str, draw=True) -> PlayGameState:
+        """Plays one move of the human player.
+
+        Args:
+            state(PlayGameState): The state to update.
+            move(str): The key pressed by the human player.
+            draw(bool): If False the frame isn't drawn and `state.frame` is set to None. Use `redraw_game` after the
+                last move.
+        """
         player, comp_players = state.human_player, state.computer_players
         local_random = state.game.random
         game = state.game
@@ -371,13 +476,31 @@ class GameRunner(object):
         for comp_player in state.computer_players:
             comp_player.run_turn(local_random)
         game.do_turn()
-        state.frame = game.get_frame()
+        if not draw:
+            state.frame, state.changes = None, None
+        elif state.frame is None:
+            GameRunner.redraw_game(state)
+        else:
+            state.changes = game.get_frame_changes() if isinstance(game, GridGame) else None
+            if state.changes is None:
+                state.frame = game.get_frame()
+            else:
+                for x, y, char in state.changes:
+                    state.frame[y][x] = char
 
         if game.is_running():
             state.moves += move
 
         return state
 
+    @staticmethod
+    def redraw_game(state: PlayGameState) -> PlayGameState:
+        """Draws the whole frame of a state whose moves were played with `draw=False`."""
+        if state.frame is None:
+            state.frame = state.game.get_frame()
+            state.changes = None
+        return state
+
 
 def run(game_class, avg_game_func=average):
     def serve(args):
@@ -396,6 +519,8 @@ def run(game_class, avg_game_func=average):
             debug=args.debug,
             multiplayer_scoring_interval=args.scoring_time,
             reuse_addr=reuse_addr,
+            db_backend=args.db_backend,
+            replay_by_seed=args.replay_by_seed,
         )
 
     def play(args):
@@ -423,6 +548,13 @@ def run(game_class, avg_game_func=average):
     parser_serve.add_argument(
         "-db", "--dbfile", nargs="?", type=str, help="The root path of the game database", default="temp_game"
     )
+    parser_serve.add_argument(
+        "--db-backend",
+        choices=["file", "sqlite"],
+        help="The storage backend of the game database. "
+        "By default SQLite is used if the game database contains a SQLite database and files are used otherwise.",
+        default=None,
+    )
     parser_serve.add_argument(
         "--debug-log",
         nargs="?",
@@ -441,6 +573,11 @@ def run(game_class, avg_game_func=average):
     )
     parser_serve.add_argument("--host", nargs="?", type=str, help="The mask to host to", default="127.0.0.1")
     parser_serve.add_argument("--no-addr-reuse", action="store_true")
+    parser_serve.add_argument(
+        "--replay-by-seed",
+        action="store_true",
+        help="Only save the seed and the bots of games and regenerate their frames when they are viewed.",
+    )
     parser_serve.add_argument("--debug", action="store_true")
     parser_serve.add_argument(
         "-s",
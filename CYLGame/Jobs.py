@@ -0,0 +1,169 @@
+import secrets
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing.managers import BaseManager
+
+import gevent
+
+from .Utils import call_in_thread
+
+
+class JobError(Exception):
+    pass
+
+
+class JobQueueFull(JobError):
+    pass
+
+
+class JobRateLimited(JobError):
+    pass
+
+
+class JobStatus(object):
+    QUEUED = "queued"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+
+
+def call_view(view_class, method_name, kwargs):
+    """Runs a method of a new instance of `view_class`. This is what the job processes run."""
+    return getattr(view_class(), method_name)(**kwargs)
+
+
+class JobStore(object):
+    """Runs jobs in a pool of processes and keeps their results for `ttl` seconds after they finish. This lives in a
+    manager process so that a job can be submitted to one server worker and polled from another.
+
+    At most `max_pending` jobs can be queued or running, and each key (usually a token) can submit at most
+    `rate_limit` jobs every `rate_period` seconds.
+    """
+
+    def __init__(self, processes, max_pending, rate_limit, rate_period, ttl):
+        self.executor = ProcessPoolExecutor(processes)
+        self.max_pending = max_pending
+        self.rate_limit = rate_limit
+        self.rate_period = rate_period
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.futures = {}
+        self.finished = {}
+        self.submissions = {}
+
+    def __expire(self, now):
+        for job_id, finished in list(self.finished.items()):
+            if finished + self.ttl < now:
+                del self.finished[job_id]
+                del self.futures[job_id]
+        for key, times in list(self.submissions.items()):
+            while times and times[0] + self.rate_period < now:
+                times.popleft()
+            if not times:
+                del self.submissions[key]
+
+    def __finish(self, job_id):
+        with self.lock:
+            self.finished[job_id] = time.time()
+
+    def submit(self, key, func, args):
+        with self.lock:
+            now = time.time()
+            self.__expire(now)
+            if len(self.futures) - len(self.finished) >= self.max_pending:
+                raise JobQueueFull("The server is busy. Please try again later.")
+            times = self.submissions.setdefault(key, deque())
+            if self.rate_limit and len(times) >= self.rate_limit:
+                raise JobRateLimited("Too many requests. Please wait a minute and try again.")
+            times.append(now)
+
+            job_id = secrets.token_hex(8)
+            future = self.executor.submit(func, *args)
+            self.futures[job_id] = future
+        future.add_done_callback(lambda _: self.__finish(job_id))
+        return job_id
+
+    def status(self, job_id):
+        with self.lock:
+            self.__expire(time.time())
+            future = self.futures.get(job_id)
+        if future is None:
+            return None
+        if not future.done():
+            return {"status": JobStatus.RUNNING if future.running() else JobStatus.QUEUED}
+        if future.exception() is not None:
+            return {"status": JobStatus.FAILED, "error": str(future.exception())}
+        return {"status": JobStatus.DONE, "result": future.result()}
+
+    def pending(self):
+        with self.lock:
+            return len(self.futures) - len(self.finished)
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False)
+
+
+class JobStoreManager(BaseManager):
+    pass
+
+
+JobStoreManager.register("JobStore", JobStore)
+
+
+class JobQueue(object):
+    """A queue of jobs which is shared by processes forked after it is created. The jobs are run by a pool of
+    `processes` processes which are forked from a manager process when needed, so they see the state of the process
+    which created the queue.
+
+    `submit` raises a `JobError` when the job isn't accepted, including when the manager process can't be reached.
+    The calls to the manager process are made with `call_in_thread`.
+    """
+
+    POLL_INTERVAL = 0.1
+
+    def __init__(self, processes=None, max_pending=64, rate_limit=10, rate_period=60, ttl=600):
+        self.manager = JobStoreManager()
+        self.manager.start()
+        self.store = self.manager.JobStore(processes, max_pending, rate_limit, rate_period, ttl)
+
+    def shutdown(self):
+        try:
+            self.store.shutdown()
+        except (EOFError, OSError):
+            pass
+        self.manager.shutdown()
+
+    def submit(self, key, func, *args):
+        """Queues `func(*args)` and returns the id of the job. `func` and `args` must be picklable."""
+        try:
+            return call_in_thread(self.store.submit, key, func, args)
+        except (EOFError, OSError):
+            raise JobError("The server is busy. Please try again later.")
+
+    def status(self, job_id):
+        """Returns None for unknown or expired jobs, else a dict with the "status" of the job and its "result" or
+        "error" once it is finished.
+        """
+        try:
+            return call_in_thread(self.store.status, job_id)
+        except (EOFError, OSError):
+            return None
+
+    def wait(self, job_id, timeout):
+        """Polls the status of a job until it is finished or `timeout` seconds have passed. Other greenlets keep running
+        while it waits.
+        """
+        end = time.time() + timeout
+        status = self.status(job_id)
+        while status is not None and status["status"] in (JobStatus.QUEUED, JobStatus.RUNNING) and time.time() < end:
+            gevent.sleep(self.POLL_INTERVAL)
+            status = self.status(job_id)
+        return status
+
+    def __len__(self):
+        try:
+            return call_in_thread(self.store.pending)
+        except (EOFError, OSError):
+            return 0
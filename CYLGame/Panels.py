@@ -6,6 +6,7 @@ from copy import copy
 from functools import reduce
 
 from CYLGame.Sprite import Char
+from CYLGame.structures.spatial_index import Metric, SpatialIndex
 from CYLGame.Utils import deprecated
 
 DEFAULT_CHAR = " "
@@ -40,15 +41,40 @@ class Map(object):
                 positions where that char is located.
     p_to_char:  The is a dictionary which has a position(tuple with two elements: x and y) as a key and the current
                 ColoredChar as the value.
+    char_indexes: This is a dictionary which has a character for the keys and a SpatialIndex of the positions of that
+                  char as the value. A char's index is only built once the char is first used in a distance query.
+    pos_views: This is a dictionary which has a character for the keys and a frozenset snapshot of the positions of
+               that char as the value. A char's snapshot is dropped when its positions change.
+    origin:     The position where the map's (0, 0) is stored when scrolling by origin. When `scroll_by_origin` is
+                True `shift_all` only moves the origin and clears the cells which scrolled out. Then char_to_ps and
+                p_to_char hold stored positions which are converted with `to_stored_pos` and `to_map_pos`.
     """
 
-    def __init__(self, width, height, default_char=DEFAULT_CHAR):
+    def __init__(self, width, height, default_char=DEFAULT_CHAR, scroll_by_origin=False):
         self.w = width
         self.h = height
         self.default_char = to_char(default_char)
         self.char_to_ps = defaultdict(set)
         self.p_to_char = defaultdict(lambda: self.default_char)
         self.changes = {}
+        self.char_indexes = {}
+        self.pos_views = {}
+        self.scroll_by_origin = scroll_by_origin
+        self.origin = (0, 0)
+        # The chars get_diff last reported by position, and if the map was shifted since then. Only used when
+        # scrolling by origin.
+        self.__reported = {}
+        self.__shifted = False
+
+    def __getstate__(self):
+        # The default factory of p_to_char is a lambda which can't be pickled, so the map is pickled with a plain dict.
+        state = dict(self.__dict__)
+        state["p_to_char"] = dict(self.p_to_char)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.p_to_char = defaultdict(lambda: self.default_char, state["p_to_char"])
 
     def __setitem__(self, key: COORD_TYPE, value: CHAR_TYPE):
         self.add(value, key)
@@ -57,25 +83,43 @@ class Map(object):
         return self.get_char_at(item)
 
     def get_x_y_dist_to_foo(self, pos, foo, wrapping=False, diagonal_moving=False, default=None):
-        pos = to_coord(pos)
-        foo = to_char(foo)
+        """Returns the (x, y) offset from `pos` to the closest `foo`.
 
-        dists = []
-        x, y = pos
-        for foo_pos in self.get_all_pos(foo):
-            foo_x, foo_y = foo_pos
-            # TODO(derpferd): Implement wrapping
-            if wrapping or diagonal_moving:
-                # for i, j in product(range(-1, 0, 1), range(-1, 0, 1)):
-                #     pass
-                raise NotImplementedError("Wrapping and Diagonal_moving not implemented")
-            else:
-                d_x, d_y = foo_x - x, foo_y - y
-                dists += [(d_x, d_y)]
-        if len(dists) == 0:
+        Args:
+            pos: The position to measure from.
+            foo: The char to find.
+            wrapping(bool): if True the map wraps around on both axes.
+            diagonal_moving(bool): if True a diagonal step counts as one move (Chebyshev distance). Otherwise the
+                Manhattan distance is used.
+            default: The value to return when there is no `foo`.
+        """
+        pos = to_coord(pos)
+        metric = Metric.CHEBYSHEV if diagonal_moving else Metric.MANHATTAN
+        foo_pos = self.nearest(pos, foo, metric=metric, wrap_x=wrapping, wrap_y=wrapping)
+        if foo_pos is None:
             return default
-        else:
-            return min(dists, key=lambda d: abs(d[0]) + abs(d[1]))
+        return self.get_index(foo).offset(pos, foo_pos, wrap_x=wrapping, wrap_y=wrapping)
+
+    def get_index(self, char) -> SpatialIndex:
+        """Returns the spatial index of the positions of `char`. The index is kept up to date as the map changes."""
+        char = to_char(char)
+        if char not in self.char_indexes:
+            self.char_indexes[char] = SpatialIndex(
+                self.w, self.h, positions=map(self.to_map_pos, self.char_to_ps.get(char, ()))
+            )
+        return self.char_indexes[char]
+
+    def nearest(self, pos, char, metric=Metric.MANHATTAN, wrap_x=False, wrap_y=False):
+        """Returns the position of the `char` closest to `pos` or None if there isn't one."""
+        return self.get_index(char).nearest(to_coord(pos), metric=metric, wrap_x=wrap_x, wrap_y=wrap_y)
+
+    def k_nearest(self, pos, char, k, metric=Metric.MANHATTAN, wrap_x=False, wrap_y=False):
+        """Returns the positions of the `k` `char`s closest to `pos`, closest first."""
+        return self.get_index(char).k_nearest(to_coord(pos), k, metric=metric, wrap_x=wrap_x, wrap_y=wrap_y)
+
+    def within(self, pos, char, radius, metric=Metric.MANHATTAN, wrap_x=False, wrap_y=False):
+        """Returns the positions of the `char`s at most `radius` away from `pos`, closest first."""
+        return self.get_index(char).within(to_coord(pos), radius, metric=metric, wrap_x=wrap_x, wrap_y=wrap_y)
 
     # checks if pos is in bound of the map
     def in_bounds(self, pos):
@@ -90,12 +134,37 @@ class Map(object):
             y %= self.h
         return (x, y)
 
+    def to_stored_pos(self, pos):
+        if self.origin == (0, 0):
+            return pos
+        return (pos[0] - self.origin[0]) % self.w, (pos[1] - self.origin[1]) % self.h
+
+    def to_map_pos(self, stored_pos):
+        if self.origin == (0, 0):
+            return stored_pos
+        return (stored_pos[0] + self.origin[0]) % self.w, (stored_pos[1] + self.origin[1]) % self.h
+
     # changes in the format of a dictionary
     # key: (x, y)
     # value: new_char
     def get_diff(self):
         changes = self.changes
         self.changes = {}
+        if not self.scroll_by_origin:
+            return changes
+        if self.__shifted:
+            # Everything moved so compare the whole map with what was last reported.
+            current = {self.to_map_pos(p): char for p, char in self.p_to_char.items()}
+            changes = {p: self.default_char for p in self.__reported if p not in current}
+            changes.update((p, char) for p, char in current.items() if self.__reported.get(p) != char)
+            self.__reported = current
+            self.__shifted = False
+        else:
+            for p, char in changes.items():
+                if char == self.default_char:
+                    self.__reported.pop(p, None)
+                else:
+                    self.__reported[p] = char
         return changes
 
     # pos must be tuple
@@ -103,45 +172,203 @@ class Map(object):
         assert self.in_bounds(pos), "'{}' isn't in bounds".format(pos)
         char = to_char(char)
 
-        if pos in self.p_to_char.keys():
+        stored_pos = self.to_stored_pos(pos)
+        if stored_pos in self.p_to_char.keys():
             self.rm_char(pos)
-        self.char_to_ps[char].add(pos)
-        self.p_to_char[pos] = char
+        self.char_to_ps[char].add(stored_pos)
+        self.p_to_char[stored_pos] = char
         self.changes[pos] = char
+        self.pos_views.pop(char, None)
+        if char in self.char_indexes:
+            self.char_indexes[char].add(pos)
 
     # pos must be tuple
     def rm_char(self, pos):
         assert self.in_bounds(pos)
-        char = self.p_to_char[pos]
-        del self.p_to_char[pos]
-        if char in self.char_to_ps and pos in self.char_to_ps[char]:
-            self.char_to_ps[char].remove(pos)
+        stored_pos = self.to_stored_pos(pos)
+        char = self.p_to_char.pop(stored_pos, self.default_char)
+        if char in self.char_to_ps and stored_pos in self.char_to_ps[char]:
+            self.char_to_ps[char].remove(stored_pos)
             self.changes[pos] = self.default_char
+            self.pos_views.pop(char, None)
+            if char in self.char_indexes:
+                self.char_indexes[char].remove(pos)
 
-    # returns a set of pos
+    # returns a read-only set of pos. The set is shared between calls until the positions of char change.
     def get_all_pos(self, char):
         char = to_char(char)
-        return copy(self.char_to_ps[char])
+        view = self.pos_views.get(char)
+        if view is None:
+            view = self.pos_views[char] = frozenset(map(self.to_map_pos, self.char_to_ps.get(char, ())))
+        return view
+
+    # iterates over the pos of char without copying them. The map must not be changed while iterating.
+    def iter_pos(self, char):
+        ps = self.char_to_ps.get(to_char(char), ())
+        return iter(ps) if self.origin == (0, 0) else map(self.to_map_pos, ps)
+
+    # returns the number of positions of char
+    def count(self, char):
+        return len(self.char_to_ps.get(to_char(char), ()))
 
     # will return default_char if the position is not set
     def get_char_at(self, pos):
         assert self.in_bounds(pos)
-        return copy(self.p_to_char[pos])
+        return self.p_to_char.get(self.to_stored_pos(pos), self.default_char)
 
     # offset should be in the format tuple(x, y)
     def shift_all(self, offset, wrap_x=False, wrap_y=False):
         assert type(offset) == tuple
+        if self.scroll_by_origin:
+            self.__shift_origin(offset, wrap_x, wrap_y)
+            return
         old_char_to_ps = copy(self.char_to_ps)
         self.char_to_ps = defaultdict(set)
         self.p_to_char = defaultdict(lambda: self.default_char)
+        self.char_indexes = {}
+        self.pos_views = {}
+        # Every old position is cleared before the chars are added back, so the change of a position which was left
+        # by one char isn't kept from a shift before the diff was last taken.
+        for ps in old_char_to_ps.values():
+            for p in ps:
+                self.changes[p] = self.default_char
         for char, ps in old_char_to_ps.items():
             for p in ps:
-                if p not in self.changes:
-                    self.changes[p] = self.default_char
                 new_pos = self.wrap((p[0] + offset[0], p[1] + offset[1]), wrap_x, wrap_y)
                 if self.in_bounds(new_pos):
                     self.add(char, new_pos)
 
+    def __shift_origin(self, offset, wrap_x, wrap_y):
+        """Shifts the map by moving its origin. Only the rows and columns which scroll out of the map are cleared."""
+        d_x, d_y = offset
+        if not wrap_x and d_x:
+            xs = range(self.w - d_x, self.w) if d_x > 0 else range(0, -d_x)
+            for x in range(max(xs.start, 0), min(xs.stop, self.w)):
+                for y in range(self.h):
+                    self.rm_char((x, y))
+        if not wrap_y and d_y:
+            ys = range(self.h - d_y, self.h) if d_y > 0 else range(0, -d_y)
+            for y in range(max(ys.start, 0), min(ys.stop, self.h)):
+                for x in range(self.w):
+                    self.rm_char((x, y))
+        self.origin = ((self.origin[0] + d_x) % self.w, (self.origin[1] + d_y) % self.h)
+        self.char_indexes = {}
+        self.pos_views = {}
+        self.__shifted = True
+
+
+class DenseMap(Map):
+    """A Map which stores every cell in a 2D array of char codes instead of dictionaries. This uses less memory and
+    hashing than Map when most cells are set, and the rows can be drawn with one bulk copy.
+
+    cells:       This is a list of rows where each row is a list of the char codes of the cells in that row.
+    char_counts: This is a dictionary which has a character for the keys and the number of cells set to that char as
+                 the value.
+
+    Note:
+        Cells which aren't set hold the default char, so the positions of the default char are all the unset cells.
+        Scrolling by origin isn't supported.
+    """
+
+    def __init__(self, width, height, default_char=DEFAULT_CHAR):
+        super(DenseMap, self).__init__(width, height, default_char)
+        self._init_cells()
+
+    def _init_cells(self):
+        self.cells = [[ord(self.default_char)] * self.w for _ in range(self.h)]
+        self.char_counts = {}
+
+    def __set_cell(self, pos, char):
+        x, y = pos
+        old_char = chr(self.cells[y][x])
+        if old_char == char:
+            return
+        for c, change in ((old_char, -1), (char, 1)):
+            if c != self.default_char:
+                self.char_counts[c] = self.char_counts.get(c, 0) + change
+                if not self.char_counts[c]:
+                    del self.char_counts[c]
+            self.pos_views.pop(c, None)
+        if old_char in self.char_indexes:
+            self.char_indexes[old_char].remove(pos)
+        if char in self.char_indexes:
+            self.char_indexes[char].add(pos)
+        self.cells[y][x] = ord(char)
+
+    def get_index(self, char) -> SpatialIndex:
+        char = to_char(char)
+        if char not in self.char_indexes:
+            self.char_indexes[char] = SpatialIndex(self.w, self.h, positions=self.iter_pos(char))
+        return self.char_indexes[char]
+
+    def add(self, char: CHAR_TYPE, pos):
+        assert self.in_bounds(pos), "'{}' isn't in bounds".format(pos)
+        char = to_char(char)
+        self.__set_cell(pos, char)
+        self.changes[pos] = char
+
+    def rm_char(self, pos):
+        assert self.in_bounds(pos)
+        if self.cells[pos[1]][pos[0]] != ord(self.default_char):
+            self.__set_cell(pos, self.default_char)
+            self.changes[pos] = self.default_char
+
+    def get_all_pos(self, char):
+        char = to_char(char)
+        view = self.pos_views.get(char)
+        if view is None:
+            view = self.pos_views[char] = frozenset(self.iter_pos(char)) if self.count(char) else frozenset()
+        return view
+
+    def iter_pos(self, char):
+        c = ord(to_char(char))
+        for y, row in enumerate(self.cells):
+            if c in row:
+                for x, cell in enumerate(row):
+                    if cell == c:
+                        yield x, y
+
+    def count(self, char):
+        char = to_char(char)
+        if char == self.default_char:
+            return self.w * self.h - sum(self.char_counts.values())
+        return self.char_counts.get(char, 0)
+
+    def get_char_at(self, pos):
+        assert self.in_bounds(pos)
+        return chr(self.cells[pos[1]][pos[0]])
+
+    def shift_all(self, offset, wrap_x=False, wrap_y=False):
+        assert type(offset) == tuple
+        d_x, d_y = offset
+        default = ord(self.default_char)
+
+        def shift(seq, d, wrap, blank):
+            n = len(seq)
+            if wrap:
+                d %= n
+                return seq[n - d :] + seq[: n - d]
+            if abs(d) >= n:
+                return [blank() for _ in range(n)]
+            if d >= 0:
+                return [blank() for _ in range(d)] + seq[: n - d]
+            return seq[-d:] + [blank() for _ in range(-d)]
+
+        old_cells = self.cells
+        rows = shift(old_cells, d_y, wrap_y, lambda: [default] * self.w)
+        self.cells = [shift(row, d_x, wrap_x, lambda: default) for row in rows]
+
+        self.char_counts = {}
+        for y, (row, old_row) in enumerate(zip(self.cells, old_cells)):
+            for x, (cell, old_cell) in enumerate(zip(row, old_row)):
+                if cell != default:
+                    char = chr(cell)
+                    self.char_counts[char] = self.char_counts.get(char, 0) + 1
+                if cell != old_cell:
+                    self.changes[(x, y)] = chr(cell)
+        self.char_indexes = {}
+        self.pos_views = {}
+
 
 class PanelPadding(object):
     TOP = 1
@@ -342,58 +569,56 @@ class Panel(Map):
         char = to_char(char)
         frame_buffer.set(x, y, char)
 
+    def draw_chars(self, cells, frame_buffer):
+        """Draws many chars at once so the frame buffer only validates them once.
+
+        Args:
+            cells(Iterable[Tuple[int, int, CHAR_TYPE]]): The (x, y, char) of each char in frame buffer coordinates.
+            frame_buffer(GridFrameBuffer):
+        """
+        frame_buffer.set_many((x, y, to_char(char)) for x, y, char in cells)
+
     def redraw(self, frame_buffer):
         try:
             if PanelBorder.TOP in self.border:
-                for i in range(self.real_w):
-                    self.draw_char(
-                        pos=(self.real_x + i, self.real_y), char=self.border[PanelBorder.TOP], frame_buffer=frame_buffer
-                    )
+                frame_buffer.set_row(self.real_x, self.real_y, [to_char(self.border[PanelBorder.TOP])] * self.real_w)
             if PanelBorder.LEFT in self.border:
-                for i in range(self.real_h):
-                    self.draw_char(
-                        pos=(self.real_x, self.real_y + i),
-                        char=self.border[PanelBorder.LEFT],
-                        frame_buffer=frame_buffer,
-                    )
+                self.draw_chars(
+                    [(self.real_x, self.real_y + i, self.border[PanelBorder.LEFT]) for i in range(self.real_h)],
+                    frame_buffer,
+                )
             if PanelBorder.BOTTOM in self.border:
-                for i in range(self.real_w):
-                    self.draw_char(
-                        pos=(self.real_x + i, self.real_y + self.real_h - 1),
-                        char=self.border[PanelBorder.BOTTOM],
-                        frame_buffer=frame_buffer,
-                    )
+                frame_buffer.set_row(
+                    self.real_x, self.real_y + self.real_h - 1, [to_char(self.border[PanelBorder.BOTTOM])] * self.real_w
+                )
             if PanelBorder.RIGHT in self.border:
-                for i in range(self.real_h):
-                    self.draw_char(
-                        pos=(self.real_x + self.real_w - 1, self.real_y + i),
-                        char=self.border[PanelBorder.RIGHT],
-                        frame_buffer=frame_buffer,
-                    )
-            if PanelBorder.TOP in self.border and PanelBorder.LEFT in self.border:
-                self.draw_char(
-                    pos=(self.real_x, self.real_y),
-                    char=self.border[PanelBorder.TOP | PanelBorder.LEFT],
-                    frame_buffer=frame_buffer,
+                self.draw_chars(
+                    [
+                        (self.real_x + self.real_w - 1, self.real_y + i, self.border[PanelBorder.RIGHT])
+                        for i in range(self.real_h)
+                    ],
+                    frame_buffer,
                 )
+            corners = []
+            if PanelBorder.TOP in self.border and PanelBorder.LEFT in self.border:
+                corners += [(self.real_x, self.real_y, self.border[PanelBorder.TOP | PanelBorder.LEFT])]
             if PanelBorder.BOTTOM in self.border and PanelBorder.LEFT in self.border:
-                self.draw_char(
-                    pos=(self.real_x, self.real_y + self.real_h - 1),
-                    char=self.border[PanelBorder.BOTTOM | PanelBorder.LEFT],
-                    frame_buffer=frame_buffer,
-                )
+                corners += [
+                    (self.real_x, self.real_y + self.real_h - 1, self.border[PanelBorder.BOTTOM | PanelBorder.LEFT])
+                ]
             if PanelBorder.TOP in self.border and PanelBorder.RIGHT in self.border:
-                self.draw_char(
-                    pos=(self.real_x + self.real_w - 1, self.real_y),
-                    char=self.border[PanelBorder.TOP | PanelBorder.RIGHT],
-                    frame_buffer=frame_buffer,
-                )
+                corners += [
+                    (self.real_x + self.real_w - 1, self.real_y, self.border[PanelBorder.TOP | PanelBorder.RIGHT])
+                ]
             if PanelBorder.BOTTOM in self.border and PanelBorder.RIGHT in self.border:
-                self.draw_char(
-                    pos=(self.real_x + self.real_w - 1, self.real_y + self.real_h - 1),
-                    char=self.border[PanelBorder.BOTTOM | PanelBorder.RIGHT],
-                    frame_buffer=frame_buffer,
-                )
+                corners += [
+                    (
+                        self.real_x + self.real_w - 1,
+                        self.real_y + self.real_h - 1,
+                        self.border[PanelBorder.BOTTOM | PanelBorder.RIGHT],
+                    )
+                ]
+            self.draw_chars(corners, frame_buffer)
         except IndexError:
             raise IndexError(
                 "Out of bounds while drawing border. This is normally caused by the forgetting that the"
@@ -402,7 +627,17 @@ class Panel(Map):
 
 
 class MapPanel(Panel):
-    def __init__(self, x, y, w, h, default_char=DEFAULT_CHAR, border=PanelBorder(), padding=PanelPadding()):
+    def __init__(
+        self,
+        x,
+        y,
+        w,
+        h,
+        default_char=DEFAULT_CHAR,
+        border=PanelBorder(),
+        padding=PanelPadding(),
+        scroll_by_origin=False,
+    ):
         """
 
         Args:
@@ -413,15 +648,14 @@ class MapPanel(Panel):
             default_char:
             border:
             padding:
+            scroll_by_origin: if True `shift_all` is O(1) (see Map)
         """
         super(MapPanel, self).__init__(x, y, w, h, default_char, border, padding)
+        self.scroll_by_origin = scroll_by_origin
         self.is_first = True
 
     def first_draw(self, frame_buffer):
-        # pass
-        for x in range(self.w):
-            for y in range(self.h):
-                self.draw_char(self[(x, y)], (self.x + x, self.y + y), frame_buffer)
+        frame_buffer.blit_rect(self.x, self.y, [[self[(x, y)] for x in range(self.w)] for y in range(self.h)])
 
     def redraw(self, frame_buffer):
         super(MapPanel, self).redraw(frame_buffer)
@@ -429,14 +663,22 @@ class MapPanel(Panel):
             self.first_draw(frame_buffer)
             self.is_first = False
         diff = self.get_diff()
+        # Check that the positions are in bounds
         for pos in diff:
-            char = diff[pos]
-
-            # Check that the position is in bounds
-            if 0 <= pos[0] < self.w and 0 <= pos[1] < self.h:
-                self.draw_char(char, (self.x + pos[0], self.y + pos[1]), frame_buffer)
-            else:
+            if not (0 <= pos[0] < self.w and 0 <= pos[1] < self.h):
                 raise Warning("Char out of bounds: Decided to skip drawing it!")
+        frame_buffer.blit_map(self.x, self.y, diff)
+
+
+class DenseMapPanel(DenseMap, MapPanel):
+    """A MapPanel backed by a DenseMap. The whole map is drawn with one bulk copy."""
+
+    def __init__(self, x, y, w, h, default_char=DEFAULT_CHAR, border=PanelBorder(), padding=PanelPadding()):
+        MapPanel.__init__(self, x, y, w, h, default_char, border, padding)
+        self._init_cells()
+
+    def first_draw(self, frame_buffer):
+        frame_buffer.blit_rect(self.x, self.y, self.cells)
 
 
 class MessagePanel(Panel):
@@ -472,6 +714,11 @@ class MessagePanel(Panel):
         self.msgs = []
         self.rows = self.h
         self.max_len = self.w
+        # The frame buffer the panel was last drawn to, the versions of the rows of its border and the text and
+        # version of each of its rows. See `GridFrameBuffer.get_row_version`.
+        self.__drawn_to = None
+        self.__border_versions = None
+        self.__drawn_rows = []
 
     @deprecated("Please use the `add` method instead.")
     def __add__(self, other):
@@ -510,23 +757,37 @@ class MessagePanel(Panel):
     def get_current_messages(self):
         return self.msgs[-self.rows :]
 
-    def redraw(self, frame_buffer):
-        super(MessagePanel, self).redraw(frame_buffer)
-        msgs_to_display = self.get_current_messages()
+    def get_rows(self):
+        """
 
-        # Clear the WHOLE message panel
+        Returns:
+            List[str]: Each row of the panel, padded to the width of the panel.
+        """
+        msgs_to_display = self.get_current_messages()
+        rows = []
         for j in range(self.rows):
-            # TODO: optimize this by only clearing what should be changed.
-            # Clear msg row
-            for i in range(self.max_len):
-                self.draw_char(pos=(self.x + i, self.y + j), char=self.default_char, frame_buffer=frame_buffer)
+            msg = msgs_to_display[j][: self.max_len] if j < len(msgs_to_display) else ""
+            rows += [msg + self.default_char * (self.max_len - len(msg))]
+        return rows
 
-        # Write the message we have to the panel
-        for j in range(len(msgs_to_display)):
-            msg = msgs_to_display[j]
-            # Print msg
-            for i in range(min(len(msg), self.max_len)):
-                self.draw_char(pos=(self.x + i, self.y + j), char=msg[i], frame_buffer=frame_buffer)
+    def redraw(self, frame_buffer):
+        """Only redraws the rows which changed since the last redraw, e.g. due to a new message or scrolling, and the
+        rows which were drawn over since. Everything is redrawn when drawing to a different frame buffer.
+        """
+        if frame_buffer is not self.__drawn_to:
+            self.__drawn_to = frame_buffer
+            self.__border_versions = None
+            self.__drawn_rows = [None] * self.rows
+
+        border_rows = range(self.real_y, self.real_y + self.real_h)
+        if self.__border_versions != [frame_buffer.get_row_version(y) for y in border_rows]:
+            super(MessagePanel, self).redraw(frame_buffer)
+        for j, row in enumerate(self.get_rows()):
+            y = self.y + j
+            if self.__drawn_rows[j] != (row, frame_buffer.get_row_version(y)):
+                frame_buffer.set_row(self.x, y, row)
+                self.__drawn_rows[j] = (row, frame_buffer.get_row_version(y))
+        self.__border_versions = [frame_buffer.get_row_version(y) for y in border_rows]
 
 
 class StatusPanel(MessagePanel):
@@ -535,6 +796,8 @@ class StatusPanel(MessagePanel):
     ):
         super(StatusPanel, self).__init__(x, y, w, h, default_char, border, padding)
         self.info = {}
+        # The info the messages were last built from.
+        self.__msgs_info = None
 
     def __getitem__(self, item):
         return self.info[item]
@@ -545,8 +808,15 @@ class StatusPanel(MessagePanel):
     def __contains__(self, item):
         return item in self.info
 
+    def clear(self):
+        super(StatusPanel, self).clear()
+        self.__msgs_info = None
+
     def get_current_messages(self):
-        self.msgs = []
-        for key in self.info:
-            self.msgs += [key + ": " + self.info[key]]
+        # The messages are only rebuilt after a status changed, including when `info` was changed directly.
+        if list(self.info.items()) != self.__msgs_info:
+            self.msgs = []
+            for key in self.info:
+                self.msgs += [key + ": " + str(self.info[key])]
+            self.__msgs_info = list(self.info.items())
         return super(StatusPanel, self).get_current_messages()
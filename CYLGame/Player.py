@@ -1,5 +1,6 @@
 from typing import List, Optional
 
+import copyreg
 import sys
 from abc import ABC, abstractmethod
 from random import Random, randint
@@ -43,6 +44,14 @@ class LittlePythonProg(Prog):
         return self.prog.run(*args, **kargs)
 
 
+def _reduce_lp_prog(prog):
+    return LPProg, (prog.ast, prog.features)
+
+
+# A compiled program holds a lock, so it is pickled and copied as its syntax tree and features.
+copyreg.pickle(LPProg, _reduce_lp_prog)
+
+
 class UserProg(Prog):
     def __init__(self):
         super().__init__(name="You", options={})
@@ -129,23 +138,37 @@ class Room(object):
         self.debug_vars: dict = {}
         self.screen_cap = None
 
-    def save(self, gamedb):
+    def save(self, gamedb, replay=None):
         """The method saves the game data to a new game. Note: this room must be run before calling this function.
 
         Args:
             gamedb (GameDB): The current game database.
+            replay (dict): If given only these inputs for `GameRunner.replay` are saved instead of the frames and debug
+                variables. Then the room doesn't need to be run with playback.
 
         Returns: The gtoken of the newly created game.
 
         """
-        if self.screen_cap is None:
+        if replay is not None:
+            game_data = {"replay": replay, "seed": int2base(self.seed, 36)}
+            player_data = {}
+            for player in self.bots:
+                if hasattr(player, "token") and player.token is not None:
+                    player_data[player.token] = {"code_hash": player.code_hash}
+        elif self.screen_cap is None:
             raise Exception("You must run this room before trying to save it.")
-        game_data = {"screen": self.screen_cap, "seed": int2base(self.seed, 36)}
+        else:
+            game_data = {"screen": self.screen_cap, "seed": int2base(self.seed, 36)}
+            player_data = self.get_player_data()
+        return gamedb.add_new_game(game_data, per_player_data=player_data)
+
+    def get_player_data(self):
+        """Returns the data `save` saves for each player with a token. Note: this room must be run with playback."""
         player_data = {}
         for player in self.bots:
             if hasattr(player, "token") and player.token is not None:
                 player_data[player.token] = {"debug_vars": self.debug_vars[player], "code_hash": player.code_hash}
-        return gamedb.add_new_game(game_data, per_player_data=player_data)
+        return player_data
 
     @property
     def rand_seeded(self):
@@ -0,0 +1,714 @@
+import gzip
+import os
+import random
+import sqlite3
+import threading
+import time
+from builtins import str as text
+from contextlib import contextmanager
+
+import msgpack
+
+from CYLGame.Database import WWWCache
+from CYLGame.Utils import hash_code
+
+
+def pack(o):
+    return gzip.compress(msgpack.packb(o))
+
+
+def unpack(data):
+    if data is None:
+        return None
+    return msgpack.unpackb(gzip.decompress(data))
+
+
+class SQLiteGameDB(object):
+    """
+    This is a game database with the same API as `GameDB` which stores all persisted data in a single SQLite database
+    (`/gamedb.sqlite3` in the root game directory) instead of one file per fact.
+
+    The database runs in WAL mode so the server's worker processes and the scoring process can all read while one of
+    them writes. Each process (and thread) opens its own connection the first time it uses the database.
+
+    Use `migrate_file_db` to import an existing file based game directory.
+    """
+
+    TOKEN_LEN = 8
+
+    ACTIVE_CODE_KEY = "active_code"
+
+    DB_FILENAME = "gamedb.sqlite3"
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS schools (
+            token TEXT PRIMARY KEY,
+            name TEXT NOT NULL DEFAULT ''
+        );
+        CREATE TABLE IF NOT EXISTS users (
+            token TEXT PRIMARY KEY,
+            school TEXT REFERENCES schools(token),
+            name TEXT,
+            avg_score
+        );
+        CREATE INDEX IF NOT EXISTS users_by_school ON users(school);
+        CREATE TABLE IF NOT EXISTS competitions (
+            token TEXT PRIMARY KEY,
+            name TEXT NOT NULL DEFAULT ''
+        );
+        CREATE TABLE IF NOT EXISTS comp_schools (
+            comp TEXT NOT NULL REFERENCES competitions(token),
+            school TEXT NOT NULL REFERENCES schools(token),
+            code TEXT,
+            avg_score,
+            PRIMARY KEY (comp, school)
+        );
+        CREATE INDEX IF NOT EXISTS comp_schools_by_school ON comp_schools(school);
+        CREATE TABLE IF NOT EXISTS games (
+            token TEXT PRIMARY KEY,
+            ctime REAL NOT NULL,
+            frames BLOB
+        );
+        CREATE TABLE IF NOT EXISTS game_players (
+            game TEXT NOT NULL REFERENCES games(token) ON DELETE CASCADE,
+            player TEXT NOT NULL REFERENCES users(token),
+            data BLOB,
+            PRIMARY KEY (game, player)
+        );
+        CREATE INDEX IF NOT EXISTS game_players_by_player ON game_players(player);
+        CREATE TABLE IF NOT EXISTS comp_games (
+            comp TEXT NOT NULL REFERENCES competitions(token),
+            game TEXT NOT NULL REFERENCES games(token) ON DELETE CASCADE,
+            PRIMARY KEY (comp, game)
+        );
+        CREATE INDEX IF NOT EXISTS comp_games_by_game ON comp_games(game);
+        CREATE TABLE IF NOT EXISTS kv (
+            token TEXT NOT NULL,
+            key TEXT NOT NULL,
+            value,
+            PRIMARY KEY (token, key)
+        );
+        CREATE TABLE IF NOT EXISTS code (
+            token TEXT NOT NULL REFERENCES users(token),
+            code_key TEXT NOT NULL,
+            hash TEXT NOT NULL,
+            PRIMARY KEY (token, code_key)
+        );
+        CREATE INDEX IF NOT EXISTS code_by_hash ON code(hash);
+        CREATE TABLE IF NOT EXISTS code_blobs (
+            hash TEXT PRIMARY KEY,
+            code TEXT,
+            options BLOB
+        );
+        CREATE TABLE IF NOT EXISTS exceptions (
+            token TEXT PRIMARY KEY,
+            report BLOB
+        );
+    """
+
+    def __init__(self, root_dir, filename=DB_FILENAME):
+        self.root_dir = os.path.abspath(root_dir)
+        self.db_path = os.path.join(self.root_dir, filename)
+        self.www_cache = WWWCache(os.path.join(self.root_dir, "www"))
+        self.__local = threading.local()
+        # Connections inherited from a parent process are kept referenced, but never used, since closing them in the
+        # child could checkpoint or remove the WAL the parent is still using.
+        self.__inherited_connections = []
+        os.makedirs(self.root_dir, exist_ok=True)
+        self.__conn.executescript(self.SCHEMA)
+
+    @classmethod
+    def exists(cls, root_dir, filename=DB_FILENAME):
+        return os.path.exists(os.path.join(root_dir, filename))
+
+    def __connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=60, isolation_level=None)
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute("PRAGMA synchronous = NORMAL")
+        conn.execute("PRAGMA foreign_keys = ON")
+        return conn
+
+    @property
+    def __conn(self):
+        local = self.__local
+        if getattr(local, "pid", None) != os.getpid():
+            if getattr(local, "conn", None) is not None:
+                self.__inherited_connections += [local.conn]
+            local.conn = self.__connect()
+            local.pid = os.getpid()
+            local.depth = 0
+        return local.conn
+
+    @contextmanager
+    def __transaction(self):
+        conn = self.__conn
+        local = self.__local
+        if local.depth > 0:
+            # Nested transactions are part of the outer transaction.
+            local.depth += 1
+            try:
+                yield conn
+            finally:
+                local.depth -= 1
+            return
+
+        conn.execute("BEGIN IMMEDIATE")
+        local.depth = 1
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        else:
+            conn.execute("COMMIT")
+        finally:
+            local.depth = 0
+
+    @contextmanager
+    def batch(self):
+        """Makes all the writes within the context in a single transaction. See `GameDB.batch`."""
+        with self.__transaction():
+            yield self
+
+    def __query(self, sql, params=()):
+        return self.__conn.execute(sql, params).fetchall()
+
+    def __query_value(self, sql, params=(), default=None):
+        row = self.__conn.execute(sql, params).fetchone()
+        if row is None:
+            return default
+        return row[0]
+
+    def __query_column(self, sql, params=()):
+        return [row[0] for row in self.__query(sql, params)]
+
+    def __exists(self, table, token):
+        if not isinstance(token, str):
+            return False
+        return self.__query_value(f"SELECT 1 FROM {table} WHERE token = ?", (token,)) is not None
+
+    def __get_new_token(self, table, prefix=""):
+        def new_token():
+            return prefix + "".join([random.choice("0123456789ABCDEF") for _ in range(self.TOKEN_LEN)])
+
+        token = new_token()
+        while self.__exists(table, token):
+            token = new_token()
+        return token
+
+    def close(self):
+        local = self.__local
+        if getattr(local, "pid", None) == os.getpid() and local.conn is not None:
+            local.conn.close()
+        local.conn = None
+        local.pid = None
+
+    def is_comp_token(self, token):
+        return self.__exists("competitions", token)
+
+    def is_school_token(self, token):
+        return self.__exists("schools", token)
+
+    def is_user_token(self, token):
+        return self.__exists("users", token)
+
+    def is_game_token(self, gtoken):
+        return self.__exists("games", gtoken)
+
+    def is_exception_token(self, token):
+        return self.__exists("exceptions", token)
+
+    def get_new_token(self, school_tk, _token=None):  # Don't use `_token` unless you know what you are doing.
+        assert self.is_school_token(school_tk)
+        with self.__transaction() as conn:
+            token = _token
+            if _token is None:
+                token = self.__get_new_token("users")
+            conn.execute("INSERT INTO users (token, school) VALUES (?, ?)", (token, school_tk))
+        return token
+
+    def add_new_school(self, name="", _token=None):  # Don't use `_token` unless you know what you are doing.
+        with self.__transaction() as conn:
+            token = _token
+            if _token is None:
+                token = self.__get_new_token("schools", prefix="S")
+            conn.execute("INSERT INTO schools (token, name) VALUES (?, ?)", (token, text(name)))
+        return token
+
+    def add_new_competition(self, name="", _token=None):
+        with self.__transaction() as conn:
+            token = _token
+            if token is None:
+                token = self.__get_new_token("competitions", prefix="P")
+            conn.execute("INSERT INTO competitions (token, name) VALUES (?, ?)", (token, text(name)))
+        return token
+
+    def add_new_game(self, frames=None, per_player_data=None, player_tokens=None, _token=None, _ctime=None):
+        if per_player_data is not None:
+            assert player_tokens is None
+        if player_tokens is not None:
+            assert per_player_data is None
+
+        with self.__transaction() as conn:
+            token = _token
+            if token is None:
+                token = self.__get_new_token("games", prefix="G")
+            ctime = _ctime
+            if ctime is None:
+                ctime = time.time()
+            conn.execute("INSERT INTO games (token, ctime) VALUES (?, ?)", (token, ctime))
+
+            if frames is not None:
+                self.save_game_frames(token, frames)
+
+            if player_tokens is not None:
+                for player in player_tokens:
+                    self.set_game_player(token, player)
+            elif per_player_data is not None:
+                for player, data in per_player_data.items():
+                    self.set_game_player(token, player, data)
+
+        return token
+
+    def add_school_to_comp(self, ctoken, stoken):
+        assert self.is_comp_token(ctoken)
+        assert self.is_school_token(stoken)
+
+        with self.__transaction() as conn:
+            conn.execute("INSERT OR IGNORE INTO comp_schools (comp, school) VALUES (?, ?)", (ctoken, stoken))
+
+    def set_comp_school_code(self, ctoken, stoken, code):
+        assert self.is_comp_token(ctoken)
+        assert self.is_school_token(stoken)
+
+        with self.__transaction() as conn:
+            conn.execute(
+                "INSERT INTO comp_schools (comp, school, code) VALUES (?, ?, ?) "
+                "ON CONFLICT (comp, school) DO UPDATE SET code = excluded.code",
+                (ctoken, stoken, text(code)),
+            )
+
+    def get_ctime_for_game(self, token):
+        ctime = self.__query_value("SELECT ctime FROM games WHERE token = ?", (token,))
+        if ctime is None:
+            raise ValueError("Invalid game token")
+        return ctime
+
+    def get_comp_code(self, ctoken, stoken):
+        return self.__query_value("SELECT code FROM comp_schools WHERE comp = ? AND school = ?", (ctoken, stoken))
+
+    def get_comp_tokens(self):
+        return self.__query_column("SELECT token FROM competitions")
+
+    def get_comps_for_token(self, utoken):
+        return self.__query_column(
+            "SELECT comp_schools.comp FROM users JOIN comp_schools ON comp_schools.school = users.school "
+            "WHERE users.token = ?",
+            (utoken,),
+        )
+
+    def get_schools_in_comp(self, ctoken):
+        return self.__query_column("SELECT school FROM comp_schools WHERE comp = ?", (ctoken,))
+
+    def set_comp_avg_score(self, ctoken, stoken, score):
+        with self.__transaction() as conn:
+            conn.execute(
+                "INSERT INTO comp_schools (comp, school, avg_score) VALUES (?, ?, ?) "
+                "ON CONFLICT (comp, school) DO UPDATE SET avg_score = excluded.avg_score",
+                (ctoken, stoken, score),
+            )
+
+    def get_comp_avg_score(self, ctoken, stoken):
+        score = self.__query_value("SELECT avg_score FROM comp_schools WHERE comp = ? AND school = ?", (ctoken, stoken))
+        if score is None:
+            return None
+        return float(score)
+
+    def save_code(self, token, code, options=None, set_as_active=True, _code_key=None):
+        """Save a user's code under their token.
+
+        Args:
+            token (str): The user's token.
+            code (str): The user's code.
+            options (json-able object): The user's options.
+            set_as_active (bool): Whether to set the saved code as the active code for the token.
+        """
+        assert self.is_user_token(token)
+
+        # Create Code id.
+        code_hash = hash_code(code, options)
+        code_key = _code_key
+        if code_key is None:
+            code_key = f"{int(time.time_ns())}_{code_hash}"
+
+        with self.__transaction() as conn:
+            try:
+                conn.execute("INSERT INTO code (token, code_key, hash) VALUES (?, ?, ?)", (token, code_key, code_hash))
+            except sqlite3.IntegrityError:
+                raise ValueError("Duplicate Request!")
+            conn.execute(
+                "INSERT OR IGNORE INTO code_blobs (hash, code, options) VALUES (?, ?, ?)",
+                (code_hash, text(code), pack(options) if options else None),
+            )
+
+            # Update code to be active if needed
+            if set_as_active:
+                self.save_value(token=token, key=self.ACTIVE_CODE_KEY, value=code_key)
+
+        return code_hash
+
+    def save_name(self, token, name):
+        """Save a user's name under their token.
+
+        Args:
+            token (str): The user's token.
+            name (str): The user's name.
+        """
+        assert self.is_user_token(token)
+        with self.__transaction() as conn:
+            conn.execute("UPDATE users SET name = ? WHERE token = ?", (text(name), token))
+
+    def save_avg_score(self, token, score):
+        """Save a user's average score.
+
+        Args:
+            token (str): The user's token.
+            score (int): The user's average score.
+        """
+        assert self.is_user_token(token)
+        with self.__transaction() as conn:
+            conn.execute("UPDATE users SET avg_score = ? WHERE token = ?", (score, token))
+
+    def save_value(self, token, key, value):
+        """Save a key value pair under a token. If a value has been saved under the same key it will be overwritten by
+            the new value passed in. The value can be looked up using the `get_value` function.
+
+        Args:
+            token (str):    Any valid token.
+            key (str):      The key to store the `value` under.
+            value (str or int or float):    The value to be stored.
+        """
+        assert isinstance(key, str) and (isinstance(value, str) or isinstance(value, int) or isinstance(value, float))
+
+        with self.__transaction() as conn:
+            conn.execute(
+                "INSERT INTO kv (token, key, value) VALUES (?, ?, ?) "
+                "ON CONFLICT (token, key) DO UPDATE SET value = excluded.value",
+                (token, key, value),
+            )
+
+    def get_value(self, token, key, default_value=None):
+        rows = self.__query("SELECT value FROM kv WHERE token = ? AND key = ?", (token, key))
+        if not rows:
+            return default_value
+        return rows[0][0]
+
+    def get_values(self, token):
+        """Returns a dict of all the key value pairs saved under a token with `save_value`."""
+        return dict(self.__query("SELECT key, value FROM kv WHERE token = ?", (token,)))
+
+    def save_game_frames(self, gtoken, frames):
+        with self.__transaction() as conn:
+            cursor = conn.execute("UPDATE games SET frames = ? WHERE token = ?", (pack(frames), gtoken))
+            assert cursor.rowcount == 1, "Token '{}' must be a game token".format(gtoken)
+
+    def set_game_player(self, gtoken, token, data=None):
+        assert self.is_user_token(token), "Token '{}' must be a user token".format(token)
+        with self.__transaction() as conn:
+            conn.execute("INSERT INTO game_players (game, player, data) VALUES (?, ?, ?)", (gtoken, token, pack(data)))
+
+    def add_game_to_comp(self, ctoken, gtoken):
+        with self.__transaction() as conn:
+            conn.execute("INSERT OR IGNORE INTO comp_games (comp, game) VALUES (?, ?)", (ctoken, gtoken))
+
+    def remove_game_from_comp(self, ctoken, gtoken):
+        with self.__transaction() as conn:
+            conn.execute("DELETE FROM comp_games WHERE comp = ? AND game = ?", (ctoken, gtoken))
+
+    def replace_games_in_comp(self, ctoken, new_gtokens, cleanup=True):
+        with self.__transaction() as conn:
+            cleanup_gtokens = []
+            if cleanup:
+                cleanup_gtokens = self.get_games_for_token(ctoken)
+            conn.execute("DELETE FROM comp_games WHERE comp = ?", (ctoken,))
+            conn.executemany(
+                "INSERT OR IGNORE INTO comp_games (comp, game) VALUES (?, ?)",
+                [(ctoken, gtoken) for gtoken in new_gtokens],
+            )
+            for gtoken in cleanup_gtokens:
+                self.delete_game(gtoken)
+
+    def get_game_frames(self, gtoken):
+        return unpack(self.__query_value("SELECT frames FROM games WHERE token = ?", (gtoken,)))
+
+    def get_player_game_data(self, gtoken, token):
+        return unpack(
+            self.__query_value("SELECT data FROM game_players WHERE game = ? AND player = ?", (gtoken, token))
+        )
+
+    def get_games_for_token(self, token):
+        if self.is_user_token(token):
+            return self.__query_column("SELECT game FROM game_players WHERE player = ?", (token,))
+        elif self.is_comp_token(token):
+            return self.__query_column("SELECT game FROM comp_games WHERE comp = ?", (token,))
+        raise ValueError("Invalid token")
+
+    def get_game_timeline(self, token):
+        """Returns the tokens of the games a user played in ordered from oldest to newest. See
+        `GameDB.get_game_timeline`.
+        """
+        if not self.is_user_token(token):
+            raise ValueError("Invalid token")
+        return self.__query_column(
+            "SELECT game FROM game_players JOIN games ON games.token = game WHERE player = ? ORDER BY ctime", (token,)
+        )
+
+    def trim_game_timeline(self, token, keep, gtokens=None):
+        """Returns the newest `keep` games of a user and the older games as a (kept, dropped) tuple. See
+        `GameDB.trim_game_timeline`. Nothing needs to be trimmed since the timeline is a query.
+        """
+        counted = [gtoken for gtoken in self.get_game_timeline(token) if gtokens is None or gtoken in gtokens]
+        n_dropped = max(0, len(counted) - keep)
+        return counted[n_dropped:], counted[:n_dropped]
+
+    def get_active_code_and_options(self, token):
+        code_key = self.get_value(token=token, key=self.ACTIVE_CODE_KEY)
+        rows = self.__query(
+            "SELECT code, options FROM code JOIN code_blobs USING (hash) WHERE token = ? AND code_key = ?",
+            (token, code_key),
+        )
+        if not rows:
+            return None, {}
+        code, options = rows[0]
+        return code, unpack(options) or {}
+
+    def get_code_history(self, token):
+        """Returns all the code saved by a user as a list of (code key, code, options) tuples ordered from oldest to
+        newest. The code key is the `CTIME_HASH` name the code was saved under.
+        """
+        rows = self.__query(
+            "SELECT code_key, code, options FROM code JOIN code_blobs USING (hash) WHERE token = ?", (token,)
+        )
+        rows.sort(key=lambda row: int(row[0].split("_")[0]))
+        return [(code_key, code, unpack(options) or {}) for code_key, code, options in rows]
+
+    def remove_code(self, token, code_key):
+        """Removes code from a user's code history. See `GameDB.remove_code`."""
+        with self.__transaction() as conn:
+            if code_key == self.get_value(token, self.ACTIVE_CODE_KEY):
+                raise ValueError("The active code can not be removed.")
+            cursor = conn.execute("DELETE FROM code WHERE token = ? AND code_key = ?", (token, code_key))
+            if cursor.rowcount == 0:
+                raise ValueError("Token '{}' has no code '{}'".format(token, code_key))
+
+    def collect_code_garbage(self, grace_period=None):
+        """Removes the stored code which is not in any user's code history. Returns the number of distinct codes
+        removed. The grace period of `GameDB.collect_code_garbage` isn't needed since this runs in a transaction.
+        """
+        with self.__transaction() as conn:
+            return conn.execute("DELETE FROM code_blobs WHERE hash NOT IN (SELECT hash FROM code)").rowcount
+
+    def get_name(self, token):
+        for table in ("users", "schools", "competitions"):
+            rows = self.__query(f"SELECT name FROM {table} WHERE token = ?", (token,))
+            if rows:
+                return rows[0][0]
+        return None
+
+    def get_avg_score(self, token, default_value=None):
+        score = self.__query_value("SELECT avg_score FROM users WHERE token = ?", (token,))
+        if score is None:
+            return default_value
+        try:
+            # Try to convert to float
+            return float(score)
+        except ValueError as e:
+            # If failed return none
+            return default_value
+
+    def get_school_for_token(self, token):
+        return self.__query_value("SELECT school FROM users WHERE token = ?", (token,))
+
+    # Get tokens that belong to a school
+    def get_tokens_for_school(self, school_tk):
+        return self.__query_column("SELECT token FROM users WHERE school = ?", (school_tk,))
+
+    def get_school_tokens(self):
+        return self.__query_column("SELECT token FROM schools")
+
+    def get_players_for_game(self, gtoken):
+        return self.__query_column("SELECT player FROM game_players WHERE game = ?", (gtoken,))
+
+    def get_all_game_tokens(self):
+        return self.__query_column("SELECT token FROM games")
+
+    def get_all_comp_tokens(self):
+        return self.get_comp_tokens()
+
+    def get_exception_tokens(self):
+        return self.__query_column("SELECT token FROM exceptions")
+
+    def delete_game(self, gtoken):
+        with self.__transaction() as conn:
+            # The game's players and competition entries are removed by the `ON DELETE CASCADE` constraints.
+            cursor = conn.execute("DELETE FROM games WHERE token = ?", (gtoken,))
+            assert cursor.rowcount == 1, "Token '{}' must be a game token".format(gtoken)
+
+    def reap_deleted_games(self, limit=None):
+        """Games are deleted immediately by `delete_game`, so there is nothing to reap. See
+        `GameDB.reap_deleted_games`.
+        """
+        return {"games": 0, "references": 0, "seconds": 0.0, "games_per_second": 0.0}
+
+    def save_exception(self, exception_report, _token=None):
+        with self.__transaction() as conn:
+            token = _token
+            if token is None:
+                token = self.__get_new_token("exceptions", prefix="E")
+            conn.execute("INSERT INTO exceptions (token, report) VALUES (?, ?)", (token, pack(exception_report)))
+        return token
+
+    def get_exception(self, token):
+        assert self.is_exception_token(token)
+        return unpack(self.__query_value("SELECT report FROM exceptions WHERE token = ?", (token,)))
+
+    def find_code_hashes(self, code_hash_prefix):
+        """Returns the sorted list of the hashes of saved code which start with `code_hash_prefix`."""
+        # The range makes the prefix match use the `code_by_hash` index. Hashes are lower case hex.
+        return self.__query_column(
+            "SELECT DISTINCT hash FROM code WHERE hash >= ? AND hash < ? ORDER BY hash",
+            (code_hash_prefix, code_hash_prefix + "g"),
+        )
+
+    def get_code_by_hash(self, code_hash_prefix):
+        """Returns the code for the code hash or a list of hashes if the code hash prefix matches multiple codes."""
+        # The range makes the prefix match use the `code_by_hash` index. Hashes are lower case hex.
+        rows = self.__query(
+            "SELECT hash, code FROM code_blobs WHERE hash >= ? AND hash < ? AND hash IN (SELECT hash FROM code)",
+            (code_hash_prefix, code_hash_prefix + "g"),
+        )
+        if len(rows) == 1:
+            return rows[0][1]
+        return [code_hash for code_hash, code in rows]
+
+    def get_code_and_options_by_hash(self, code_hash):
+        """Returns the code and options with the hash `code_hash`. See `GameDB.get_code_and_options_by_hash`."""
+        rows = self.__query(
+            "SELECT code, options FROM code_blobs WHERE hash = ? AND hash IN (SELECT hash FROM code)", (code_hash,)
+        )
+        if not rows:
+            return None, {}
+        code, options = rows[0]
+        return code, unpack(options) or {}
+
+    def get_code_owners(self, code_hash):
+        """Returns who saved the code with the hash `code_hash` as a list of (token, ctime) tuples ordered from oldest
+        to newest. See `GameDB.get_code_owners`.
+        """
+        rows = self.__query("SELECT token, code_key FROM code WHERE hash = ?", (code_hash,))
+        return sorted(((token, int(code_key.split("_")[0])) for token, code_key in rows), key=lambda owner: owner[1])
+
+    def import_game_db(self, gamedb, debug=False):
+        """Copies all the data from another game database (for example a file based `GameDB`) into this database.
+
+        Args:
+            gamedb: The game database to copy from.
+            debug (bool): If True print the progress.
+        """
+        for stoken in gamedb.get_school_tokens():
+            if debug:
+                print("Importing school '{}'...".format(stoken))
+            with self.__transaction():
+                self.add_new_school(gamedb.get_name(stoken) or "", _token=stoken)
+                for token in gamedb.get_tokens_for_school(stoken):
+                    self.__import_user(gamedb, token, stoken)
+
+        for ctoken in gamedb.get_all_comp_tokens():
+            if debug:
+                print("Importing competition '{}'...".format(ctoken))
+            with self.__transaction():
+                self.add_new_competition(gamedb.get_name(ctoken) or "", _token=ctoken)
+                for stoken in gamedb.get_schools_in_comp(ctoken):
+                    if not self.is_school_token(stoken):
+                        continue
+                    self.add_school_to_comp(ctoken, stoken)
+                    code = gamedb.get_comp_code(ctoken, stoken)
+                    if code is not None:
+                        self.set_comp_school_code(ctoken, stoken, code)
+                    score = gamedb.get_comp_avg_score(ctoken, stoken)
+                    if score is not None:
+                        self.set_comp_avg_score(ctoken, stoken, score)
+
+        gtokens = gamedb.get_all_game_tokens()
+        for i, gtoken in enumerate(gtokens):
+            if debug and i % 1000 == 0:
+                print("Importing games {}/{}...".format(i, len(gtokens)))
+            with self.__transaction():
+                per_player_data = {}
+                for token in gamedb.get_players_for_game(gtoken):
+                    if self.is_user_token(token):
+                        per_player_data[token] = gamedb.get_player_game_data(gtoken, token)
+                self.add_new_game(
+                    gamedb.get_game_frames(gtoken),
+                    per_player_data=per_player_data,
+                    _token=gtoken,
+                    _ctime=gamedb.get_ctime_for_game(gtoken),
+                )
+
+        with self.__transaction():
+            for ctoken in gamedb.get_all_comp_tokens():
+                for gtoken in gamedb.get_games_for_token(ctoken):
+                    if self.is_game_token(gtoken):
+                        self.add_game_to_comp(ctoken, gtoken)
+
+        for token in gamedb.get_exception_tokens():
+            self.save_exception(gamedb.get_exception(token), _token=token)
+
+    def __import_user(self, gamedb, token, stoken):
+        self.get_new_token(stoken, _token=token)
+        # This upgrades code stored in the oldest style so it shows up in the code history.
+        gamedb.get_active_code_and_options(token)
+        for code_key, code, options in gamedb.get_code_history(token):
+            if code is not None:
+                self.save_code(token, code, options, set_as_active=False, _code_key=code_key)
+        for key, value in gamedb.get_values(token).items():
+            self.save_value(token, key, value)
+        name = gamedb.get_name(token)
+        if name is not None:
+            self.save_name(token, name)
+        score = gamedb.get_avg_score(token)
+        if score is not None:
+            self.save_avg_score(token, score)
+
+
+def migrate_file_db(src_root, dest_root=None, debug=False):
+    """Imports a file based game directory into a new SQLite game database.
+
+    The database is built under a temporary name and only moved into place once the import has finished, so an
+    interrupted migration never leaves a partial database that `open_game_db` would pick up.
+
+    Args:
+        src_root (str): The root directory of the file based game database.
+        dest_root (str): The root directory to create the SQLite database in. Defaults to `src_root`.
+        debug (bool): If True print the progress.
+
+    Returns:
+        SQLiteGameDB: The new database.
+    """
+    from CYLGame.Database import GameDB
+
+    if dest_root is None:
+        dest_root = src_root
+    if SQLiteGameDB.exists(dest_root):
+        raise ValueError("'{}' already contains a SQLite game database".format(dest_root))
+
+    tmp_filename = SQLiteGameDB.DB_FILENAME + ".importing"
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(os.path.join(dest_root, tmp_filename + suffix)):
+            os.remove(os.path.join(dest_root, tmp_filename + suffix))
+
+    tmp_db = SQLiteGameDB(dest_root, filename=tmp_filename)
+    tmp_db.import_game_db(GameDB(src_root), debug=debug)
+    tmp_db.close()
+    os.rename(os.path.join(dest_root, tmp_filename), os.path.join(dest_root, SQLiteGameDB.DB_FILENAME))
+    return SQLiteGameDB(dest_root)
@@ -0,0 +1,125 @@
+import math
+import multiprocessing
+import os
+import queue
+import threading
+import traceback
+from random import randint
+
+from .Game import GameRunner
+from .Player import Room
+
+# These are set in each process of the pool.
+_results = None
+_cancelled = None
+
+
+def _init_worker(results, cancelled):
+    global _results, _cancelled
+    _results, _cancelled = results, cancelled
+
+
+def _run_games(game_class, call_id, bots, seeds):
+    """Plays a game for each seed and sends back the scores. Returns the number of results which were sent."""
+    runner = GameRunner(game_class)
+    sent = 0
+    for seed in seeds:
+        if _cancelled.value >= call_id:
+            break
+        sent += 1
+        try:
+            _results.put((call_id, runner.run(Room(bots, seed=seed), playback=False).score, None))
+        except Exception:
+            _results.put((call_id, None, "Seed {}:\n{}".format(seed, traceback.format_exc())))
+            break
+    return sent
+
+
+class ScoringError(Exception):
+    pass
+
+
+class ScorePool(object):
+    """A pool of processes which play games for their scores. The pool is kept between calls so the processes are only
+    started once.
+
+    Each process is sent the bots once per call along with its share of the seeds, and sends back the score of every
+    game as soon as it is over.
+    """
+
+    POLL_INTERVAL = 0.1
+
+    def __init__(self, processes=None):
+        self.processes = processes or multiprocessing.cpu_count()
+        self.pid = os.getpid()
+        self.results = multiprocessing.Queue()
+        self.cancelled = multiprocessing.Value("q", 0, lock=False)
+        self.pool = multiprocessing.Pool(self.processes, _init_worker, (self.results, self.cancelled))
+        self.lock = threading.Lock()
+        self.last_call_id = 0
+
+    def close(self):
+        self.pool.terminate()
+        self.pool.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def scores(self, game_class, room, times, tolerance=None, z=1.96, min_games=10):
+        """Plays `times` randomly seeded games with the bots of `room` and returns their scores in the order the games
+        finish.
+
+        If `tolerance` is given it stops early once `min_games` have been played and the `z` confidence interval of the
+        mean score is within `tolerance` of the mean. The default `z` is for a 95% interval.
+
+        Raises:
+            ScoringError: If a game raised an exception.
+        """
+        seeds = [randint(0, 2**62) for _ in range(times)]
+        with self.lock:
+            self.last_call_id += 1
+            call_id = self.last_call_id
+            try:
+                return self.__collect(game_class, room, seeds, call_id, tolerance, z, min_games)
+            finally:
+                # Any games of this call which haven't started yet are skipped.
+                self.cancelled.value = call_id
+
+    def __collect(self, game_class, room, seeds, call_id, tolerance, z, min_games):
+        tasks = [
+            self.pool.apply_async(_run_games, (game_class, call_id, room.bots, seeds[i :: self.processes]))
+            for i in range(min(self.processes, len(seeds)))
+        ]
+        scores = []
+        received = 0
+        mean, m2 = 0.0, 0.0
+        while len(scores) < len(seeds):
+            try:
+                result_call_id, score, error = self.results.get(timeout=self.POLL_INTERVAL)
+            except queue.Empty:
+                # The results are sent separately from the return values of the tasks, so the tasks can be done while
+                # their results are still on the way.
+                if all(task.ready() for task in tasks) and received >= sum(task.get() for task in tasks):
+                    raise ScoringError("The scoring pool stopped before all of the games were played.")
+                continue
+            if result_call_id != call_id:
+                # Left over from a call which stopped early.
+                continue
+            received += 1
+            if error is not None:
+                raise ScoringError(error)
+            scores += [score]
+
+            n = len(scores)
+            delta = score - mean
+            mean += delta / n
+            m2 += delta * (score - mean)
+            if tolerance is not None and n >= max(min_games, 2) and z * math.sqrt(m2 / (n - 1) / n) <= tolerance:
+                break
+        return scores
+
+    def avg_score(self, game_class, room, times, func, tolerance=None, z=1.96, min_games=10):
+        return func(self.scores(game_class, room, times, tolerance=tolerance, z=z, min_games=min_games))
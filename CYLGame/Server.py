@@ -1,7 +1,10 @@
 from __future__ import print_function
 
+from typing import Optional, Union
+
 import multiprocessing
 import os
+import pickle
 import random
 import shutil
 import sys
@@ -18,15 +21,27 @@ from flask_request_id_header.middleware import RequestID
 
 from CYLGame.Comp import MultiplayerCompRunner, RollingMultiplayerCompRunner
 
-from .Database import GameDB
-from .Game import GameLanguage, GameRunner, GridGame, average
+from .Cache import SharedCache, compiled_cache
+from .Database import GameReaper, open_game_db
+from .Frame import expand_frames, frame_to_list
+from .Game import GameLanguage, GameRunner, GridGame, PlayGameState, average
+from .Jobs import JobError, JobQueue, call_view
 from .Log import setup_logging
 from .Player import LittlePythonProg, Prog, Room
+from .Scoring import ScorePool
 from .Utils import int2base
 
 ANONYMOUS_COMP = "P00000000"
 ANONYMOUS_SCHOOL = "S00000000"
 ANONYMOUS_USER = "00000000"
+GAME_REAPER_INTERVAL = 10  # Seconds
+MAX_JOB_WAIT = 30  # Seconds
+GAME_MAX_AGE = 365 * 24 * 60 * 60  # Seconds
+BOT_RUNTIME_ERROR = (
+    "Your bot ran into an error at runtime.\n"
+    "If you think that your bot is correct, please file a bug report!\n"
+    "Make sure to include your code."
+)
 
 
 def get_public_ip():
@@ -68,7 +83,16 @@ class GameServer(flask_classful.FlaskView):
     _avg_game_func = None
     charset = None
     gamedb = None
-    play_game_cache: LRUCache
+    play_game_cache: Union[SharedCache, LRUCache]
+    play_checkpoint_cache: Union[SharedCache, LRUCache]
+    play_checkpoint_interval = 32
+    replay_by_seed = False
+    replay_cache: LRUCache
+    game_json_cache: LRUCache
+    sim_jobs: Optional[JobQueue] = None
+    avg_game_processes = 0
+    avg_game_tolerance = None
+    _score_pool: Optional[ScorePool] = None
     # log: Logger = None
     route_base = "/"
 
@@ -100,11 +124,53 @@ class GameServer(flask_classful.FlaskView):
 
     def _compile(self, code: str, options: dict, token: str = None, name: str = None, code_hash: str = "N/A") -> Prog:
         if self.language == GameLanguage.LITTLEPY:
-            return LittlePythonProg(
-                self.compiler.compile(code), options=options, token=token, name=name, code_hash=code_hash
-            )
+            prog = compiled_cache.compile(self.language, code, self.compiler.compile)
+            return LittlePythonProg(prog, options=options, token=token, name=name, code_hash=code_hash)
         raise Exception(f"No compiler found for language {self.language}")
 
+    def _save_room(self, room):
+        """Saves a room which was run with playback. When replaying by seed only the inputs needed to replay it are
+        saved, and the frames are kept in the replay cache since the game is usually viewed right away.
+        """
+        replay = GameRunner(self.game).get_replay(room) if self.replay_by_seed else None
+        gtoken = room.save(self.gamedb, replay=replay)
+        if replay is not None:
+            self.replay_cache[gtoken] = (
+                {"screen": room.screen_cap, "seed": int2base(room.seed, 36)},
+                room.get_player_data(),
+            )
+        return gtoken
+
+    def _load_prog(self, code_hash, token, name):
+        code, options = self.gamedb.get_code_and_options_by_hash(code_hash)
+        if code is None:
+            raise ValueError("The code '{}' no longer exists.".format(code_hash))
+        return self._compile(code=code, options=options, token=token, name=name, code_hash=code_hash)
+
+    def _get_game_data(self, gtoken):
+        """Returns the frames of a game and the data of its players by token. The data of the players is None if it is
+        saved with the players.
+        """
+        data = self.gamedb.get_game_frames(gtoken)
+        if data is None or "replay" not in data:
+            return data, None
+        if gtoken not in self.replay_cache:
+            room = GameRunner(self.game).replay(data["replay"], self._load_prog)
+            self.replay_cache[gtoken] = ({"screen": room.screen_cap, "seed": data["seed"]}, room.get_player_data())
+        game_data, player_data = self.replay_cache[gtoken]
+        return dict(game_data), player_data
+
+    @staticmethod
+    def _frames_format():
+        return "delta" if flask.request.args.get("frames") == "delta" else "full"
+
+    @classmethod
+    def _encode_frames(cls, data):
+        """Expands delta encoded frames to full frames unless the client asked for them with `?frames=delta`."""
+        if data is not None and cls._frames_format() != "delta":
+            data["screen"] = expand_frames(data["screen"])
+        return data
+
     def before_request(self, name, **kwarg):
         if has_request_context():
             self.app.logger.debug(f"{flask.request.method} {flask.request.url}")
@@ -171,12 +237,45 @@ class GameServer(flask_classful.FlaskView):
 
         return flask.jsonify(message="success")
 
+    def _game_json_response(self, key, encode):
+        """Responds with the JSON `encode()` returns for a stored game, or a 404 if it returns None. Stored games never
+        change, so the JSON is kept in `game_json_cache` and clients are told to keep it for good and revalidate it
+        with its ETag.
+        """
+        # The ETag is weak since the body is compressed by Flask-Compress when compression is enabled.
+        etag = "-".join(key)
+        if flask.request.if_none_match.contains_weak(etag):
+            response = flask.Response(status=304)
+        else:
+            body = self.game_json_cache.get(key)
+            if body is None:
+                body = encode()
+                if body is None:
+                    response = flask.jsonify(error="Game not found")
+                    response.status_code = 404
+                    return response
+                if len(body) <= self.game_json_cache.maxsize:
+                    self.game_json_cache[key] = body
+            response = flask.Response(body, mimetype="application/json")
+        response.set_etag(etag, weak=True)
+        response.headers["Cache-Control"] = "public, max-age={}, immutable".format(GAME_MAX_AGE)
+        return response
+
     @flask_classful.route("/game/<gtoken>")
     def get_game_data(self, gtoken):
         if not self.gamedb.is_game_token(gtoken):
             return flask.jsonify(error="Invalid Game Token")
 
-        return ujson.dumps(self.gamedb.get_game_frames(gtoken))
+        def encode():
+            data, player_data = self._get_game_data(gtoken)
+            if data is None:
+                return None
+            return ujson.dumps(self._encode_frames(data))
+
+        try:
+            return self._game_json_response((gtoken, self._frames_format()), encode)
+        except ValueError:
+            return flask.jsonify(error="This game can no longer be replayed")
 
     @flask_classful.route("/game/<gtoken>/<token>")
     def get_player_game_data(self, gtoken, token):
@@ -187,13 +286,33 @@ class GameServer(flask_classful.FlaskView):
         if not self.gamedb.is_user_token(token):
             return flask.jsonify(error="Invalid User Token")
 
-        data = self.gamedb.get_game_frames(gtoken)
-        data["player"] = self.gamedb.get_player_game_data(gtoken, token)
+        def encode():
+            data, player_data = self._get_game_data(gtoken)
+            if data is None:
+                return None
+            if player_data is None:
+                data["player"] = self.gamedb.get_player_game_data(gtoken, token)
+            else:
+                data["player"] = player_data.get(token)
+            return ujson.dumps(self._encode_frames(data))
 
+        # Anonymous games are deleted once they are viewed, so they aren't cached.
         if token == ANONYMOUS_USER:
+            try:
+                body = encode()
+            except ValueError:
+                return flask.jsonify(error="This game can no longer be replayed")
             self.gamedb.delete_game(gtoken)
+            if body is None:
+                response = flask.jsonify(error="Game not found")
+                response.status_code = 404
+                return response
+            return body
 
-        return ujson.dumps(data)
+        try:
+            return self._game_json_response((gtoken, token, self._frames_format()), encode)
+        except ValueError:
+            return flask.jsonify(error="This game can no longer be replayed")
 
     @flask_classful.route("/player")
     def get_player(self):
@@ -210,61 +329,56 @@ class GameServer(flask_classful.FlaskView):
                 char_set=self.charset,
             )
 
-    @flask_classful.route("/sim_avg", methods=["POST"])
-    def sim_avg(self):
-        # TODO: create this to run the game 100 times returning the average score to the user.
-        code = flask.request.get_json(silent=True).get("code", "")
-        token = flask.request.get_json(silent=True).get("token", "").upper()
-        options = flask.request.get_json(silent=True).get("options", {})
+    @classmethod
+    def _get_score_pool(cls):
+        """Returns the pool which plays the games of /sim_avg in this process, or None to play them one at a time. The
+        pool is started the first time it is needed since processes can't use the pool of the process they were forked
+        from.
+        """
+        if not cls.avg_game_processes:
+            return None
+        if cls._score_pool is None or cls._score_pool.pid != os.getpid():
+            cls._score_pool = ScorePool(cls.avg_game_processes)
+        return cls._score_pool
+
+    def _run_sim_avg(self, code, token, options):
         if not self.gamedb.is_user_token(token):
-            return flask.jsonify(error="Invalid Token")
+            return {"error": "Invalid Token"}
         try:
             prog = self._compile(code=code, options=options)
         except:
-            return flask.jsonify(error="Code did not compile")
+            return {"error": "Code did not compile"}
         if self.game.MULTIPLAYER:
             self.gamedb.save_code(token, code, options)
             name = find_name_from_code(code)
             if name:
                 self.gamedb.save_name(token, name)
-            return flask.jsonify(score="still being computed. Check scoreboard later.")
+            return {"score": "still being computed. Check scoreboard later."}
         room = Room([prog])
         runner = GameRunner(self.game)
         try:
-            score = runner.run_for_avg_score(room, times=self.avg_game_count, func=self._avg_game_func)
+            score = runner.run_for_avg_score(
+                room,
+                times=self.avg_game_count,
+                func=self._avg_game_func,
+                pool=self._get_score_pool(),
+                tolerance=self.avg_game_tolerance,
+            )
             self.gamedb.save_avg_score(token, score)
             self.gamedb.save_code(token, code, options)
             name = find_name_from_code(code)
             if name:
                 self.gamedb.save_name(token, name)
-            return flask.jsonify(score=score)
+            return {"score": score}
         except Exception as e:
             traceback.print_exc(file=sys.stdout)
-            return flask.jsonify(
-                error="Your bot ran into an error at runtime.\n"
-                "If you think that your bot is correct, please file a bug report!\n"
-                "Make sure to include your code."
-            )
+            return {"error": BOT_RUNTIME_ERROR}
 
-    @flask_classful.route("/sim", methods=["POST"])
-    def sim(self):
-        code = flask.request.get_json(silent=True).get("code", "")
-        seed_str = flask.request.get_json(silent=True).get("seed", "")
-        token = flask.request.get_json(silent=True).get("token", "").upper()
-        opponents = flask.request.get_json(silent=True).get("opponents", None)
-        options = flask.request.get_json(silent=True).get("options", None)
-        if options is None:
-            options = {}
-        seed = random.randint(0, sys.maxsize)
-        if seed_str:
-            try:
-                seed = int(seed_str, 36)
-            except:
-                return flask.jsonify(error="Invalid Seed")
+    def _run_sim(self, code, seed, token, opponents, options):
         try:
             prog = self._compile(code=code, options=options, token=ANONYMOUS_USER, name="Your bot")
         except:
-            return flask.jsonify(error="Code did not compile")
+            return {"error": "Code did not compile"}
         if self.gamedb.is_user_token(token):
             prog.code_hash = self.gamedb.save_code(token=token, code=code, options=options, set_as_active=False)
         room = Room(bots=[prog], seed=seed)
@@ -277,24 +391,77 @@ class GameServer(flask_classful.FlaskView):
             else:
                 for opponent in opponents:
                     if opponent == ANONYMOUS_USER:
-                        opponent_prog = self._compile(code=code, options=options, name="Your other bot")
+                        opponent_prog = self._compile(
+                            code=code, options=options, name="Your other bot", code_hash=prog.code_hash
+                        )
                         players += [opponent_prog]
                     else:
-                        return flask.jsonify(error="Not implemented yet :(")
+                        return {"error": "Not implemented yet :("}
 
             room = Room(bots=[prog] + players, seed=seed)
         runner = GameRunner(self.game)
         try:
-            gtoken = runner.run(room, playback=True).save(self.gamedb)
-            result = ujson.dumps({"gtoken": gtoken})
+            gtoken = self._save_room(runner.run(room, playback=True))
         except Exception:
             traceback.print_exc(file=sys.stdout)
-            return flask.jsonify(
-                error="Your bot ran into an error at runtime.\n"
-                "If you think that your bot is correct, please file a bug report!\n"
-                "Make sure to include your code."
-            )
-        return result
+            return {"error": BOT_RUNTIME_ERROR}
+        return {"gtoken": gtoken}
+
+    def _run_or_queue(self, method_name, kwargs):
+        """Runs a simulation in this request, or in the job queue when the client asked for it with `"async": true`. A
+        queued simulation responds with the id of its job, which is polled with `/job/<job_id>`.
+        """
+        if self.sim_jobs is None or not flask.request.get_json(silent=True).get("async", False):
+            return flask.jsonify(getattr(self, method_name)(**kwargs))
+        key = kwargs["token"] or flask.request.remote_addr
+        try:
+            job_id = self.sim_jobs.submit(key, call_view, type(self), method_name, kwargs)
+        except JobError as e:
+            return flask.jsonify(error=str(e))
+        return flask.jsonify(job=job_id)
+
+    @flask_classful.route("/sim_avg", methods=["POST"])
+    def sim_avg(self):
+        # TODO: create this to run the game 100 times returning the average score to the user.
+        code = flask.request.get_json(silent=True).get("code", "")
+        token = flask.request.get_json(silent=True).get("token", "").upper()
+        options = flask.request.get_json(silent=True).get("options", {})
+        return self._run_or_queue("_run_sim_avg", dict(code=code, token=token, options=options))
+
+    @flask_classful.route("/sim", methods=["POST"])
+    def sim(self):
+        code = flask.request.get_json(silent=True).get("code", "")
+        seed_str = flask.request.get_json(silent=True).get("seed", "")
+        token = flask.request.get_json(silent=True).get("token", "").upper()
+        opponents = flask.request.get_json(silent=True).get("opponents", None)
+        options = flask.request.get_json(silent=True).get("options", None)
+        if options is None:
+            options = {}
+        seed = random.randint(0, sys.maxsize)
+        if seed_str:
+            try:
+                seed = int(seed_str, 36)
+            except:
+                return flask.jsonify(error="Invalid Seed")
+        return self._run_or_queue(
+            "_run_sim", dict(code=code, seed=seed, token=token, opponents=opponents, options=options)
+        )
+
+    @flask_classful.route("/job/<job_id>")
+    def get_job(self, job_id):
+        """Returns the status of a simulation job and its result once it is done. With `?wait=<seconds>` the response
+        is held until the job is done or the time is up.
+        """
+        if self.sim_jobs is None:
+            return flask.jsonify(error="Invalid Job")
+        try:
+            wait = min(max(float(flask.request.args.get("wait", 0)), 0), MAX_JOB_WAIT)
+        except ValueError:
+            wait = 0
+        status = self.sim_jobs.wait(job_id, wait) if wait else self.sim_jobs.status(job_id)
+        if status is None:
+            return flask.jsonify(error="Invalid Job")
+        return flask.jsonify(status)
 
     @flask_classful.route("/check_token", methods=["POST"])
     def check_token(self):
@@ -332,22 +499,57 @@ class GameServer(flask_classful.FlaskView):
         seed_str = int2base(seed, 36)
         hash_key = seed_str + moves
 
-        if hash_key in self.play_game_cache:
+        game_state = self.play_game_cache.pop(hash_key, None)
+        if game_state is not None:
             self.app.logger.debug("In cache")
-            game_state = self.play_game_cache.pop(hash_key)
         else:
             self.app.logger.debug(f"Not in Cache. Hash Key: '{hash_key}'")
-            game_state = GameRunner(self.game).init_game(seed=seed)
-            for prev_move in moves:
-                game_state = GameRunner.move_game(game_state, prev_move)
+            game_state = self.__replay_play_game(seed, seed_str, moves)
         if move:
             new_hash_key = hash_key + move
             game_state = GameRunner.move_game(game_state, move)
             self.play_game_cache[new_hash_key] = game_state
             self.app.logger.debug(f"Storing Cache. Hash Key: '{new_hash_key}'")
+            self.__checkpoint_play_game(seed_str, game_state)
 
         state = {"seed": seed_str, "moves": game_state.moves}
-        return flask.jsonify(frame=game_state.frame, state=state, lost=not game_state.game.is_running())
+        lost = not game_state.game.is_running()
+        # Clients which already have the previous frame can ask for only the cells which changed.
+        if move and request.get("frames") == "changes" and game_state.changes is not None:
+            return flask.jsonify(changes=game_state.changes, state=state, lost=lost)
+        return flask.jsonify(frame=frame_to_list(game_state.frame), state=state, lost=lost)
+
+    def __checkpoint_play_game(self, seed_str, game_state):
+        """Saves a snapshot of the game every `play_checkpoint_interval` moves."""
+        interval = self.play_checkpoint_interval
+        if not interval or not game_state.moves or len(game_state.moves) % interval:
+            return
+        key = seed_str + game_state.moves
+        if self.play_checkpoint_cache.get(key) is not None:
+            return
+        try:
+            self.play_checkpoint_cache[key] = game_state.snapshot()
+        except (pickle.PicklingError, TypeError, AttributeError):
+            self.app.logger.warning(f"Unable to checkpoint game. Hash Key: '{key}'", exc_info=True)
+
+    def __replay_play_game(self, seed, seed_str, moves):
+        """Rebuilds the game after `moves` from the latest checkpoint of it. Only the last move is drawn."""
+        game_state, start = None, 0
+        interval = self.play_checkpoint_interval
+        if interval:
+            for start in range(len(moves) - len(moves) % interval, 0, -interval):
+                snapshot = self.play_checkpoint_cache.get(seed_str + moves[:start])
+                if snapshot is not None:
+                    self.app.logger.debug(f"Restoring checkpoint after {start} moves.")
+                    game_state = PlayGameState.restore(snapshot)
+                    break
+        if game_state is None:
+            start = 0
+            game_state = GameRunner(self.game).init_game(seed=seed)
+        for prev_move in moves[start:]:
+            game_state = GameRunner.move_game(game_state, prev_move, draw=False)
+            self.__checkpoint_play_game(seed_str, game_state)
+        return GameRunner.redraw_game(game_state)
 
     def index(self):
         intro = self.game.get_intro() + GameLanguage.get_language_description(self.language)
@@ -395,8 +597,22 @@ class GameServer(flask_classful.FlaskView):
         debug=False,
         reuse_addr=None,
         play_cache_size=64,
+        play_cache_ttl=3600,
+        shared_play_cache=True,
+        play_checkpoint_interval=32,
+        play_checkpoint_cache_size=256,
+        avg_game_processes=0,
+        avg_game_tolerance=None,
+        sim_job_processes=None,
+        sim_job_queue_size=64,
+        sim_job_rate_limit=10,
+        sim_job_rate_period=60,
+        replay_by_seed=False,
+        replay_cache_size=32,
+        game_json_cache_size=64 * 1024 * 1024,
         error_log_file="{dbfile}/log/error.log",
         debug_log_file="{dbfile}/log/debug.log",
+        db_backend=None,
     ):
         cls.game = game
         cls.host = host
@@ -405,8 +621,28 @@ class GameServer(flask_classful.FlaskView):
         cls.language = language
         cls.avg_game_count = avg_game_count
         cls._avg_game_func = avg_game_func
-        cls.gamedb = GameDB(game_data_path)
-        cls.play_game_cache = LRUCache(play_cache_size)
+        # The games of /sim_avg are played by a pool of this many processes when it isn't 0, stopping early once the
+        # average score is known to within avg_game_tolerance.
+        cls.avg_game_processes = avg_game_processes
+        cls.avg_game_tolerance = avg_game_tolerance
+        cls.gamedb = open_game_db(game_data_path, backend=db_backend)
+        # Compiled programs are kept on disk so restarted servers don't compile every bot again.
+        compiled_cache.set_path(os.path.join(game_data_path, "compiled"))
+        # The game states of /play are shared by all the worker processes so the next move can be handled by any of
+        # them without replaying the game.
+        if shared_play_cache:
+            cls.play_game_cache = SharedCache(play_cache_size, play_cache_ttl)
+            cls.play_checkpoint_cache = SharedCache(play_checkpoint_cache_size, play_cache_ttl)
+        else:
+            cls.play_game_cache = LRUCache(play_cache_size)
+            cls.play_checkpoint_cache = LRUCache(play_checkpoint_cache_size)
+        # A game which isn't in the play cache is replayed from its latest checkpoint. Set to 0 to always replay it
+        # from the start.
+        cls.play_checkpoint_interval = play_checkpoint_interval
+        cls.replay_by_seed = replay_by_seed
+        cls.replay_cache = LRUCache(replay_cache_size)
+        # The JSON of the most viewed games, limited to game_json_cache_size characters in all.
+        cls.game_json_cache = LRUCache(game_json_cache_size, getsizeof=len)
         # setup anonymous school with an anonymous user
         if not cls.gamedb.is_school_token(ANONYMOUS_SCHOOL):
             cls.gamedb.add_new_school(_token=ANONYMOUS_SCHOOL)
@@ -450,6 +686,16 @@ class GameServer(flask_classful.FlaskView):
         RequestID(cls.app)
         cls.register(cls.app)
         cls.__load_language()
+        # Simulations can be run by a pool of processes so a long game doesn't stall the other requests of a worker.
+        # This must be started after the server is set up since the pool processes are forked from it. Set
+        # sim_job_queue_size to 0 to always run them in the request.
+        if sim_job_queue_size:
+            cls.sim_jobs = JobQueue(
+                processes=sim_job_processes,
+                max_pending=sim_job_queue_size,
+                rate_limit=sim_job_rate_limit,
+                rate_period=sim_job_rate_period,
+            )
 
         @cls.app.errorhandler(500)
         def page_not_found(error):
@@ -471,10 +717,19 @@ class GameServer(flask_classful.FlaskView):
             if debug:
                 print("Starting scoring process...")
             scoring_process = RollingMultiplayerCompRunner(
-                multiplayer_scoring_interval, cls.gamedb, cls.game, cls.compiler, debug=debug
+                multiplayer_scoring_interval,
+                cls.gamedb,
+                cls.game,
+                cls.compiler,
+                replay_by_seed=replay_by_seed,
+                debug=debug,
             )
             scoring_process.start()
 
+        # Deleted games are cleaned up in the background so deleting them never stalls serving or scoring.
+        reaper = GameReaper(GAME_REAPER_INTERVAL, cls.gamedb, debug=debug)
+        reaper.start()
+
         if debug:
             print("Debug Enabled.")
             cls.app.run(cls.host, cls.port)
@@ -501,6 +756,13 @@ class GameServer(flask_classful.FlaskView):
         print("Dying...")
         if scoring_process:
             scoring_process.stop()
+        reaper.stop()
+        reaper.join()
+        if shared_play_cache:
+            cls.play_game_cache.shutdown()
+            cls.play_checkpoint_cache.shutdown()
+        if cls.sim_jobs is not None:
+            cls.sim_jobs.shutdown()
         print("All good :)")
 
 
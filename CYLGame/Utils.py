@@ -4,10 +4,13 @@ import functools
 import hashlib
 import io
 import math
+import os
 import string
 import warnings
 from pathlib import Path
 
+import gevent
+import msgpack
 from Crypto.Cipher import AES
 
 
@@ -130,6 +133,22 @@ def deprecated(message=""):
     return deprecated_decorator
 
 
+_thread_pool_pid = None
+
+
+def call_in_thread(func, *args):
+    """Calls `func(*args)` in gevent's thread pool and returns its result. The server doesn't monkey patch, so a
+    blocking call, e.g. to a manager process, would otherwise stall every greenlet of the process instead of only the
+    calling one.
+    """
+    global _thread_pool_pid
+    if _thread_pool_pid != os.getpid():
+        # The thread pool of a hub inherited by a forked process can't be used until the hub is reinitialized.
+        gevent.reinit()
+        _thread_pool_pid = os.getpid()
+    return gevent.get_hub().threadpool.apply(func, args)
+
+
 def hash_string(s, encoding="utf8"):
     buf = io.BytesIO()
     buf.write(bytes(s, encoding=encoding))
@@ -137,6 +156,16 @@ def hash_string(s, encoding="utf8"):
     return hash_stream(buf)
 
 
+def hash_code(code, options=None):
+    """Returns the hash which identifies a user's code and options."""
+    buf = io.BytesIO()
+    buf.write(bytes(code, encoding="utf8"))
+    if options:
+        msgpack.dump(options, buf)
+    buf.seek(0)
+    return hash_stream(buf)
+
+
 def hash_stream(fp):
     BUF_SIZE = 65536
     sha = hashlib.sha256()
@@ -1,6 +1,6 @@
 from .Comp import Ranking
 from .Game import GameLanguage, GameRunner, GridGame, NonGridGame, run
-from .Panels import Map, MapPanel, MessagePanel, Panel, PanelBorder, PanelPadding, StatusPanel
+from .Panels import DenseMap, DenseMapPanel, Map, MapPanel, MessagePanel, Panel, PanelBorder, PanelPadding, StatusPanel
 from .Player import Player
 from .version import version
 
@@ -0,0 +1,121 @@
+from typing import Dict, List, Optional, Set, Tuple
+
+import heapq
+
+POS_TYPE = Tuple[int, int]
+
+
+class Metric(object):
+    MANHATTAN = 0
+    CHEBYSHEV = 1
+
+
+class SpatialIndex(object):
+    """An index of positions on a width by height grid which answers nearest, k-nearest and radius queries.
+
+    The positions are kept in square buckets of `bucket_size` cells. A query looks at the buckets in a window around
+    the position and doubles the window until it is sure to contain the answer, so only the positions near the query
+    position are measured.
+    """
+
+    DEFAULT_BUCKET_SIZE = 8
+
+    def __init__(self, width, height, bucket_size=DEFAULT_BUCKET_SIZE, positions=()):
+        self.w = width
+        self.h = height
+        self.bucket_size = bucket_size
+        self.buckets: Dict[POS_TYPE, Set[POS_TYPE]] = {}
+        self.size = 0
+        for pos in positions:
+            self.add(pos)
+
+    def __len__(self):
+        return self.size
+
+    def __bucket(self, pos):
+        return pos[0] // self.bucket_size, pos[1] // self.bucket_size
+
+    def add(self, pos: POS_TYPE):
+        bucket = self.buckets.setdefault(self.__bucket(pos), set())
+        if pos not in bucket:
+            bucket.add(pos)
+            self.size += 1
+
+    def remove(self, pos: POS_TYPE):
+        key = self.__bucket(pos)
+        bucket = self.buckets.get(key)
+        if bucket is not None and pos in bucket:
+            bucket.remove(pos)
+            self.size -= 1
+            if not bucket:
+                del self.buckets[key]
+
+    def offset(self, pos, other, wrap_x=False, wrap_y=False):
+        """Returns the (x, y) offset from `pos` to `other`. When wrapping the shortest way around is used."""
+        d_x, d_y = other[0] - pos[0], other[1] - pos[1]
+        if wrap_x:
+            d_x %= self.w
+            if d_x > self.w // 2:
+                d_x -= self.w
+        if wrap_y:
+            d_y %= self.h
+            if d_y > self.h // 2:
+                d_y -= self.h
+        return d_x, d_y
+
+    @staticmethod
+    def distance(offset, metric=Metric.MANHATTAN):
+        if metric == Metric.CHEBYSHEV:
+            return max(abs(offset[0]), abs(offset[1]))
+        return abs(offset[0]) + abs(offset[1])
+
+    def __bucket_indexes(self, lo, hi, size, wrap):
+        """Returns the indexes of the buckets which cover cells lo through hi of an axis."""
+        last = (size - 1) // self.bucket_size
+        if hi - lo + 1 >= size:
+            return range(0, last + 1)
+        if wrap:
+            lo, hi = lo % size, hi % size
+            if lo > hi:
+                return sorted(set(range(lo // self.bucket_size, last + 1)) | set(range(0, hi // self.bucket_size + 1)))
+        else:
+            lo, hi = max(lo, 0), min(hi, size - 1)
+            if lo > hi:
+                return range(0)
+        return range(lo // self.bucket_size, hi // self.bucket_size + 1)
+
+    def __candidates(self, pos, radius, metric, wrap_x, wrap_y):
+        """Yields (distance, y, x, offset) for every position in the buckets within `radius` cells of `pos` in each
+        direction. Every position whose distance is at most `radius` is included since neither metric is less than the
+        distance along either axis.
+        """
+        b_xs = self.__bucket_indexes(pos[0] - radius, pos[0] + radius, self.w, wrap_x)
+        for b_y in self.__bucket_indexes(pos[1] - radius, pos[1] + radius, self.h, wrap_y):
+            for b_x in b_xs:
+                for other in self.buckets.get((b_x, b_y), ()):
+                    offset = self.offset(pos, other, wrap_x, wrap_y)
+                    yield self.distance(offset, metric), other[1], other[0], offset
+
+    def __covers_all(self, radius):
+        return radius >= max(self.w, self.h)
+
+    def k_nearest(self, pos, k, metric=Metric.MANHATTAN, wrap_x=False, wrap_y=False) -> List[POS_TYPE]:
+        """Returns the `k` positions closest to `pos` ordered by their distance. Ties are broken by position."""
+        if k <= 0 or self.size == 0:
+            return []
+        radius = self.bucket_size
+        while True:
+            found = heapq.nsmallest(k, self.__candidates(pos, radius, metric, wrap_x, wrap_y))
+            # Anything outside the window is further than radius away.
+            if (len(found) == k and found[-1][0] <= radius) or self.__covers_all(radius):
+                return [(x, y) for _, y, x, _ in found]
+            radius *= 2
+
+    def nearest(self, pos, metric=Metric.MANHATTAN, wrap_x=False, wrap_y=False) -> Optional[POS_TYPE]:
+        found = self.k_nearest(pos, 1, metric, wrap_x, wrap_y)
+        return found[0] if found else None
+
+    def within(self, pos, radius, metric=Metric.MANHATTAN, wrap_x=False, wrap_y=False) -> List[POS_TYPE]:
+        """Returns the positions at most `radius` away from `pos` ordered by their distance."""
+        found = sorted(c for c in self.__candidates(pos, radius, metric, wrap_x, wrap_y) if c[0] <= radius)
+        return [(x, y) for _, y, x, _ in found]
@@ -158,7 +158,7 @@ class Player {
     this.debug_table.html("");
     $.ajax({
       type: "GET",
-      url: $SCRIPT_ROOT + 'game/' + gtoken + "/" + utoken,
+      url: $SCRIPT_ROOT + 'game/' + gtoken + "/" + utoken + "?frames=delta",
       dataType: "json",
       success: (data) => {
         if (window.canceled) {
@@ -356,9 +356,41 @@ class Player {
     this.cur_speed = 0.5;
   }
 
+  // Expands frames which are delta encoded into a full frame for each turn. Every keyframe_interval-th frame is a full
+  // grid and the others are flat lists of [cell index, char] pairs which changed since the previous frame.
+  static decodeFrames(frames) {
+    if (Array.isArray(frames) || frames["format"] !== "delta") {
+      return frames;
+    }
+    let width = frames["width"];
+    let interval = frames["keyframe_interval"];
+    let full_frames = [];
+    let cur = null;
+    for (let i = 0; i < frames["frames"].length; i++) {
+      let frame = frames["frames"][i];
+      if (i % interval == 0) {
+        cur = frame;
+      } else {
+        // Rows which don't change are shared with the previous frame.
+        cur = cur.slice();
+        let copied_rows = new Set();
+        for (let j = 0; j < frame.length; j += 2) {
+          let y = Math.floor(frame[j] / width);
+          if (!copied_rows.has(y)) {
+            cur[y] = cur[y].slice();
+            copied_rows.add(y);
+          }
+          cur[y][frame[j] % width] = frame[j + 1];
+        }
+      }
+      full_frames.push(cur);
+    }
+    return full_frames;
+  }
+
   drawFrames(frames, vars) {
     this.stop();
-    this.replay_frames = frames;
+    this.replay_frames = Player.decodeFrames(frames);
     this.replay_vars = vars;
     this.playback_progress_bar.prop({"min": 1, "max": this.replay_frames.length});
     this.play();
@@ -495,7 +527,7 @@ class InteractivePlayer extends Player {
     $.ajax({
       type: "POST",
       url: $SCRIPT_ROOT + 'play',
-      data: JSON.stringify({move: move, state: this.state}),
+      data: JSON.stringify({move: move, state: this.state, frames: "changes"}),
       contentType: "application/json; charset=utf-8",
       dataType: "json",
       success: (data) => {
@@ -507,7 +539,14 @@ class InteractivePlayer extends Player {
           alert(data["error"]);
         } else {
           this.state = data["state"];
-          this.frame = data["frame"];
+          if (data["changes"]) {
+            // Only the cells which changed since the last frame are sent.
+            for (let [x, y, char] of data["changes"]) {
+              this.frame[y][x] = char;
+            }
+          } else {
+            this.frame = data["frame"];
+          }
           this.draw_func(this.canvas[0], this.frame);
           function playAgain()
           {
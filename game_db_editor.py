@@ -3,11 +3,12 @@ from typing import List, Optional, Tuple
 
 import os
 import sys
+import time
 from builtins import input
 
 from click import Choice, prompt
 
-from CYLGame.Database import GameDB
+from CYLGame.Database import GameDB, open_game_db
 
 gamedb: Optional[GameDB] = None
 cur_school: Optional[str] = None
@@ -183,16 +184,24 @@ def view_code_from_hash():
 
     code_hash = get_input("Enter Code hash: ")
 
-    code = gamedb.get_code_by_hash(code_hash)
-    if isinstance(code, list):
-        options = [(x, x) for x in code]
-        option = print_menu(options, "There were multiple matches, select one:")
-        if not option:
+    code_hashes = gamedb.find_code_hashes(code_hash)
+    if len(code_hashes) == 0:
+        print("No code matches the hash '{}'".format(code_hash))
+        pause()
+        return
+    if len(code_hashes) > 1:
+        options = [(x, x) for x in code_hashes]
+        code_hash = print_menu(options, "There were multiple matches, select one:")
+        if not code_hash:
             return
-        code = gamedb.get_code_by_hash(option)
+    else:
+        code_hash = code_hashes[0]
 
     clear()
-    print(code)
+    print(gamedb.get_code_by_hash(code_hash))
+    print()
+    for token, ctime in gamedb.get_code_owners(code_hash):
+        print("Saved by {} ({}) at {}".format(gamedb.get_name(token), token, time.ctime(ctime / 10**9)))
     pause()
 
 
@@ -235,7 +244,7 @@ def main():
                 error_msg="Invalid Game Directory. Try Again.",
             )
         )
-    gamedb = GameDB(game_path)
+    gamedb = open_game_db(game_path)
     option = ""
     while option != "Quit":
         options = get_main_menu_options()
@@ -0,0 +1,24 @@
+#!/usr/bin/env python3
+import argparse
+
+from CYLGame.SQLiteDatabase import migrate_file_db
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import a file based game database into a SQLite game database.")
+    parser.add_argument("src", type=str, help="The root path of the file based game database")
+    parser.add_argument(
+        "dest",
+        nargs="?",
+        type=str,
+        help="The root path to create the SQLite game database in. Defaults to the source path.",
+        default=None,
+    )
+    args = parser.parse_args()
+
+    migrate_file_db(args.src, args.dest, debug=True)
+    print("All done :)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+import os
+
+import pytest
+from littlepython import Compiler
+
+from CYLGame.Cache import CompiledCache
+from CYLGame.Comp import compile_prog
+
+CODE = "move = 5"
+
+
+class CountingCompiler(object):
+    def __init__(self):
+        self.compiler = Compiler()
+        self.count = 0
+
+    def compile(self, code):
+        self.count += 1
+        return self.compiler.compile(code)
+
+
+def test_memory():
+    cache = CompiledCache()
+    compiler = CountingCompiler()
+    prog = cache.compile(0, CODE, compiler.compile)
+    assert cache.compile(0, CODE, compiler.compile) is prog
+    assert compiler.count == 1
+    cache.compile(1, CODE, compiler.compile)
+    cache.compile(0, CODE + "\n", compiler.compile)
+    assert compiler.count == 3
+
+
+def test_disk(tmpdir):
+    compiler = CountingCompiler()
+    CompiledCache(path=str(tmpdir)).compile(0, CODE, compiler.compile)
+    prog = CompiledCache(path=str(tmpdir)).compile(0, CODE, compiler.compile)
+    assert compiler.count == 1
+    assert prog.run() == {"move": 5}
+
+
+def test_broken_file(tmpdir):
+    compiler = CountingCompiler()
+    CompiledCache(path=str(tmpdir)).compile(0, CODE, compiler.compile)
+    for name in os.listdir(str(tmpdir)):
+        with open(os.path.join(str(tmpdir), name), "wb") as fp:
+            fp.write(b"broken")
+    prog = CompiledCache(path=str(tmpdir)).compile(0, CODE, compiler.compile)
+    assert compiler.count == 2
+    assert prog.run() == {"move": 5}
+
+
+def test_errors_are_not_cached(tmpdir):
+    cache = CompiledCache(path=str(tmpdir))
+    compiler = CountingCompiler()
+    for _ in range(2):
+        with pytest.raises(Exception):
+            cache.compile(0, "move = ", compiler.compile)
+    assert compiler.count == 2
+    assert os.listdir(str(tmpdir)) == []
+
+
+def test_options_stay_with_the_bot():
+    compiler = Compiler()
+    bot = compile_prog(compiler, CODE, {"debug": True}, token="A", name="a")
+    other = compile_prog(compiler, CODE, {}, token="B", name="b")
+    assert bot.prog is other.prog
+    assert (bot.options, bot.token, bot.name) == ({"debug": True}, "A", "a")
+    assert (other.options, other.token, other.name) == ({}, "B", "b")
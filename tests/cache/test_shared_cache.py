@@ -0,0 +1,121 @@
+import threading
+import time
+from multiprocessing import Process, Queue
+
+import pytest
+
+from CYLGame import MapPanel, StatusPanel
+from CYLGame.Cache import SharedCache
+from CYLGame.Game import GameRunner, GridGame
+from CYLGame.Player import DefaultGridPlayer
+
+
+class WalkGame(GridGame):
+    """Walks a "@" east across a map, scrolling the map each turn."""
+
+    SCREEN_WIDTH = 8
+    SCREEN_HEIGHT = 5
+
+    def __init__(self, random):
+        super().__init__(random)
+        self.map = MapPanel(0, 0, 8, 4, default_char=".")
+        self.status = StatusPanel(0, 4, 8, 1)
+        self.turns = 0
+        self.player = None
+
+    def init_board(self):
+        self.map.add("@", (0, 1))
+        self.map.add("#", (5, 2))
+
+    def create_new_player(self, prog):
+        self.player = DefaultGridPlayer(prog, GridGame.get_move_consts())
+        return self.player
+
+    def start_game(self):
+        pass
+
+    def is_running(self):
+        return self.turns < 10
+
+    def do_turn(self):
+        self.turns += 1
+        self.map.shift_all((1, 0), wrap_x=True)
+        self.status["Turns"] = self.turns
+
+    def draw_screen(self, frame_buffer):
+        self.map.redraw(frame_buffer)
+        self.status.redraw(frame_buffer)
+
+    def get_vars(self, player):
+        return {}
+
+    def get_score(self):
+        return self.turns
+
+
+@pytest.fixture
+def cache():
+    cache = SharedCache(maxsize=2, ttl=60)
+    yield cache
+    cache.shutdown()
+
+
+def pop_in_child(cache, key, queue):
+    queue.put(cache.pop(key))
+
+
+def test_shared_between_processes(cache):
+    cache["a"] = {"moves": "wasd"}
+    queue = Queue()
+    child = Process(target=pop_in_child, args=(cache, "a", queue))
+    child.start()
+    assert queue.get(timeout=10) == {"moves": "wasd"}
+    child.join()
+    assert cache.pop("a") is None
+
+
+def test_lru(cache):
+    cache["a"] = 1
+    cache["b"] = 2
+    assert cache.get("a") == 1
+    cache["c"] = 3
+    assert cache.get("b") is None
+    assert len(cache) == 2
+
+
+def test_ttl():
+    cache = SharedCache(maxsize=2, ttl=0.1)
+    try:
+        cache["a"] = 1
+        time.sleep(0.2)
+        assert cache.get("a") is None
+    finally:
+        cache.shutdown()
+
+
+def test_unpicklable_values_arent_cached(cache):
+    cache["lock"] = threading.Lock()
+    assert cache.pop("lock", "missing") == "missing"
+
+
+def test_stopped_manager_is_a_miss():
+    cache = SharedCache(maxsize=2, ttl=60)
+    cache["a"] = 1
+    cache.shutdown()
+    assert cache.pop("a") is None
+    cache["a"] = 1
+
+
+def test_map_game_state(cache):
+    runner = GameRunner(WalkGame)
+    state = runner.move_game(runner.init_game(seed=1), "d")
+    cache["1d"] = state
+
+    cached = cache.pop("1d")
+    assert cached.moves == "d"
+    assert cached.frame == state.frame
+    assert cached.game.map.get_char_at((1, 1)) == state.game.map.get_char_at((1, 1))
+    cached = runner.move_game(cached, "d")
+    state = runner.move_game(state, "d")
+    assert cached.frame == state.frame
+    assert cached.changes == state.changes
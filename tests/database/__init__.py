@@ -21,3 +21,16 @@ def ex_db(temp_dir):
     for _ in range(4):
         db.__players += [db.get_new_token(stoken)]
     return db
+
+
+@pytest.fixture
+def ex_sqlite_db(temp_dir):
+    from CYLGame.SQLiteDatabase import SQLiteGameDB
+
+    db = SQLiteGameDB(temp_dir)
+    stoken = db.add_new_school("Test")
+    db.__players = []
+    for _ in range(4):
+        db.__players += [db.get_new_token(stoken)]
+    yield db
+    db.close()
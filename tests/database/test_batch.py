@@ -0,0 +1,119 @@
+import os
+import subprocess
+import sys
+
+import gevent
+import msgpack
+import pytest
+
+from CYLGame.Database import GameDB, KeyValueLog, WriteBatch
+
+from . import ex_db, temp_dir
+
+
+def test_batch_commits_on_exit(ex_db: GameDB):
+    other_db = GameDB(ex_db.root_dir)
+    ctoken = ex_db.add_new_competition("Comp")
+    with ex_db.batch():
+        gtoken = ex_db.add_new_game(player_tokens=ex_db.__players)
+        ex_db.add_game_to_comp(ctoken, gtoken)
+        for player in ex_db.__players:
+            ex_db.save_value(player, "rolling_n", 1)
+            ex_db.save_avg_score(player, 10)
+        assert ex_db.is_game_token(gtoken)
+        assert ex_db.get_value(ex_db.__players[0], "rolling_n") == 1
+        assert not other_db.is_game_token(gtoken)
+        assert other_db.get_value(ex_db.__players[0], "rolling_n") is None
+
+    assert os.listdir(ex_db.journal_dir) == []
+    assert other_db.is_game_token(gtoken)
+    assert other_db.get_games_for_token(ctoken) == [gtoken]
+    for player in ex_db.__players:
+        assert other_db.get_games_for_token(player) == [gtoken]
+        assert other_db.get_value(player, "rolling_n") == 1
+        assert other_db.get_avg_score(player) == 10
+
+
+def test_batch_discarded_on_error(ex_db: GameDB):
+    with pytest.raises(AssertionError):
+        with ex_db.batch():
+            gtoken = ex_db.add_new_game(player_tokens=ex_db.__players)
+            ex_db.save_value(ex_db.__players[0], "rolling_n", 1)
+            ex_db.set_game_player(gtoken, "NOTAUSER")
+
+    assert not ex_db.is_game_token(gtoken)
+    assert ex_db.get_all_game_tokens() == []
+    assert ex_db.get_value(ex_db.__players[0], "rolling_n") is None
+    for player in ex_db.__players:
+        assert ex_db.get_games_for_token(player) == []
+
+
+def test_journal_replayed_after_crash(ex_db: GameDB):
+    token = ex_db.__players[0]
+    dead_pid = subprocess.Popen([sys.executable, "-c", ""]).pid
+    os.waitpid(dead_pid, 0)
+
+    batch = WriteBatch(ex_db.root_dir)
+    batch.write(os.path.join(ex_db.data_dir, token, "name"), b"Crashed")
+    batch.save_value(os.path.join(ex_db.data_dir, token, "db.mp.log"), "rolling_n", 3)
+    with open(os.path.join(ex_db.journal_dir, "{}_1_1".format(dead_pid)), "wb") as fp:
+        msgpack.dump(batch.ops, fp)
+    # An uncommitted journal must not be applied.
+    with open(os.path.join(ex_db.journal_dir, "{}_1_2.tmp".format(dead_pid)), "wb") as fp:
+        msgpack.dump([[WriteBatch.WRITE, os.path.join("data", token, "avg_score"), b"1"]], fp)
+
+    db = GameDB(ex_db.root_dir)
+    assert os.listdir(db.journal_dir) == []
+    assert db.get_name(token) == "Crashed"
+    assert db.get_value(token, "rolling_n") == 3
+    assert db.get_avg_score(token) is None
+
+
+class Crash(Exception):
+    pass
+
+
+def test_partly_applied_journal_replayed_once(ex_db: GameDB):
+    token = ex_db.__players[0]
+    dead_pid = subprocess.Popen([sys.executable, "-c", ""]).pid
+    os.waitpid(dead_pid, 0)
+    log_path = os.path.join(ex_db.data_dir, token, "log")
+    kv_log_path = os.path.join(ex_db.data_dir, token, "db.mp.log")
+
+    batch = WriteBatch(ex_db.root_dir)
+    batch.append(log_path, b"a")
+    batch.save_value(kv_log_path, "rolling_n", 1)
+    batch.append(log_path, b"b")
+    batch.write(os.path.join(ex_db.data_dir, token, "name"), b"Crashed")
+    journal_path = os.path.join(ex_db.journal_dir, "{}_1_1".format(dead_pid))
+    with open(journal_path, "wb") as fp:
+        msgpack.dump(batch.ops, fp)
+
+    class CrashingLog(KeyValueLog):
+        def update(self, values, before_write=None):
+            super().update(values, before_write=before_write)
+            raise Crash()
+
+    # The first append and the values are made before the crash.
+    with pytest.raises(Crash):
+        WriteBatch.apply(ex_db.root_dir, batch.ops, CrashingLog, journal_path)
+    with open(log_path, "rb") as fp:
+        assert fp.read() == b"a"
+    # A newer value saved after the crash isn't replaced by the journal's.
+    ex_db.save_value(token, "rolling_n", 2)
+
+    db = GameDB(ex_db.root_dir)
+    assert os.listdir(db.journal_dir) == []
+    with open(log_path, "rb") as fp:
+        assert fp.read() == b"ab"
+    assert db.get_name(token) == "Crashed"
+    assert db.get_value(token, "rolling_n") == 2
+
+
+def test_batch_local_to_greenlet(ex_db: GameDB):
+    with ex_db.batch():
+        ex_db.save_value(ex_db.__players[0], "rolling_n", 1)
+        gevent.spawn(ex_db.save_value, ex_db.__players[1], "rolling_n", 2).join()
+        assert GameDB(ex_db.root_dir).get_value(ex_db.__players[1], "rolling_n") == 2
+        assert GameDB(ex_db.root_dir).get_value(ex_db.__players[0], "rolling_n") is None
+    assert GameDB(ex_db.root_dir).get_value(ex_db.__players[0], "rolling_n") == 1
@@ -0,0 +1,69 @@
+import os
+
+from CYLGame.Database import CodeHashIndex, GameDB
+
+from . import ex_db, temp_dir
+
+
+def test_get_code_by_hash(ex_db: GameDB):
+    token, other_token = ex_db.__players[:2]
+    code_hash = ex_db.save_code(token, "move = east")
+    other_code_hash = ex_db.save_code(other_token, "move = west", {"color": "red"})
+    assert ex_db.find_code_hashes("") == sorted([code_hash, other_code_hash])
+    assert ex_db.get_code_by_hash(code_hash[:6]) == "move = east"
+    assert ex_db.get_code_by_hash(other_code_hash) == "move = west"
+    assert ex_db.get_code_by_hash("x") == []
+
+
+def test_code_saved_by_other_process(ex_db: GameDB):
+    other_db = GameDB(ex_db.root_dir)
+    assert other_db.find_code_hashes("") == []
+    code_hash = ex_db.save_code(ex_db.__players[0], "move = east")
+    assert other_db.find_code_hashes("") == [code_hash]
+
+
+def test_get_code_owners(ex_db: GameDB):
+    token, other_token = ex_db.__players[:2]
+    code_hash = ex_db.save_code(token, "move = east")
+    ex_db.save_code(other_token, "move = east")
+    ex_db.save_code(token, "move = east")
+    owners = ex_db.get_code_owners(code_hash)
+    assert [owner_token for owner_token, ctime in owners] == [token, other_token, token]
+    assert [ctime for owner_token, ctime in owners] == sorted(ctime for owner_token, ctime in owners)
+    assert ex_db.get_code_owners("0" * 64) == []
+
+
+def test_index_built_for_old_code(ex_db: GameDB):
+    token = ex_db.__players[0]
+    code_hash = ex_db.save_code(token, "move = east")
+    os.remove(os.path.join(ex_db.root_dir, "code_hashes.mp.log"))
+
+    db = GameDB(ex_db.root_dir)
+    assert db.get_code_by_hash(code_hash[:6]) == "move = east"
+    other_code_hash = db.save_code(token, "move = west")
+    assert db.find_code_hashes("") == sorted([code_hash, other_code_hash])
+
+
+def test_get_code_and_options_by_hash(ex_db: GameDB):
+    code_hash = ex_db.save_code(ex_db.__players[0], "move = east", {"color": "red"})
+    assert ex_db.get_code_and_options_by_hash(code_hash) == ("move = east", {"color": "red"})
+    assert ex_db.get_code_and_options_by_hash(code_hash[:6]) == (None, {})
+
+
+def test_code_index_compacted(temp_dir, monkeypatch):
+    monkeypatch.setattr(CodeHashIndex, "COMPACT_AFTER", 8)
+    index = CodeHashIndex(os.path.join(temp_dir, "code_hashes.mp.log"))
+    other_index = CodeHashIndex(index.path)
+    for i in range(6):
+        index.add("{:02x}".format(5 - i), "ABCDEF12", i)
+    assert other_index.find("0") == ["00", "01", "02", "03", "04", "05"]
+    size = os.path.getsize(index.path)
+    for i in range(4):
+        index.remove("{:02x}".format(5 - i), "ABCDEF12", i)
+
+    assert os.path.getsize(index.path) < size
+    assert index.find("") == ["00", "01"]
+    assert other_index.find("") == ["00", "01"]
+    assert other_index.get_owners("01") == [("ABCDEF12", 4)]
+    index.add("03", "ABCDEF12", 6)
+    assert other_index.find("") == ["00", "01", "03"]
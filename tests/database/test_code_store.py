@@ -0,0 +1,86 @@
+import os
+
+import pytest
+
+from CYLGame.Database import GameDB
+
+from . import ex_db, temp_dir
+
+
+def test_identical_code_stored_once(ex_db: GameDB):
+    token, other_token = ex_db.__players[:2]
+    code_hash = ex_db.save_code(token, "move = east", {"color": "red"})
+    ex_db.save_code(token, "move = east", {"color": "red"})
+    ex_db.save_code(other_token, "move = east", {"color": "red"})
+
+    assert os.listdir(ex_db.code_blobs_dir) == [code_hash]
+    assert not os.path.exists(os.path.join(ex_db.data_dir, token, "code"))
+    history = ex_db.get_code_history(token)
+    assert len(history) == 2
+    for code_key, code, options in history:
+        assert code_key.endswith("_" + code_hash)
+        assert (code, options) == ("move = east", {"color": "red"})
+    assert ex_db.get_active_code_and_options(other_token) == ("move = east", {"color": "red"})
+
+
+def test_legacy_code_entries(ex_db: GameDB):
+    token = ex_db.__players[0]
+    code_key = "1000_abcdef"
+    os.makedirs(os.path.join(ex_db.data_dir, token, "code", code_key))
+    with open(os.path.join(ex_db.data_dir, token, "code", code_key, "code.lp"), "w") as fp:
+        fp.write("move = west")
+    ex_db.save_value(token, ex_db.ACTIVE_CODE_KEY, code_key)
+
+    assert ex_db.get_active_code_and_options(token) == ("move = west", {})
+    assert ex_db.get_code_by_hash("abc") == "move = west"
+
+    ex_db.save_code(token, "move = east")
+    assert [code for code_key, code, options in ex_db.get_code_history(token)] == ["move = west", "move = east"]
+    ex_db.remove_code(token, code_key)
+    assert not os.path.exists(os.path.join(ex_db.data_dir, token, "code", code_key))
+    assert ex_db.collect_code_garbage(grace_period=0) == 0
+
+
+def test_collect_code_garbage(ex_db: GameDB):
+    token, other_token = ex_db.__players[:2]
+    code_hash = ex_db.save_code(token, "move = east")
+    ex_db.save_code(other_token, "move = east")
+    ex_db.save_code(token, "move = west")
+    ex_db.save_code(other_token, "move = west")
+    old_key, new_key = [code_key for code_key, code, options in ex_db.get_code_history(token)]
+
+    with pytest.raises(ValueError):
+        ex_db.remove_code(token, new_key)  # The active code
+    ex_db.remove_code(token, old_key)
+    assert ex_db.collect_code_garbage(grace_period=0) == 0
+    assert [owner for owner, ctime in ex_db.get_code_owners(code_hash)] == [other_token]
+
+    other_old_key = ex_db.get_code_history(other_token)[0][0]
+    ex_db.remove_code(other_token, other_old_key)
+    assert ex_db.collect_code_garbage() == 0  # Within the grace period
+    assert ex_db.collect_code_garbage(grace_period=0) == 1
+    assert not os.path.exists(os.path.join(ex_db.code_blobs_dir, code_hash))
+    assert ex_db.find_code_hashes(code_hash) == []
+    assert [code for code_key, code, options in ex_db.get_code_history(token)] == ["move = west"]
+    with pytest.raises(ValueError):
+        ex_db.remove_code(token, old_key)
+    # Only the code removed since the last collection is checked.
+    assert os.path.getsize(ex_db.code_garbage_path) == 0
+
+
+def test_collect_code_saved_again(ex_db: GameDB):
+    token = ex_db.__players[0]
+    code_hash = ex_db.save_code(token, "move = east")
+    old_key = ex_db.get_code_history(token)[0][0]
+    ex_db.save_code(token, "move = west")
+    ex_db.remove_code(token, old_key)
+    ex_db.save_code(token, "move = east")
+    ex_db.save_code(token, "move = west")
+
+    assert ex_db.collect_code_garbage(grace_period=0) == 0
+    assert os.path.exists(os.path.join(ex_db.code_blobs_dir, code_hash))
+    assert [code for code_key, code, options in ex_db.get_code_history(token)] == [
+        "move = west",
+        "move = east",
+        "move = west",
+    ]
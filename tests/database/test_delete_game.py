@@ -0,0 +1,43 @@
+import os
+
+from CYLGame.Database import GameDB
+
+from . import ex_db, temp_dir
+
+
+def test_delete_game(ex_db: GameDB):
+    ctoken = ex_db.add_new_competition("Comp")
+    other_ctoken = ex_db.add_new_competition("Other Comp")
+    gtoken = ex_db.add_new_game(player_tokens=ex_db.__players)
+    ex_db.add_game_to_comp(ctoken, gtoken)
+    ex_db.add_game_to_comp(other_ctoken, gtoken)
+
+    ex_db.delete_game(gtoken)
+    assert not ex_db.is_game_token(gtoken)
+    assert ex_db.get_all_game_tokens() == []
+    assert ex_db.get_games_for_token(ctoken) == []
+    for player in ex_db.__players:
+        assert ex_db.get_games_for_token(player) == []
+        assert ex_db.get_game_timeline(player) == []
+    # The references are only removed by the reaper.
+    assert os.path.exists(os.path.join(ex_db.competitions_dir, ctoken, "games", gtoken))
+
+    stats = GameDB(ex_db.root_dir).reap_deleted_games()
+    assert stats["games"] == 1
+    assert stats["references"] == len(ex_db.__players) + 2
+    assert os.listdir(ex_db.deleted_games_dir) == []
+    assert os.listdir(os.path.join(ex_db.competitions_dir, ctoken, "games")) == []
+    assert os.listdir(os.path.join(ex_db.competitions_dir, other_ctoken, "games")) == []
+    for player in ex_db.__players:
+        assert os.listdir(os.path.join(ex_db.data_dir, player, "games")) == []
+
+    assert ex_db.reap_deleted_games()["games"] == 0
+
+
+def test_reap_limit(ex_db: GameDB):
+    gtokens = [ex_db.add_new_game(player_tokens=ex_db.__players) for _ in range(3)]
+    for gtoken in gtokens:
+        ex_db.delete_game(gtoken)
+    assert ex_db.reap_deleted_games(limit=2)["games"] == 2
+    assert ex_db.reap_deleted_games()["games"] == 1
+    assert os.listdir(ex_db.deleted_games_dir) == []
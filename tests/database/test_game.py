@@ -1,6 +1,7 @@
 import pytest
 
 from CYLGame.Database import GameDB
+from CYLGame.Player import LittlePythonProg, Room
 
 from . import ex_db, temp_dir
 
@@ -45,3 +46,14 @@ def test_create_game_with_per_player_data(ex_db):
     for player in db.__players:
         assert db.get_games_for_token(player) == [token]
         assert db.get_player_game_data(token, player) == {"token": player}
+
+
+def test_save_room_by_seed(ex_db):
+    db = ex_db  # type: GameDB
+    bots = [LittlePythonProg(None, options={}, token=player, code_hash="abc") for player in db.__players]
+    room = Room(bots, seed=35)
+    replay = {"seed": "z", "version": 1, "bots": [{"code_hash": "abc", "token": bot.token} for bot in bots]}
+    gtoken = room.save(db, replay=replay)
+    assert db.get_game_frames(gtoken) == {"replay": replay, "seed": "z"}
+    for player in db.__players:
+        assert db.get_player_game_data(gtoken, player) == {"code_hash": "abc"}
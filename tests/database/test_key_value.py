@@ -1,6 +1,8 @@
+import os
+
 import pytest
 
-from CYLGame.Database import GameDB
+from CYLGame.Database import GameDB, KeyValueLog, write_json
 
 from . import ex_db, temp_dir
 
@@ -43,3 +45,46 @@ def test_default_value(ex_db: GameDB):
     tok = ex_db.__players[0]
     # ex_db.save_value(tok, "test_key", "test_value")
     assert ex_db.get_value(tok, "test_key", "default_value") == "default_value"
+
+
+def test_values_saved_by_other_process(ex_db: GameDB):
+    other_db = GameDB(ex_db.root_dir)
+    token = ex_db.__players[0]
+    assert other_db.get_value(token, "name") is None
+
+    ex_db.save_value(token, "name", "Alice")
+    ex_db.save_value(token, "score", 10)
+    assert other_db.get_value(token, "name") == "Alice"
+
+    other_db.save_value(token, "score", 12.5)
+    assert ex_db.get_values(token) == {"name": "Alice", "score": 12.5}
+
+
+def test_compaction(temp_dir):
+    path = os.path.join(temp_dir, "db.mp.log")
+    log = KeyValueLog(path)
+    other_log = KeyValueLog(path)
+    other_log.set("other", 1)
+
+    for i in range(KeyValueLog.COMPACT_AFTER * 2):
+        log.set("counter", i)
+    assert os.path.getsize(path) < KeyValueLog.COMPACT_AFTER * 10
+    assert other_log.items() == {"other": 1, "counter": KeyValueLog.COMPACT_AFTER * 2 - 1}
+
+    other_log.set("other", 2)
+    assert log.get("other") == 2
+
+
+def test_legacy_values(temp_dir):
+    path = os.path.join(temp_dir, "db.mp.log")
+    legacy_path = os.path.join(temp_dir, "db.mp.gz")
+    write_json({"name": "Alice", "score": 10}, legacy_path)
+
+    log = KeyValueLog(path, legacy_path=legacy_path)
+    assert log.get("name") == "Alice"
+    log.set("score", 11)
+    assert log.items() == {"name": "Alice", "score": 11}
+
+    log.compact()
+    assert not os.path.exists(legacy_path)
+    assert KeyValueLog(path, legacy_path=legacy_path).items() == {"name": "Alice", "score": 11}
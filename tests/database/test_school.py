@@ -0,0 +1,58 @@
+import os
+
+from CYLGame.Database import GameDB
+
+from . import ex_db, temp_dir
+
+
+def test_school_for_token(ex_db: GameDB):
+    other_stoken = ex_db.add_new_school("Other")
+    other_token = ex_db.get_new_token(other_stoken)
+    stoken = ex_db.get_school_for_token(ex_db.__players[0])
+    assert stoken != other_stoken
+    for player in ex_db.__players:
+        assert ex_db.get_school_for_token(player) == stoken
+    assert ex_db.get_school_for_token(other_token) == other_stoken
+    assert ex_db.get_school_for_token("ABCDEF12") is None
+
+
+def test_school_for_token_without_index(ex_db: GameDB):
+    token = ex_db.__players[0]
+    stoken = GameDB(ex_db.root_dir).get_school_for_token(token)
+
+    # Simulate a user created before users were indexed by school.
+    os.remove(os.path.join(ex_db.data_dir, token, "school"))
+    db = GameDB(ex_db.root_dir)
+    assert db.get_school_for_token(token) == stoken
+    assert os.path.exists(os.path.join(ex_db.data_dir, token, "school"))
+
+
+def test_comps_for_token(ex_db: GameDB):
+    token = ex_db.__players[0]
+    stoken = ex_db.get_school_for_token(token)
+    other_stoken = ex_db.add_new_school("Other")
+    assert ex_db.get_comps_for_token(token) == []
+
+    ctoken = ex_db.add_new_competition("Comp")
+    other_ctoken = ex_db.add_new_competition("Other Comp")
+    ex_db.add_school_to_comp(ctoken, stoken)
+    ex_db.add_school_to_comp(other_ctoken, other_stoken)
+    assert ex_db.get_comps_for_token(token) == [ctoken]
+
+    ex_db.set_comp_school_code(other_ctoken, stoken, "move = east")
+    assert sorted(ex_db.get_comps_for_token(token)) == sorted([ctoken, other_ctoken])
+
+
+def test_comps_for_token_without_index(ex_db: GameDB):
+    import shutil
+
+    token = ex_db.__players[0]
+    stoken = ex_db.get_school_for_token(token)
+    ctoken = ex_db.add_new_competition("Comp")
+    ex_db.add_school_to_comp(ctoken, stoken)
+
+    # Simulate a school created before competitions were indexed by school.
+    shutil.rmtree(os.path.join(ex_db.schools_dir, stoken, "comps"))
+    other_ctoken = ex_db.add_new_competition("Other Comp")
+    ex_db.add_school_to_comp(other_ctoken, stoken)
+    assert sorted(ex_db.get_comps_for_token(token)) == sorted([ctoken, other_ctoken])
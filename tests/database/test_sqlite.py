@@ -0,0 +1,183 @@
+import os
+
+import pytest
+
+from CYLGame.Database import SQLITE_BACKEND, GameDB, open_game_db
+from CYLGame.SQLiteDatabase import SQLiteGameDB, migrate_file_db
+
+from . import ex_db, ex_sqlite_db, temp_dir
+
+
+def test_tokens(ex_sqlite_db: SQLiteGameDB):
+    db = ex_sqlite_db
+    stoken = db.get_school_for_token(db.__players[0])
+    assert db.is_school_token(stoken)
+    assert sorted(db.get_tokens_for_school(stoken)) == sorted(db.__players)
+    for player in db.__players:
+        assert db.is_user_token(player)
+        assert db.get_school_for_token(player) == stoken
+    assert not db.is_user_token(stoken)
+    assert not db.is_user_token("ABCDEF12")
+
+
+def test_create_game_with_per_player_data(ex_sqlite_db: SQLiteGameDB):
+    db = ex_sqlite_db
+    per_player_data = {player: {"token": player} for player in db.__players}
+    token = db.add_new_game(frames={"test": "test"}, per_player_data=per_player_data)
+    assert db.is_game_token(token)
+    assert db.get_game_frames(token) == {"test": "test"}
+    assert sorted(db.get_players_for_game(token)) == sorted(db.__players)
+    for player in db.__players:
+        assert db.get_games_for_token(player) == [token]
+        assert db.get_player_game_data(token, player) == {"token": player}
+
+
+def test_delete_game_removes_it_from_all_comps(ex_sqlite_db: SQLiteGameDB):
+    db = ex_sqlite_db
+    ctokens = [db.add_new_competition("A"), db.add_new_competition("B")]
+    gtoken = db.add_new_game(player_tokens=db.__players)
+    for ctoken in ctokens:
+        db.add_game_to_comp(ctoken, gtoken)
+        assert db.get_games_for_token(ctoken) == [gtoken]
+
+    db.delete_game(gtoken)
+    assert not db.is_game_token(gtoken)
+    for ctoken in ctokens:
+        assert db.get_games_for_token(ctoken) == []
+    for player in db.__players:
+        assert db.get_games_for_token(player) == []
+
+
+def test_key_values(ex_sqlite_db: SQLiteGameDB):
+    tok = ex_sqlite_db.__players[0]
+    assert ex_sqlite_db.get_value(tok, "test_key", "default_value") == "default_value"
+    for value in ["str", 12, 3.14]:
+        ex_sqlite_db.save_value(tok, "test_key", value)
+        assert ex_sqlite_db.get_value(tok, "test_key") == value
+    assert ex_sqlite_db.get_values(tok) == {"test_key": 3.14}
+
+
+def test_code(ex_sqlite_db: SQLiteGameDB):
+    db = ex_sqlite_db
+    tok = db.__players[0]
+    assert db.get_active_code_and_options(tok) == (None, {})
+    code_hash = db.save_code(tok, "move = east", {"difficulty": 1})
+    db.save_code(tok, "move = west", set_as_active=False)
+    assert db.get_active_code_and_options(tok) == ("move = east", {"difficulty": 1})
+    assert [code for _, code, _ in db.get_code_history(tok)] == ["move = east", "move = west"]
+    assert db.get_code_by_hash(code_hash[:6]) == "move = east"
+    assert len(db.get_code_by_hash("")) == 2
+
+
+def test_comps(ex_sqlite_db: SQLiteGameDB):
+    db = ex_sqlite_db
+    tok = db.__players[0]
+    stoken = db.get_school_for_token(tok)
+    ctoken = db.add_new_competition("Comp")
+    assert db.get_comps_for_token(tok) == []
+    db.add_school_to_comp(ctoken, stoken)
+    db.set_comp_school_code(ctoken, stoken, "move = east")
+    db.set_comp_avg_score(ctoken, stoken, 12.5)
+    assert db.get_comps_for_token(tok) == [ctoken]
+    assert db.get_schools_in_comp(ctoken) == [stoken]
+    assert db.get_comp_code(ctoken, stoken) == "move = east"
+    assert db.get_comp_avg_score(ctoken, stoken) == 12.5
+
+
+def test_migrate_file_db(ex_db: GameDB):
+    tok = ex_db.__players[0]
+    stoken = ex_db.get_school_for_token(tok)
+    ex_db.save_name(tok, "Bot")
+    ex_db.save_avg_score(tok, 42)
+    ex_db.save_value(tok, "rolling_n", 3)
+    ex_db.save_code(tok, "move = east", {"difficulty": 1})
+    ctoken = ex_db.add_new_competition("Comp", _token="P00000000")
+    ex_db.add_school_to_comp(ctoken, stoken)
+    gtoken = ex_db.add_new_game(frames={"screen": []}, per_player_data={tok: {"debug_vars": []}})
+    ex_db.add_game_to_comp(ctoken, gtoken)
+    etoken = ex_db.save_exception({"exception": "test"})
+
+    db = migrate_file_db(ex_db.root_dir)
+    assert isinstance(open_game_db(ex_db.root_dir), SQLiteGameDB)
+    assert not os.path.exists(os.path.join(ex_db.root_dir, SQLiteGameDB.DB_FILENAME + ".importing"))
+
+    assert db.get_school_tokens() == [stoken]
+    assert sorted(db.get_tokens_for_school(stoken)) == sorted(ex_db.__players)
+    assert db.get_name(tok) == "Bot"
+    assert db.get_avg_score(tok) == 42
+    assert db.get_value(tok, "rolling_n") == 3
+    assert db.get_active_code_and_options(tok) == ("move = east", {"difficulty": 1})
+    assert db.get_comps_for_token(tok) == [ctoken]
+    assert db.get_games_for_token(ctoken) == [gtoken]
+    assert db.get_games_for_token(tok) == [gtoken]
+    assert db.get_ctime_for_game(gtoken) == ex_db.get_ctime_for_game(gtoken)
+    assert db.get_game_frames(gtoken) == {"screen": []}
+    assert db.get_player_game_data(gtoken, tok) == {"debug_vars": []}
+    assert db.get_exception(etoken) == {"exception": "test"}
+
+    with pytest.raises(ValueError):
+        migrate_file_db(ex_db.root_dir)
+
+
+def test_open_game_db(temp_dir):
+    assert isinstance(open_game_db(temp_dir), GameDB)
+    assert isinstance(open_game_db(temp_dir, backend=SQLITE_BACKEND), SQLiteGameDB)
+    assert isinstance(open_game_db(temp_dir), SQLiteGameDB)
+
+
+def test_batch(ex_sqlite_db: SQLiteGameDB):
+    db = ex_sqlite_db
+    with pytest.raises(ValueError):
+        with db.batch():
+            db.add_new_game(player_tokens=db.__players)
+            db.save_value(db.__players[0], "rolling_n", 1)
+            raise ValueError()
+    assert db.get_all_game_tokens() == []
+    assert db.get_value(db.__players[0], "rolling_n") is None
+
+    with db.batch():
+        gtoken = db.add_new_game(player_tokens=db.__players)
+        db.save_value(db.__players[0], "rolling_n", 1)
+    assert db.get_all_game_tokens() == [gtoken]
+    assert db.get_value(db.__players[0], "rolling_n") == 1
+
+
+def test_get_code_owners(ex_sqlite_db: SQLiteGameDB):
+    db = ex_sqlite_db
+    token, other_token = db.__players[:2]
+    code_hash = db.save_code(token, "move = east")
+    db.save_code(other_token, "move = east")
+    assert db.find_code_hashes(code_hash[:6]) == [code_hash]
+    assert [owner_token for owner_token, ctime in db.get_code_owners(code_hash)] == [token, other_token]
+
+
+def test_collect_code_garbage(ex_sqlite_db: SQLiteGameDB):
+    db = ex_sqlite_db
+    token, other_token = db.__players[:2]
+    code_hash = db.save_code(token, "move = east")
+    db.save_code(other_token, "move = east")
+    db.save_code(token, "move = west")
+    db.save_code(other_token, "move = west")
+    old_key = db.get_code_history(token)[0][0]
+
+    db.remove_code(token, old_key)
+    assert db.collect_code_garbage() == 0
+    db.remove_code(other_token, db.get_code_history(other_token)[0][0])
+    assert db.collect_code_garbage() == 1
+    assert db.find_code_hashes(code_hash) == []
+    assert db.get_code_history(token)[0][1] == "move = west"
+
+
+def test_game_timeline(ex_sqlite_db: SQLiteGameDB):
+    db = ex_sqlite_db
+    token = db.__players[0]
+    gtokens = [db.add_new_game(player_tokens=[token], _ctime=ctime) for ctime in [3, 1, 2]]
+    assert db.get_game_timeline(token) == [gtokens[1], gtokens[2], gtokens[0]]
+    assert db.trim_game_timeline(token, 1, {gtokens[0], gtokens[1]}) == ([gtokens[0]], [gtokens[1]])
+
+
+def test_get_code_and_options_by_hash(ex_sqlite_db: SQLiteGameDB):
+    db = ex_sqlite_db
+    code_hash = db.save_code(db.__players[0], "move = east", {"color": "red"})
+    assert db.get_code_and_options_by_hash(code_hash) == ("move = east", {"color": "red"})
+    assert db.get_code_and_options_by_hash("abc") == (None, {})
@@ -0,0 +1,75 @@
+import os
+
+import pytest
+
+from CYLGame.Comp import RollingMultiplayerCompRunner
+from CYLGame.Database import GameDB
+from CYLGame.Game import GridGame
+
+from . import ex_db, temp_dir
+
+
+def test_game_timeline(ex_db: GameDB):
+    token, other_token = ex_db.__players[:2]
+    gtokens = [ex_db.add_new_game(player_tokens=[token, other_token]) for _ in range(3)]
+    other_gtoken = ex_db.add_new_game(player_tokens=[other_token])
+    assert ex_db.get_game_timeline(token) == gtokens
+    assert ex_db.get_game_timeline(other_token) == gtokens + [other_gtoken]
+
+
+def test_trim_game_timeline(ex_db: GameDB):
+    token = ex_db.__players[0]
+    gtokens = [ex_db.add_new_game(player_tokens=[token]) for _ in range(6)]
+    comp_gtokens = set(gtokens[::2])
+
+    assert ex_db.trim_game_timeline(token, 5, comp_gtokens) == ([gtokens[0], gtokens[2], gtokens[4]], [])
+    assert ex_db.trim_game_timeline(token, 2, comp_gtokens) == ([gtokens[2], gtokens[4]], [gtokens[0]])
+    assert ex_db.get_game_timeline(token) == gtokens[1:]
+    assert ex_db.trim_game_timeline(token, 1) == ([gtokens[5]], gtokens[1:5])
+    assert ex_db.get_game_timeline(token) == gtokens[5:]
+
+    new_gtoken = ex_db.add_new_game(player_tokens=[token])
+    assert ex_db.get_game_timeline(token) == [gtokens[5], new_gtoken]
+
+
+def test_trim_keeps_uncounted_games(ex_db: GameDB):
+    token = ex_db.__players[0]
+    gtokens = [ex_db.add_new_game(player_tokens=[token]) for _ in range(6)]
+    comp_gtokens = {gtokens[1], gtokens[3], gtokens[5]}
+
+    assert ex_db.trim_game_timeline(token, 0, comp_gtokens) == ([], [gtokens[1], gtokens[3], gtokens[5]])
+    assert ex_db.get_game_timeline(token) == [gtokens[0], gtokens[2], gtokens[4]]
+    assert set(ex_db.get_games_for_token(token)) >= {gtokens[0], gtokens[2], gtokens[4]}
+
+
+def test_timeline_built_for_old_games(ex_db: GameDB):
+    token = ex_db.__players[0]
+    gtokens = [ex_db.add_new_game(player_tokens=[token]) for _ in range(3)]
+    os.remove(os.path.join(ex_db.data_dir, token, "timeline"))
+
+    db = GameDB(ex_db.root_dir)
+    assert db.get_game_timeline(token) == gtokens
+    new_gtoken = db.add_new_game(player_tokens=[token])
+    assert db.get_game_timeline(token) == gtokens + [new_gtoken]
+
+
+class MultiplayerGame(GridGame):
+    MULTIPLAYER = True
+
+
+def test_clean_up_old_games(ex_db: GameDB):
+    token, other_token = ex_db.__players[:2]
+    ex_db.add_new_competition("Comp", _token="P00000000")
+    gtokens = [ex_db.add_new_game(player_tokens=[token, other_token]) for _ in range(3)]
+    orphan_gtoken = ex_db.add_new_game(player_tokens=[])
+    for gtoken in gtokens + [orphan_gtoken]:
+        ex_db.add_game_to_comp("P00000000", gtoken)
+    practice_gtoken = ex_db.add_new_game(player_tokens=[token])
+
+    runner = RollingMultiplayerCompRunner(1, ex_db, MultiplayerGame, None, rolling_n=2)
+    runner.clean_up_old_games()
+
+    assert set(ex_db.get_games_for_token("P00000000")) == set(gtokens[1:])
+    assert not ex_db.is_game_token(gtokens[0])
+    assert not ex_db.is_game_token(orphan_gtoken)
+    assert ex_db.get_game_timeline(token) == gtokens[1:] + [practice_gtoken]
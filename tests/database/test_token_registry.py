@@ -0,0 +1,72 @@
+import os
+
+import pytest
+
+from CYLGame.Database import GameDB, TokenRegistry
+
+from . import ex_db, temp_dir
+
+
+def test_new_tokens_are_registered(ex_db: GameDB):
+    for player in ex_db.__players:
+        assert ex_db.is_user_token(player)
+    gtoken = ex_db.add_new_game()
+    assert ex_db.is_game_token(gtoken)
+    ctoken = ex_db.add_new_competition("Comp")
+    assert ex_db.is_comp_token(ctoken)
+
+
+def test_tokens_added_by_other_process(temp_dir):
+    db = GameDB(temp_dir)
+    other_db = GameDB(temp_dir)
+    stoken = db.add_new_school("Test")
+    assert not other_db.is_user_token("ABCDEF12")
+
+    token = db.get_new_token(stoken)
+    gtoken = db.add_new_game(player_tokens=[token])
+    assert other_db.is_school_token(stoken)
+    assert other_db.is_user_token(token)
+    assert other_db.is_game_token(gtoken)
+    assert set(other_db.get_all_game_tokens()) == {gtoken}
+
+
+def test_tokens_removed_by_other_process(ex_db: GameDB):
+    other_db = GameDB(ex_db.root_dir)
+    ex_db.add_new_competition(_token="P00000000")
+    gtoken = ex_db.add_new_game(player_tokens=ex_db.__players)
+    assert other_db.is_game_token(gtoken)
+
+    ex_db.delete_game(gtoken)
+    assert not ex_db.is_game_token(gtoken)
+    assert not other_db.is_game_token(gtoken)
+    assert other_db.get_all_game_tokens() == []
+
+
+def test_registry_lists_directory_once(temp_dir, monkeypatch):
+    listings = []
+    listdir = os.listdir
+    monkeypatch.setattr(os, "listdir", lambda path: listings.append(path) or listdir(path))
+    os.mkdir(os.path.join(temp_dir, "A"))
+    os.utime(temp_dir, ns=(0, 0))
+    registry = TokenRegistry(temp_dir)
+
+    assert "A" in registry
+    for token in ["B", "C"]:
+        os.mkdir(os.path.join(temp_dir, token))
+        registry.add(token)
+    os.rmdir(os.path.join(temp_dir, "A"))
+    registry.discard("A")
+    for _ in range(10):
+        assert "B" in registry and "C" in registry and "A" not in registry
+    assert len(listings) == 1
+
+    # A change made by another process is seen by listing the directory again.
+    os.mkdir(os.path.join(temp_dir, "D"))
+    assert set(registry.tokens()) == {"B", "C", "D"}
+    assert len(listings) == 2
+
+
+@pytest.mark.parametrize("token", ["", ".", "..", "../data", "/", None, 12])
+def test_invalid_tokens(ex_db: GameDB, token):
+    assert not ex_db.is_user_token(token)
+    assert not ex_db.is_game_token(token)
@@ -0,0 +1,131 @@
+import pytest
+
+from CYLGame.Frame import ArrayGridFrameBuffer, DeltaFrames, GridFrameBuffer, expand_frames, frame_to_list
+from CYLGame.Sprite import SpriteSet
+
+numpy = pytest.importorskip("numpy")
+
+
+@pytest.mark.parametrize("buffer_class", [GridFrameBuffer, ArrayGridFrameBuffer])
+def test_fill_and_blit(buffer_class):
+    frame = buffer_class(4, 3, init_value=".")
+    frame.fill("#", x=1, y=1, width=2, height=2)
+    frame.blit_rect(0, 0, ["ab", "cd"])
+    frame.draw_text(1, 2, "xyz")
+    assert str(frame) == "ab..\ncd#.\n.xyz"
+
+
+@pytest.mark.parametrize("buffer_class", [GridFrameBuffer, ArrayGridFrameBuffer])
+def test_blit_out_of_bounds(buffer_class):
+    frame = buffer_class(2, 2)
+    with pytest.raises(IndexError):
+        frame.draw_text(1, 0, "ab")
+    with pytest.raises(IndexError):
+        frame.fill("a", x=-1)
+
+
+@pytest.mark.parametrize("buffer_class", [GridFrameBuffer, ArrayGridFrameBuffer])
+def test_blit_invalid_char(buffer_class):
+    sprite_set = SpriteSet(image_filepath=None, char_width=None, char_height=None, char_rows=10, char_columns=10)
+    frame = buffer_class(2, 2, charset=sprite_set)
+    with pytest.raises(ValueError):
+        frame.blit_rect(0, 0, [[1, 100]])
+    with pytest.raises(ValueError):
+        frame.fill(-1)
+
+
+def test_eq_and_diff_between_buffers():
+    frame1 = ArrayGridFrameBuffer.from_string_array(["ab", "cd"])
+    frame2 = GridFrameBuffer.from_string_array(["ab", "cd"])
+    assert frame1 == frame2
+    assert frame2 == frame1
+
+    frame2.set(1, 0, "x")
+    frame2.set(0, 1, "y")
+    assert frame1 != frame2
+    assert frame1.diff(frame2) == [(1, 0), (0, 1)]
+    assert frame2.diff(frame1) == [(1, 0), (0, 1)]
+    assert frame2.diff(GridFrameBuffer.from_string_array(["ab", "cd"])) == [(1, 0), (0, 1)]
+
+
+def test_dump_is_read_only_view():
+    frame = ArrayGridFrameBuffer(2, 1)
+    dump = frame.dump()
+    with pytest.raises(ValueError):
+        dump[0, 0] = 1
+    frame.set(1, 0, "a")
+    assert dump[0, 1] == ord("a")
+    assert frame.dump_bytes() == b"\x00\x00a\x00"
+
+
+def test_capture_is_a_copy():
+    frame = ArrayGridFrameBuffer(2, 1)
+    captured = frame.capture()
+    frame.set(0, 0, "a")
+    assert frame_to_list(captured) == [[0, 0]]
+
+
+def test_delta_frames_from_arrays():
+    frame = ArrayGridFrameBuffer(3, 2)
+    delta = DeltaFrames(keyframe_interval=2)
+    full_frames = []
+    for text in ["abc", "abd", "xbd"]:
+        frame.draw_text(0, 1, text)
+        delta.append(frame.capture())
+        full_frames += [frame_to_list(frame.capture())]
+    assert expand_frames(delta.dump()) == full_frames
+
+
+@pytest.mark.parametrize("buffer_class", [GridFrameBuffer, ArrayGridFrameBuffer])
+def test_dirty_cells(buffer_class):
+    frame = buffer_class(3, 2, init_value=".")
+    assert len(frame.get_dirty()) == 6
+    frame.clear_dirty()
+    assert frame.get_dirty() == []
+
+    frame.set(2, 1, "a")
+    frame.fill("b", x=0, y=0, width=2, height=1)
+    frame.set(1, 0, ".")
+    frame.draw_text(0, 1, "x")
+    frame.set(0, 1, ".")
+    assert frame.get_dirty() == [(0, 0), (2, 1)]
+    assert frame.pop_dirty_cells() == [(0, 0, ord("b")), (2, 1, ord("a"))]
+    assert frame.get_dirty() == []
+
+    frame.mark_all_dirty()
+    assert len(frame.pop_dirty_cells()) == 6
+
+
+@pytest.mark.parametrize("buffer_class", [GridFrameBuffer, ArrayGridFrameBuffer])
+def test_bulk_set(buffer_class):
+    frame = buffer_class(3, 3, init_value=".")
+    frame.set_row(0, 0, "abc")
+    frame.set_many([(0, 1, "x"), (2, 2, 121)])
+    frame.blit_map(1, 1, {(0, 0): "m", (1, 0): "n"})
+    assert str(frame) == "abc\nxmn\n..y"
+
+
+@pytest.mark.parametrize("buffer_class", [GridFrameBuffer, ArrayGridFrameBuffer])
+def test_row_versions(buffer_class):
+    frame = buffer_class(3, 3, init_value=".")
+    versions = [frame.get_row_version(y) for y in range(3)]
+    frame.set_row(0, 0, "...")
+    frame.fill(".", y=1)
+    assert [frame.get_row_version(y) for y in range(3)] == versions
+
+    frame.set_many([(0, 1, "x")])
+    frame.blit_rect(1, 2, ["y"])
+    assert [frame.get_row_version(y) != version for y, version in enumerate(versions)] == [False, True, True]
+
+
+@pytest.mark.parametrize("buffer_class", [GridFrameBuffer, ArrayGridFrameBuffer])
+def test_bulk_set_is_validated_first(buffer_class):
+    sprite_set = SpriteSet(image_filepath=None, char_width=None, char_height=None, char_rows=16, char_columns=16)
+    frame = buffer_class(2, 2, charset=sprite_set, init_value=".")
+    with pytest.raises(IndexError):
+        frame.set_many([(0, 0, "a"), (2, 0, "b")])
+    with pytest.raises(ValueError):
+        frame.set_many([(0, 0, "a"), (1, 0, 256)])
+    with pytest.raises(IndexError):
+        frame.set_row(1, 1, "ab")
+    assert str(frame) == "..\n.."
@@ -0,0 +1,62 @@
+import random
+
+import msgpack
+
+from CYLGame.Frame import DeltaFrames, expand_frames, is_delta_frames
+
+
+def random_frames(count, width=20, height=10, changes=3):
+    rand = random.Random(1)
+    frame = [[ord(" ")] * width for _ in range(height)]
+    frames = []
+    for _ in range(count):
+        for _ in range(changes):
+            frame[rand.randrange(height)][rand.randrange(width)] = rand.randrange(256)
+        frames += [[list(row) for row in frame]]
+    return frames
+
+
+def test_expand():
+    frames = random_frames(25)
+    delta = DeltaFrames(keyframe_interval=10)
+    for frame in frames:
+        delta.append(frame)
+    assert len(delta) == len(frames)
+
+    dump = delta.dump()
+    assert is_delta_frames(dump)
+    assert dump["frames"][10] == frames[10]
+    assert len(dump["frames"][11]) <= 3 * 2
+    assert expand_frames(dump) == frames
+
+
+def test_keyframe_every_frame():
+    frames = random_frames(5)
+    delta = DeltaFrames(keyframe_interval=1)
+    for frame in frames:
+        delta.append(frame)
+    assert delta.dump()["frames"] == frames
+    assert expand_frames(delta.dump()) == frames
+
+
+def test_append_copies_frame():
+    frame = [[1, 2], [3, 4]]
+    delta = DeltaFrames()
+    delta.append(frame)
+    frame[0][0] = 5
+    delta.append(frame)
+    assert expand_frames(delta.dump()) == [[[1, 2], [3, 4]], [[5, 2], [3, 4]]]
+
+
+def test_full_frames_are_not_changed():
+    frames = random_frames(3)
+    assert not is_delta_frames(frames)
+    assert expand_frames(frames) is frames
+
+
+def test_smaller():
+    frames = random_frames(500, width=80, height=25)
+    delta = DeltaFrames()
+    for frame in frames:
+        delta.append(frame)
+    assert len(msgpack.packb(delta.dump())) * 10 < len(msgpack.packb(frames))
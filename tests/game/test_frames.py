@@ -0,0 +1,148 @@
+from CYLGame import MapPanel
+from CYLGame.Frame import expand_frames, is_delta_frames
+from CYLGame.Game import GameRunner, GridGame, PlayGameState
+from CYLGame.Player import DefaultGridPlayer, Prog, Room
+from CYLGame.structures.const_mapping import ConstMapping
+
+
+class StayProg(Prog):
+    def __init__(self):
+        super().__init__(options={})
+
+    def run(self, state, max_op_count=-1, random=None):
+        return {}
+
+
+class CounterGame(GridGame):
+    SCREEN_WIDTH = 10
+    SCREEN_HEIGHT = 3
+
+    def __init__(self, random):
+        super().__init__(random)
+        self.turns = 0
+
+    def init_board(self):
+        pass
+
+    def create_new_player(self, prog):
+        return DefaultGridPlayer(prog, ConstMapping({}))
+
+    def start_game(self):
+        pass
+
+    def is_running(self):
+        return self.turns < 25
+
+    def do_turn(self):
+        self.turns += 1
+
+    def draw_screen(self, frame_buffer):
+        frame_buffer.fill(" ")
+        frame_buffer.draw_text(0, 1, "Turn {}".format(self.turns))
+
+    def get_score(self):
+        return self.turns
+
+
+def test_delta_frames_from_changes():
+    room = GameRunner(CounterGame).run(Room([StayProg()]), keyframe_interval=10)
+    assert is_delta_frames(room.screen_cap)
+
+    full_room = GameRunner(CounterGame).run(Room([StayProg()]), keyframe_interval=None)
+    assert expand_frames(room.screen_cap) == full_room.screen_cap
+    assert full_room.screen_cap[12][1] == list(map(ord, "Turn 12   "))
+    assert room.screen_cap["frames"][12] == [1 * 10 + 6, ord("2")]
+
+
+class FramedCounterGame(CounterGame):
+    """Decorates the frames drawn by `draw_screen` in `get_frame`."""
+
+    def get_frame(self):
+        frame = super().get_frame()
+        frame[0][self.turns % self.SCREEN_WIDTH] = ord("*")
+        return frame
+
+
+def test_delta_frames_from_overridden_get_frame():
+    room = GameRunner(FramedCounterGame).run(Room([StayProg()]), keyframe_interval=10)
+    full_room = GameRunner(FramedCounterGame).run(Room([StayProg()]), keyframe_interval=None)
+    assert expand_frames(room.screen_cap) == full_room.screen_cap
+    assert full_room.screen_cap[12][0][2] == ord("*")
+
+    runner = GameRunner(FramedCounterGame)
+    state = runner.move_game(runner.init_game(seed=1), "w")
+    assert state.changes is None
+    assert state.frame[0][1] == ord("*")
+
+
+def test_move_game_changes():
+    runner = GameRunner(CounterGame)
+    state = runner.init_game(seed=1)
+    state = runner.move_game(state, "w")
+    assert state.changes == [(5, 1, ord("1"))]
+    assert state.frame[1] == list(map(ord, "Turn 1    "))
+
+
+def test_move_game_without_drawing():
+    runner = GameRunner(CounterGame)
+    state = runner.init_game(seed=1)
+    for move in "wasd":
+        state = runner.move_game(state, move, draw=False)
+    assert state.frame is None and state.changes is None
+
+    state = runner.redraw_game(state)
+    assert state.frame[1] == list(map(ord, "Turn 4    "))
+    state = runner.move_game(state, "w")
+    assert state.changes == [(5, 1, ord("5"))]
+
+
+def test_snapshot_restore():
+    runner = GameRunner(CounterGame)
+    state = runner.move_game(runner.init_game(seed=1), "w")
+    snapshot = state.snapshot()
+    runner.move_game(state, "w")
+
+    restored = PlayGameState.restore(snapshot)
+    assert restored.moves == "w"
+    assert restored.frame[1] == list(map(ord, "Turn 1    "))
+    restored = runner.move_game(restored, "a")
+    assert restored.moves == "wa"
+    assert restored.changes == [(5, 1, ord("2"))]
+    assert state.frame == restored.frame
+
+
+class ScrollGame(CounterGame):
+    SCREEN_WIDTH = 6
+    SCREEN_HEIGHT = 3
+
+    def __init__(self, random):
+        super().__init__(random)
+        self.map = MapPanel(0, 0, 6, 3, default_char=".")
+
+    def init_board(self):
+        self.map.add("@", (0, 1))
+        self.map.add("#", (4, 0))
+
+    def do_turn(self):
+        super().do_turn()
+        self.map.shift_all((1, 0), wrap_x=True)
+
+    def draw_screen(self, frame_buffer):
+        self.map.redraw(frame_buffer)
+
+
+def test_snapshot_restore_map_game():
+    runner = GameRunner(ScrollGame)
+    state = runner.init_game(seed=1)
+    for move in "ww":
+        state = runner.move_game(state, move, draw=False)
+    restored = runner.redraw_game(PlayGameState.restore(state.snapshot()))
+    assert restored.frame[1] == list(map(ord, "..@..."))
+
+    state = runner.redraw_game(state)
+    for move in "wwww":
+        state = runner.move_game(state, move)
+        restored = runner.move_game(restored, move)
+        assert restored.changes == state.changes
+    assert restored.frame == state.frame
+    assert restored.moves == "wwwwww"
@@ -0,0 +1,88 @@
+import pytest
+
+from CYLGame.Game import Game, GameRunner
+from CYLGame.Player import DefaultGridPlayer, Prog, Room
+from CYLGame.structures.const_mapping import ConstMapping
+
+
+class RandomMoveProg(Prog):
+    def __init__(self, token=None, name=None, code_hash=None):
+        super().__init__(options={}, token=token, name=name, code_hash=code_hash)
+
+    def run(self, state, max_op_count=-1, random=None):
+        return {"move": ord(random.choice("wasd")), "turn": state.get("turn", 0) + 1}
+
+
+class ComputerProg(RandomMoveProg):
+    pass
+
+
+class CoinGame(Game):
+    MULTIPLAYER = True
+
+    def __init__(self, random):
+        super().__init__(random)
+        self.players = []
+        self.turns = 0
+        self.score = 0
+
+    @staticmethod
+    def default_prog_for_computer():
+        return ComputerProg
+
+    def init_board(self):
+        pass
+
+    def create_new_player(self, prog):
+        self.players += [DefaultGridPlayer(prog, ConstMapping({}))]
+        return self.players[-1]
+
+    def start_game(self):
+        pass
+
+    def is_running(self):
+        return self.turns < 10
+
+    def do_turn(self):
+        self.turns += 1
+        for player in self.players:
+            if player.move == "w":
+                self.score += self.random.randint(1, 10)
+
+    def get_frame(self):
+        return [[self.turns, self.score, self.random.randint(0, 255)]]
+
+    def get_score(self):
+        return self.score
+
+
+def load_prog(code_hash, token, name):
+    assert code_hash == "abc"
+    return RandomMoveProg(token=token, name=name, code_hash=code_hash)
+
+
+def test_replay():
+    runner = GameRunner(CoinGame)
+    room = runner.run(Room([RandomMoveProg("TOKEN", "Bot", "abc"), ComputerProg()]))
+    replay = runner.get_replay(room)
+    assert replay["bots"] == [{"code_hash": "abc", "token": "TOKEN", "name": "Bot"}, {"computer": True}]
+
+    replayed_room = runner.replay(replay, load_prog)
+    assert replayed_room.seed == room.seed
+    assert replayed_room.score == room.score
+    assert replayed_room.screen_cap == room.screen_cap
+    assert replayed_room.get_player_data() == room.get_player_data()
+
+
+def test_unsaved_bots_cant_be_replayed():
+    runner = GameRunner(CoinGame)
+    room = Room([RandomMoveProg("TOKEN", "Bot", code_hash="N/A")])
+    assert runner.get_replay(room) is None
+
+
+def test_replay_of_other_version():
+    runner = GameRunner(CoinGame)
+    replay = runner.get_replay(Room([ComputerProg()]))
+    replay["version"] = CoinGame.VERSION + 1
+    with pytest.raises(ValueError):
+        runner.replay(replay, load_prog)
@@ -0,0 +1,95 @@
+import pickle
+
+import pytest
+from littlepython import Compiler
+
+from CYLGame.Game import GameRunner, GridGame
+from CYLGame.Player import DefaultGridPlayer, LittlePythonProg, Prog, Room
+from CYLGame.Scoring import ScorePool, ScoringError
+from CYLGame.structures.const_mapping import ConstMapping
+
+
+class StayProg(Prog):
+    def __init__(self, score=None):
+        super().__init__(options={})
+        self.score = score
+
+    def run(self, state, max_op_count=-1, random=None):
+        return {}
+
+
+class CrashProg(StayProg):
+    def run(self, state, max_op_count=-1, random=None):
+        raise ValueError("crash")
+
+
+class ScoreGame(GridGame):
+    """Scores the fixed score of its bot, or a random score."""
+
+    def __init__(self, random):
+        super().__init__(random)
+        self.turns = 0
+        self.player = None
+
+    def init_board(self):
+        pass
+
+    def create_new_player(self, prog):
+        self.player = DefaultGridPlayer(prog, ConstMapping({}))
+        return self.player
+
+    def start_game(self):
+        pass
+
+    def is_running(self):
+        return self.turns < 3
+
+    def do_turn(self):
+        self.turns += 1
+
+    def draw_screen(self, frame_buffer):
+        pass
+
+    def get_vars(self, player):
+        return {}
+
+    def get_score(self):
+        if self.player.prog.score is not None:
+            return self.player.prog.score
+        return self.random.randint(0, 100)
+
+
+@pytest.fixture(scope="module")
+def pool():
+    with ScorePool(processes=2) as pool:
+        yield pool
+
+
+def test_scores(pool):
+    scores = pool.scores(ScoreGame, Room([StayProg(7)]), 20)
+    assert scores == [7] * 20
+    assert GameRunner(ScoreGame).run_for_avg_score(Room([StayProg(7)]), times=5, pool=pool) == 7
+
+
+def test_random_scores(pool):
+    scores = pool.scores(ScoreGame, Room([StayProg()]), 30)
+    assert len(scores) == 30
+    assert len(set(scores)) > 1
+
+
+def test_tolerance(pool):
+    assert len(pool.scores(ScoreGame, Room([StayProg(7)]), 1000, tolerance=0.5, min_games=10)) < 1000
+    assert len(pool.scores(ScoreGame, Room([StayProg()]), 40, tolerance=0.01)) == 40
+
+
+def test_error(pool):
+    with pytest.raises(ScoringError, match="crash"):
+        pool.scores(ScoreGame, Room([CrashProg()]), 10)
+    assert pool.scores(ScoreGame, Room([StayProg(3)]), 4) == [3] * 4
+
+
+def test_pickle_little_python_prog():
+    prog = LittlePythonProg(Compiler().compile("move = 5"), options={"debug": True}, name="bot")
+    copy = pickle.loads(pickle.dumps(prog))
+    assert copy.name == "bot" and copy.options == {"debug": True}
+    assert copy.run({}) == prog.run({}) == {"move": 5}
@@ -0,0 +1,65 @@
+import time
+
+import pytest
+
+from CYLGame.Jobs import JobQueue, JobQueueFull, JobRateLimited, JobStatus
+
+
+def add(a, b):
+    return a + b
+
+
+def nap(seconds):
+    time.sleep(seconds)
+    return seconds
+
+
+def fail():
+    raise ValueError("bad bot")
+
+
+@pytest.fixture
+def queue():
+    queue = JobQueue(processes=1, max_pending=2, rate_limit=3, rate_period=60)
+    yield queue
+    queue.shutdown()
+
+
+def test_result(queue):
+    job_id = queue.submit("a", add, 1, 2)
+    assert queue.wait(job_id, 10) == {"status": JobStatus.DONE, "result": 3}
+    assert queue.status(job_id) == {"status": JobStatus.DONE, "result": 3}
+    assert len(queue) == 0
+
+
+def test_unknown_job(queue):
+    assert queue.status("nope") is None
+    assert queue.wait("nope", 1) is None
+
+
+def test_failed(queue):
+    job_id = queue.submit("a", fail)
+    assert queue.wait(job_id, 10) == {"status": JobStatus.FAILED, "error": "bad bot"}
+
+
+def test_wait_timeout(queue):
+    job_id = queue.submit("a", nap, 1)
+    assert queue.wait(job_id, 0.1)["status"] in (JobStatus.QUEUED, JobStatus.RUNNING)
+    assert queue.wait(job_id, 10)["result"] == 1
+
+
+def test_queue_full(queue):
+    queue.submit("a", nap, 0.5)
+    job_id = queue.submit("b", nap, 0.5)
+    with pytest.raises(JobQueueFull):
+        queue.submit("c", add, 1, 2)
+    queue.wait(job_id, 10)
+    queue.submit("c", add, 1, 2)
+
+
+def test_rate_limit(queue):
+    for _ in range(3):
+        queue.wait(queue.submit("a", add, 1, 2), 10)
+    with pytest.raises(JobRateLimited):
+        queue.submit("a", add, 1, 2)
+    queue.submit("b", add, 1, 2)
@@ -0,0 +1,170 @@
+import random
+
+import pytest
+
+from CYLGame import DenseMap, DenseMapPanel, Map, MapPanel
+from CYLGame.Frame import GridFrameBuffer
+from CYLGame.structures.spatial_index import Metric, SpatialIndex
+
+
+def brute_force_nearest(index, positions, pos, metric, wrap):
+    dists = [(index.distance(index.offset(pos, p, wrap, wrap), metric), p[1], p[0]) for p in positions]
+    return [(x, y) for _, y, x in sorted(dists)]
+
+
+@pytest.mark.parametrize("metric", [Metric.MANHATTAN, Metric.CHEBYSHEV])
+@pytest.mark.parametrize("wrap", [False, True])
+def test_spatial_index_matches_brute_force(metric, wrap):
+    rand = random.Random(4)
+    positions = {(rand.randrange(37), rand.randrange(21)) for _ in range(40)}
+    index = SpatialIndex(37, 21, bucket_size=4, positions=positions)
+    for _ in range(50):
+        pos = (rand.randrange(37), rand.randrange(21))
+        expected = brute_force_nearest(index, positions, pos, metric, wrap)
+        assert index.nearest(pos, metric, wrap, wrap) == expected[0]
+        assert index.k_nearest(pos, 5, metric, wrap, wrap) == expected[:5]
+        within = [p for p in expected if index.distance(index.offset(pos, p, wrap, wrap), metric) <= 6]
+        assert index.within(pos, 6, metric, wrap, wrap) == within
+
+
+def test_dist_to_foo():
+    m = Map(10, 10)
+    assert m.get_x_y_dist_to_foo((0, 0), "a") is None
+    m.add("a", (5, 5))
+    m.add("a", (9, 0))
+    assert m.get_x_y_dist_to_foo((0, 0), "a") == (9, 0)
+    assert m.get_x_y_dist_to_foo((0, 0), "a", wrapping=True) == (-1, 0)
+    assert m.get_x_y_dist_to_foo((1, 4), "a", diagonal_moving=True) == (4, 1)
+
+
+def test_index_follows_changes():
+    m = Map(10, 10)
+    m.add("a", (1, 1))
+    assert m.nearest((0, 0), "a") == (1, 1)
+    m.add("b", (1, 1))
+    m.add("a", (3, 3))
+    assert m.k_nearest((0, 0), "a", 2) == [(3, 3)]
+    m.rm_char((3, 3))
+    assert m.nearest((0, 0), "a") is None
+    m.add("a", (3, 3))
+    m.shift_all((1, 0))
+    assert m.within((0, 0), "a", 7) == [(4, 3)]
+
+
+def test_read_views_dont_change_map():
+    m = Map(5, 5)
+    m.add("a", (1, 1))
+    assert m.get_char_at((2, 2)) == " "
+    assert m.get_all_pos("b") == frozenset()
+    assert (2, 2) not in m.p_to_char
+    assert "b" not in m.char_to_ps
+
+    view = m.get_all_pos("a")
+    assert view == {(1, 1)}
+    assert m.get_all_pos("a") is view
+    assert m.count("a") == 1
+    assert list(m.iter_pos("a")) == [(1, 1)]
+
+    m.add("a", (2, 2))
+    assert view == {(1, 1)}
+    assert m.get_all_pos("a") == {(1, 1), (2, 2)}
+    m.add("b", (1, 1))
+    assert m.get_all_pos("a") == {(2, 2)}
+    assert m.count("a") == 1
+
+
+@pytest.mark.parametrize("offset", [(1, 0), (-2, 1), (0, -1), (3, 3), (-7, 0)])
+@pytest.mark.parametrize("wrap", [False, True])
+def test_shift_by_origin(offset, wrap):
+    rand = random.Random(2)
+    maps = [Map(6, 5), Map(6, 5, scroll_by_origin=True)]
+    for _ in range(3):
+        cells = [(rand.choice("abc"), (rand.randrange(6), rand.randrange(5))) for _ in range(8)]
+        for m in maps:
+            for char, pos in cells:
+                m.add(char, pos)
+            m.shift_all(offset, wrap_x=wrap, wrap_y=wrap)
+            m.add("d", (0, 0))
+        expected, scrolled = maps
+        assert [[scrolled[(x, y)] for x in range(6)] for y in range(5)] == [
+            [expected[(x, y)] for x in range(6)] for y in range(5)
+        ]
+        assert scrolled.get_all_pos("a") == expected.get_all_pos("a")
+        assert sorted(scrolled.iter_pos("b")) == sorted(expected.iter_pos("b"))
+        assert scrolled.nearest((2, 2), "c") == expected.nearest((2, 2), "c")
+
+
+def test_shift_by_origin_diff():
+    panel = MapPanel(0, 0, 4, 1, scroll_by_origin=True)
+    frame = GridFrameBuffer(4, 1, init_value=" ")
+    panel.add("a", (0, 0))
+    panel.add("b", (2, 0))
+    panel.redraw(frame)
+    assert str(frame) == "a b "
+
+    panel.shift_all((1, 0))
+    panel.redraw(frame)
+    assert str(frame) == " a b"
+
+    panel.shift_all((1, 0))
+    panel.add("b", (3, 0))
+    panel.redraw(frame)
+    assert str(frame) == "  ab"
+
+    panel.shift_all((1, 0))
+    panel.add("c", (0, 0))
+    panel.redraw(frame)
+    assert str(frame) == "c  a"
+    assert panel.get_all_pos("a") == {(3, 0)}
+
+
+def test_shift_by_origin_diff_only_has_changed_cells():
+    m = Map(4, 1, scroll_by_origin=True)
+    m.add("a", (0, 0))
+    m.add("b", (1, 0))
+    m.add("b", (2, 0))
+    m.get_diff()
+    m.shift_all((1, 0))
+    assert m.get_diff() == {(0, 0): " ", (1, 0): "a", (3, 0): "b"}
+    assert m.get_diff() == {}
+
+
+@pytest.mark.parametrize("wrap", [False, True])
+def test_dense_map_matches_map(wrap):
+    rand = random.Random(3)
+    maps = [Map(7, 4), DenseMap(7, 4)]
+    for _ in range(5):
+        ops = [(rand.choice("ab "), (rand.randrange(7), rand.randrange(4))) for _ in range(6)]
+        removed = (rand.randrange(7), rand.randrange(4))
+        offset = (rand.randrange(-3, 4), rand.randrange(-2, 3))
+        for m in maps:
+            for char, pos in ops:
+                if char == " ":
+                    m.rm_char(pos)
+                else:
+                    m.add(char, pos)
+            m.rm_char(removed)
+            m.shift_all(offset, wrap_x=wrap, wrap_y=wrap)
+        expected, dense = maps
+        assert [[dense[(x, y)] for x in range(7)] for y in range(4)] == [
+            [expected[(x, y)] for x in range(7)] for y in range(4)
+        ]
+        for char in "ab":
+            assert dense.get_all_pos(char) == expected.get_all_pos(char)
+            assert dense.count(char) == expected.count(char)
+            assert dense.nearest((3, 2), char) == expected.nearest((3, 2), char)
+        diff = dense.get_diff()
+        assert all(expected[pos] == char for pos, char in diff.items())
+
+
+def test_dense_map_panel():
+    panel = DenseMapPanel(1, 1, 2, 2)
+    frame = GridFrameBuffer(4, 4, init_value=".")
+    panel.add("a", (0, 0))
+    panel.add("b", (1, 1))
+    panel.redraw(frame)
+    assert str(frame) == "....\n.a .\n. b.\n...."
+
+    panel.shift_all((1, 0))
+    panel.redraw(frame)
+    assert str(frame) == "....\n. a.\n.  .\n...."
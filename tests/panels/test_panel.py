@@ -1,7 +1,8 @@
 import pytest
 
-from CYLGame import Panel, PanelBorder
+from CYLGame import MessagePanel, Panel, PanelBorder, PanelPadding, StatusPanel
 from CYLGame.Frame import GridFrameBuffer
+from CYLGame.Sprite import Char
 
 
 def test_edges():
@@ -13,8 +14,116 @@ def test_edges():
     assert frame == exp_frame
 
 
+def test_char_and_int_borders():
+    border = PanelBorder(PanelBorder.TOP, char=Char.from_str("-")) | PanelBorder(PanelBorder.BOTTOM, char=ord("="))
+    panel = Panel(1, 1, 2, 1, border=border)
+    frame = GridFrameBuffer(4, 3, init_value=" ")
+    panel.redraw(frame)
+    assert frame == GridFrameBuffer.from_string_array([" -- ", "    ", " == "])
+
+    with pytest.raises(ValueError):
+        Panel(1, 1, 2, 1, border=PanelBorder(PanelBorder.TOP, char="--")).redraw(frame)
+
+
 def test_edges_2():
     panel = Panel(0, 0, 1, 1, border=PanelBorder.create("2", "7", "5", "4", "3", "1", "8", "6"))
     frame = GridFrameBuffer(5, 5, init_value=" ")
     with pytest.raises(IndexError):
         panel.redraw(frame)
+
+
+def test_message_panel():
+    panel = MessagePanel(0, 0, 4, 2, padding=PanelPadding())
+    frame = GridFrameBuffer(4, 2, init_value="#")
+    panel.add(["Hello", "Hi"])
+    panel.redraw(frame)
+    assert frame == GridFrameBuffer.from_string_array(["Hell", "Hi  "])
+
+    panel.add("A")
+    panel.redraw(frame)
+    assert frame == GridFrameBuffer.from_string_array(["Hi  ", "A   "])
+
+
+class CountingFrameBuffer(GridFrameBuffer):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.rows_set = []
+
+    def set_row(self, x, y, chars):
+        self.rows_set += [y]
+        super().set_row(x, y, chars)
+
+
+def test_message_panel_only_redraws_changed_rows():
+    panel = MessagePanel(0, 0, 4, 3, padding=PanelPadding())
+    frame = CountingFrameBuffer(4, 3)
+    panel.add("A")
+    panel.redraw(frame)
+    assert frame.rows_set == [0, 1, 2]
+
+    frame.rows_set = []
+    panel.redraw(frame)
+    assert frame.rows_set == []
+
+    panel.add("B")
+    panel.redraw(frame)
+    assert frame.rows_set == [1]
+
+    frame.rows_set = []
+    panel.add(["C", "D"])
+    panel.redraw(frame)
+    assert frame.rows_set == [0, 1, 2]
+    assert frame == GridFrameBuffer.from_string_array(["B   ", "C   ", "D   "])
+
+
+def test_message_panel_redraws_rows_drawn_over():
+    panel = MessagePanel(1, 1, 4, 2, border=PanelBorder.create(*"--||++++"), padding=PanelPadding())
+    frame = CountingFrameBuffer(6, 4)
+    panel.add(["A", "B"])
+    panel.redraw(frame)
+    expected = GridFrameBuffer.from_string_array(["+----+", "|A   |", "|B   |", "+----+"])
+    assert frame == expected
+
+    frame.fill(" ")
+    frame.rows_set = []
+    panel.redraw(frame)
+    assert frame == expected
+    assert 1 in frame.rows_set and 2 in frame.rows_set
+
+
+def test_status_panel_only_redraws_changed_rows():
+    panel = StatusPanel(0, 0, 6, 2, padding=PanelPadding())
+    frame = CountingFrameBuffer(6, 2)
+    panel["a"] = 1
+    panel["b"] = 2
+    panel.redraw(frame)
+    frame.rows_set = []
+
+    panel["a"] = 1
+    panel["b"] = 3
+    panel.redraw(frame)
+    assert frame.rows_set == [1]
+    assert frame == GridFrameBuffer.from_string_array(["a: 1  ", "b: 3  "])
+
+
+def test_message_panel_skips_rows_drawn_over_elsewhere():
+    panel = MessagePanel(0, 0, 4, 2, border=PanelBorder.create(bottom="-"), padding=PanelPadding())
+    frame = CountingFrameBuffer(4, 4)
+    panel.add(["A", "B"])
+    panel.redraw(frame)
+    frame.rows_set = []
+
+    frame.draw_text(0, 3, "map")
+    panel.redraw(frame)
+    assert frame.rows_set == []
+
+
+def test_status_panel_info_changed_directly():
+    panel = StatusPanel(0, 0, 6, 1, padding=PanelPadding())
+    frame = GridFrameBuffer(6, 1)
+    panel["a"] = 1
+    panel.redraw(frame)
+
+    panel.info["a"] = "2"
+    panel.redraw(frame)
+    assert frame == GridFrameBuffer.from_string_array(["a: 2  "])
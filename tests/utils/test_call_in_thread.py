@@ -0,0 +1,23 @@
+import time
+
+import gevent
+
+from CYLGame.Utils import call_in_thread
+
+
+def test_other_greenlets_run():
+    ticks = []
+
+    def tick():
+        for _ in range(5):
+            ticks.append(None)
+            gevent.sleep(0.01)
+
+    greenlet = gevent.spawn(tick)
+    call_in_thread(time.sleep, 0.2)
+    assert len(ticks) == 5
+    greenlet.join()
+
+
+def test_result():
+    assert call_in_thread(max, 1, 3, 2) == 3